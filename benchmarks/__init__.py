@@ -0,0 +1,3 @@
+"""Offline benchmarks for cmdr. Every benchmark is a module which can be run
+with ``python -m benchmarks.<name>`` from the repository root, and which
+writes machine-readable (json) results."""
@@ -0,0 +1,273 @@
+"""Times the directory search, check, report and tether end to end on a
+synthetic campaign tree (see benchmarks.synthetic_tree), and saves the
+results as json, so that they can be compared across commits.
+
+Every benchmark is run --repeat times, and the minimum and all wall times are
+reported. Benchmarks of the persistent index and the result cache are run as
+a cold (first) and warm (second) pass. The report is run serially and on a
+pool of --workers workers.
+
+Example::
+
+    python -m benchmarks.campaign --dirs 10000 --output before.json
+    git checkout my-optimization
+    python -m benchmarks.campaign --dirs 10000 --output after.json \\
+        --compare before.json
+"""
+
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime
+import io
+import json
+import logging
+import os
+from pathlib import Path
+import platform
+import shutil
+import sys
+import tempfile
+from time import perf_counter
+
+from benchmarks.synthetic_tree import SUBMIT_SCRIPT, VASP_BANNER, generate_tree
+from cmdr.check import check
+from cmdr.file_utils import exhaustive_directory_search, run_command
+from cmdr.report import generate_report
+from cmdr.tether import tether_constructor
+
+
+def _time(function, repeat, setup=None):
+    """Runs function repeat times (after setup, if provided, which is not
+    timed) and returns the wall times in seconds. Output is suppressed."""
+
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with redirect_stdout(io.StringIO()):
+            t0 = perf_counter()
+            function()
+            times.append(perf_counter() - t0)
+    return times
+
+
+def _remove(*paths):
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+
+
+def run(root, scratch, repeat=3, workers=None, benchmarks=None):
+    """Runs the benchmarks on an existing tree.
+
+    Parameters
+    ----------
+    root : os.PathLike
+        The campaign tree.
+    scratch : os.PathLike
+        Directory for the index, cache, reports and tether outputs.
+    repeat : int, optional
+    workers : int, optional
+        The number of workers of the parallel report. Default is the number of
+        CPUs.
+    benchmarks : list of str, optional
+        The names of the benchmarks to run. Default is all of them.
+
+    Returns
+    -------
+    dict
+        Maps the name of every benchmark to its minimum and all wall times.
+    """
+
+    scratch = Path(scratch)
+    index = scratch / "index.sqlite"
+    cache = scratch / "cache.sqlite"
+    tether = scratch / "tether"
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    def _search():
+        exhaustive_directory_search(root, SUBMIT_SCRIPT)
+
+    def _search_index():
+        exhaustive_directory_search(
+            root, SUBMIT_SCRIPT, use_index=True, index_path=index
+        )
+
+    def _check(use_cache=False):
+        return lambda: check(
+            root,
+            SUBMIT_SCRIPT,
+            "OUTCAR",
+            VASP_BANNER,
+            scratch / "check.json",
+            use_cache=use_cache,
+            cache_path=cache,
+        )
+
+    def _report(workers=1, use_cache=False):
+        return lambda: generate_report(
+            root,
+            SUBMIT_SCRIPT,
+            workers=workers,
+            use_cache=use_cache,
+            cache_path=cache,
+        )
+
+    def _tether(**kwargs):
+        return lambda: tether_constructor(
+            root,
+            SUBMIT_SCRIPT,
+            tether,
+            calculations_per_staged_job=36,
+            slurm_header_lines={"time": "1:00:00"},
+            executable_lines=["echo test"],
+            **kwargs,
+        )
+
+    def _cold_then_warm(name, function, state):
+        """Times a cold run (after removing state) and a warm run."""
+
+        def _setup():
+            _remove(state)
+
+        results[f"{name}_cold"] = _time(function, repeat, setup=_setup)
+        results[f"{name}_warm"] = _time(function, repeat)
+
+    suite = {
+        "search": lambda: _time(_search, repeat),
+        "search_index": lambda: _cold_then_warm(
+            "search_index", _search_index, index
+        ),
+        "check": lambda: _time(_check(), repeat),
+        "check_cache": lambda: _cold_then_warm(
+            "check_cache", _check(use_cache=True), cache
+        ),
+        "report": lambda: _time(_report(), repeat),
+        "report_parallel": lambda: _time(_report(workers=workers), repeat),
+        "report_cache": lambda: _cold_then_warm(
+            "report_cache", _report(workers=workers, use_cache=True), cache
+        ),
+        "tether": lambda: _time(
+            _tether(), repeat, setup=lambda: _remove(tether)
+        ),
+        "tether_packed": lambda: _time(
+            _tether(size_file="OUTCAR"), repeat, setup=lambda: _remove(tether)
+        ),
+    }
+    if benchmarks is None:
+        benchmarks = list(suite)
+
+    results = dict()
+    for name in benchmarks:
+        print(f"Running {name}", file=sys.stderr)
+        times = suite[name]()
+        if times is not None:
+            results[name] = times
+    return {
+        name: {"min": min(times), "times": times}
+        for name, times in results.items()
+    }
+
+
+def metadata():
+    """The commit, machine and time of a benchmark run."""
+
+    commit = run_command("git rev-parse HEAD")
+    dirty = run_command("git status --porcelain --untracked-files=no")
+    return {
+        "commit": commit["stdout"] if commit["exitcode"] == 0 else None,
+        "dirty": bool(dirty["stdout"]) if dirty["exitcode"] == 0 else None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def compare(results, baseline):
+    """Prints the speedup of every benchmark relative to a baseline."""
+
+    print(f"{'benchmark':<22}{'baseline':>12}{'current':>12}{'speedup':>10}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["min"]
+        after = result["min"]
+        speedup = before / after if after > 0 else float("inf")
+        print(f"{name:<22}{before:>12.4f}{after:>12.4f}{speedup:>9.2f}x")
+
+
+def main(argv=sys.argv[1:]):
+    ap = argparse.ArgumentParser(
+        prog="python -m benchmarks.campaign",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    ap.add_argument(
+        "--root",
+        default=None,
+        help="Existing campaign tree to benchmark on. If not provided, a "
+        "synthetic tree is generated in a temporary directory",
+    )
+    ap.add_argument("--dirs", dest="n_dirs", type=int, default=1000)
+    ap.add_argument("--depth", type=int, default=3)
+    ap.add_argument("--vasp-fraction", type=float, default=0.5)
+    ap.add_argument("--completion-rate", type=float, default=0.8)
+    ap.add_argument("--error-rate", type=float, default=0.1)
+    ap.add_argument("--outcar-size", type=int, default=100000)
+    ap.add_argument("--feff-size", type=int, default=20000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument(
+        "--benchmark",
+        dest="benchmarks",
+        action="append",
+        default=None,
+        help="Benchmark to run (can be repeated, defaults to all)",
+    )
+    ap.add_argument("--output", default=None, help="Results json file")
+    ap.add_argument(
+        "--compare", default=None, help="Results json file of a baseline"
+    )
+    args = vars(ap.parse_args(argv))
+    root = args.pop("root")
+    output = args.pop("output")
+    baseline = args.pop("compare")
+    run_kwargs = {
+        key: args.pop(key) for key in ["repeat", "workers", "benchmarks"]
+    }
+
+    # The report warns about every unfinished calculation
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        if root is None:
+            root = Path(scratch) / "campaign"
+            print(f"Generating {args['n_dirs']} directories", file=sys.stderr)
+            t0 = perf_counter()
+            tree = generate_tree(root, **args)
+            tree["generation_time"] = perf_counter() - t0
+        else:
+            manifest = Path(root) / "synthetic_tree.json"
+            tree = None
+            if manifest.exists():
+                with open(manifest, "r") as f:
+                    tree = json.load(f)
+        results = run(root, scratch, **run_kwargs)
+
+    result = {"metadata": metadata(), "tree": tree, "results": results}
+    print(json.dumps(results, indent=4))
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=4)
+    if baseline is not None:
+        with open(baseline, "r") as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
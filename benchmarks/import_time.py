@@ -0,0 +1,147 @@
+"""Measures the start-up time of the command line interface, which matters
+when it is called from the crontab every minute or on login nodes with slow
+site-packages.
+
+Every measurement runs a fresh interpreter --repeat times and reports the
+minimum and all wall times: the bare interpreter, importing cmdr.entrypoint,
+cmdr --help, and importing the module of every subcommand. The slowest
+imports of cmdr.entrypoint are listed from python -X importtime.
+
+With --check, the script also verifies that importing cmdr.entrypoint loads
+none of the heavy modules (those of the subcommands and their dependencies),
+and exits with a non-zero status if it does, so that it can be used as an
+import-time regression test.
+
+Example::
+
+    python -m benchmarks.import_time --output before.json
+    python -m benchmarks.import_time --check
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from time import perf_counter
+
+
+# Modules which must only be imported once a subcommand is dispatched
+LAZY_MODULES = [
+    "numpy",
+    "rich",
+    "cmdr.check",
+    "cmdr.report",
+    "cmdr.tether",
+    "cmdr.wrangler",
+    "cmdr.slurm",
+    "cmdr.records",
+    "cmdr.matcher",
+    "cmdr.file_utils",
+]
+
+SNIPPETS = {
+    "python": "pass",
+    "import_entrypoint": "import cmdr.entrypoint",
+    "help": "from cmdr.entrypoint import global_parser\n"
+    "try:\n"
+    "    global_parser(['--help'])\n"
+    "except SystemExit:\n"
+    "    pass",
+    "import_check": "import cmdr.check",
+    "import_report": "import cmdr.report",
+    "import_tether": "import cmdr.tether",
+    "import_wrangler": "import cmdr.wrangler, cmdr.slurm",
+}
+
+
+def _time_snippet(snippet, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", snippet],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        times.append(perf_counter() - t0)
+    return times
+
+
+def slowest_imports(module="cmdr.entrypoint", n=10):
+    """The n imports with the largest cumulative time (in seconds) reported
+    by python -X importtime when importing module."""
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    imports = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        imports.append((name.strip(), int(cumulative) * 1e-6))
+    return sorted(imports, key=lambda xx: -xx[1])[:n]
+
+
+def loaded_lazy_modules(module="cmdr.entrypoint"):
+    """The modules of LAZY_MODULES which are loaded by importing module."""
+
+    snippet = (
+        f"import sys, json, {module}\n"
+        f"print(json.dumps(sorted(sys.modules)))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", snippet],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    loaded = set(json.loads(proc.stdout))
+    return [name for name in LAZY_MODULES if name in loaded]
+
+
+def main(argv=sys.argv[1:]):
+    ap = argparse.ArgumentParser(
+        prog="python -m benchmarks.import_time",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    ap.add_argument("--repeat", type=int, default=10)
+    ap.add_argument("--output", default=None, help="Results json file")
+    ap.add_argument(
+        "--check",
+        default=False,
+        action="store_true",
+        help="Exit with a non-zero status if importing cmdr.entrypoint loads "
+        "any of the modules which should be imported lazily",
+    )
+    args = ap.parse_args(argv)
+
+    results = dict()
+    for name, snippet in SNIPPETS.items():
+        print(f"Running {name}", file=sys.stderr)
+        times = _time_snippet(snippet, args.repeat)
+        results[name] = {"min": min(times), "times": times}
+    result = {
+        "results": results,
+        "slowest_imports": slowest_imports(),
+        "loaded_lazy_modules": loaded_lazy_modules(),
+    }
+    print(json.dumps(result, indent=4))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=4)
+
+    if args.check and result["loaded_lazy_modules"]:
+        print(
+            "Importing cmdr.entrypoint loads "
+            f"{', '.join(result['loaded_lazy_modules'])}",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
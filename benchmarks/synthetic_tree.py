@@ -0,0 +1,173 @@
+"""Generates synthetic campaign trees, which mimic the layout of real VASP and
+FEFF campaigns, for benchmarking the directory search, check, report and
+tether.
+
+Every calculation directory is a leaf of a tree of the given depth, and
+contains the submit script, the input files of its calculation type, and its
+output files. Calculations finish successfully with the given completion
+rate; unfinished ones have truncated output, and a fraction of them contains
+an error banner. The generation is deterministic given the seed.
+
+Example::
+
+    python -m benchmarks.synthetic_tree /tmp/campaign --dirs 100000 \\
+        --depth 3 --outcar-size 200000
+"""
+
+import argparse
+import json
+from math import ceil
+import os
+from pathlib import Path
+import random
+import sys
+
+
+SUBMIT_SCRIPT = "submit.sbatch"
+MANIFEST = "synthetic_tree.json"
+
+VASP_BANNER = " General timing and accounting informations for this job:"
+VASP_ERROR = " VERY BAD NEWS! internal error in subroutine"
+FEFF_BANNER = "feff ends at"
+
+
+def _filler(size, rng):
+    """Lines of OUTCAR-like filler of roughly the given size in bytes."""
+
+    line = " " + " ".join(f"{rng.random():10.6f}" for _ in range(6)) + "\n"
+    return (line * (size // len(line) + 1))[:size].encode()
+
+
+def _tree_path(index, n_dirs, depth):
+    """The relative path of the index-th calculation directory, such that the
+    directories are spread evenly over depth levels."""
+
+    fanout = max(2, ceil(n_dirs ** (1.0 / depth)))
+    parts = []
+    for _ in range(depth):
+        parts.append(index % fanout)
+        index //= fanout
+    return os.path.join(*[f"d{part:04d}" for part in reversed(parts)])
+
+
+def generate_tree(
+    root,
+    n_dirs=1000,
+    depth=3,
+    vasp_fraction=0.5,
+    completion_rate=0.8,
+    error_rate=0.1,
+    outcar_size=100000,
+    feff_size=20000,
+    seed=0,
+):
+    """Writes a synthetic campaign tree.
+
+    Parameters
+    ----------
+    root : os.PathLike
+        The root of the tree. Must not exist yet.
+    n_dirs : int, optional
+        The number of calculation directories.
+    depth : int, optional
+        The depth of the calculation directories below root.
+    vasp_fraction : float, optional
+        The fraction of VASP calculations; the others are FEFF calculations.
+    completion_rate : float, optional
+        The fraction of calculations which finished successfully.
+    error_rate : float, optional
+        The fraction of unfinished calculations whose output contains an error
+        banner.
+    outcar_size : int, optional
+        The approximate size in bytes of every OUTCAR.
+    feff_size : int, optional
+        The approximate size in bytes of every feff.out.
+    seed : int, optional
+
+    Returns
+    -------
+    dict
+        The parameters of the tree and the number of calculations of every
+        type and status, which is also saved to synthetic_tree.json in root.
+    """
+
+    root = Path(root)
+    root.mkdir(parents=True)
+    rng = random.Random(seed)
+    outcar = _filler(outcar_size, rng)
+    feff_out = _filler(feff_size, rng)
+    counts = {
+        ctype: {"success": 0, "fail": 0, "error": 0}
+        for ctype in ["VASP", "FEFF"]
+    }
+
+    for index in range(n_dirs):
+        directory = root / _tree_path(index, n_dirs, depth)
+        directory.mkdir(parents=True)
+        (directory / SUBMIT_SCRIPT).write_text("#!/bin/bash\necho test\n")
+        ctype = "VASP" if rng.random() < vasp_fraction else "FEFF"
+        if rng.random() < completion_rate:
+            status = "success"
+        elif rng.random() < error_rate:
+            status = "error"
+        else:
+            status = "fail"
+        counts[ctype][status] += 1
+
+        # Unfinished calculations stopped somewhere along their output
+        fraction = 1.0 if status == "success" else rng.random()
+        if ctype == "VASP":
+            for filename in ["INCAR", "POSCAR", "KPOINTS", "POTCAR"]:
+                (directory / filename).write_text(f"{filename}\n")
+            with open(directory / "OUTCAR", "wb") as f:
+                f.write(outcar[: int(len(outcar) * fraction)])
+                if status == "error":
+                    f.write(f"{VASP_ERROR}\n".encode())
+                if status == "success":
+                    f.write(f"{VASP_BANNER}\n".encode())
+                    f.write(outcar[:2000])
+        else:
+            (directory / "feff.inp").write_text("TITLE synthetic\n")
+            with open(directory / "feff.out", "wb") as f:
+                f.write(feff_out[: int(len(feff_out) * fraction)])
+                if status == "success":
+                    f.write(f"{FEFF_BANNER} 12:00:00\n".encode())
+            if status == "success":
+                (directory / "xmu.dat").write_text("1.0 2.0 3.0\n")
+
+    manifest = {
+        "n_dirs": n_dirs,
+        "depth": depth,
+        "vasp_fraction": vasp_fraction,
+        "completion_rate": completion_rate,
+        "error_rate": error_rate,
+        "outcar_size": outcar_size,
+        "feff_size": feff_size,
+        "seed": seed,
+        "counts": counts,
+    }
+    with open(root / MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
+
+
+def main(argv=sys.argv[1:]):
+    ap = argparse.ArgumentParser(
+        prog="python -m benchmarks.synthetic_tree",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    ap.add_argument("root", help="Root of the tree, which must not exist")
+    ap.add_argument("--dirs", dest="n_dirs", type=int, default=1000)
+    ap.add_argument("--depth", type=int, default=3)
+    ap.add_argument("--vasp-fraction", type=float, default=0.5)
+    ap.add_argument("--completion-rate", type=float, default=0.8)
+    ap.add_argument("--error-rate", type=float, default=0.1)
+    ap.add_argument("--outcar-size", type=int, default=100000)
+    ap.add_argument("--feff-size", type=int, default=20000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = vars(ap.parse_args(argv))
+    print(json.dumps(generate_tree(**args), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Simulates a synthetic campaign submitted by the wrangler against the fake
+SLURM backend, and reports queue occupancy over time, idle-slot-seconds and
+submission throughput. The simulation runs on a simulated clock, so a
+campaign of 10k jobs takes seconds to run.
+
+Example::
+
+    python -m benchmarks.wrangler_throughput --jobs 10000 --maxjobs 40 \\
+        --output wrangler.json
+"""
+
+import argparse
+import json
+import sys
+from time import perf_counter
+
+from cmdr.fake_slurm import FakeSlurm, SimulatedClock
+from cmdr.wrangler import Wrangler
+
+
+class SyntheticWrangler(Wrangler):
+    """Wrangler whose pending jobs are synthetic names rather than
+    directories on disk."""
+
+    def __init__(self, n_jobs, *args, **kwargs):
+        super().__init__(".", *args, **kwargs)
+        self.n_jobs = n_jobs
+
+    def discover(self):
+        self.pending = [
+            f"job_{ii:07d}"
+            for ii in range(self.n_jobs)
+            if f"job_{ii:07d}" not in self.submitted
+        ]
+        self._last_scan = self._clock()
+        return len(self.pending)
+
+    def mark_queued(self, directory, job_id):
+        pass
+
+    def prepare_array(self, directories):
+        return ".", "array.sbatch"
+
+
+def integrate(history, capacity, t_end):
+    """Integrates the occupancy history up to t_end.
+
+    Returns
+    -------
+    tuple
+        The time-averaged number of active (running or queued) jobs, and the
+        number of idle-slot-seconds, i.e. the integral of capacity minus
+        active jobs.
+    """
+
+    area = 0.0
+    idle = 0.0
+    for (t0, running, queued), (t1, _, _) in zip(
+        history, history[1:] + [(t_end, 0, 0)]
+    ):
+        t1 = min(t1, t_end)
+        if t1 <= t0:
+            continue
+        active = running + queued
+        area += active * (t1 - t0)
+        idle += max(capacity - active, 0) * (t1 - t0)
+    t_start = history[0][0] if history else 0.0
+    duration = max(t_end - t_start, 1e-12)
+    return area / duration, idle
+
+
+def sample(history, dt, t_end):
+    """Samples the occupancy history on a regular grid."""
+
+    samples = []
+    ii = 0
+    t = 0.0
+    while t <= t_end:
+        while ii + 1 < len(history) and history[ii + 1][0] <= t:
+            ii += 1
+        _, running, queued = history[ii] if history else (0, 0, 0)
+        samples.append([t, running, queued])
+        t += dt
+    return samples
+
+
+def run(
+    jobs=10000,
+    maxjobs=40,
+    slots=1000,
+    runtime=600.0,
+    runtime_spread=0.5,
+    failure_rate=0.0,
+    min_interval=10.0,
+    max_interval=300.0,
+    sample_interval=60.0,
+    seed=0,
+    array=False,
+    array_size=1000,
+    array_throttle=None,
+):
+    """Runs the simulation.
+
+    Returns
+    -------
+    dict
+        The parameters and results of the benchmark.
+    """
+
+    parameters = dict(locals())
+    clock = SimulatedClock()
+    slurm = FakeSlurm(
+        slots=slots,
+        runtime=runtime,
+        runtime_spread=runtime_spread,
+        failure_rate=failure_rate,
+        seed=seed,
+        clock=clock,
+    )
+    wrangler = SyntheticWrangler(
+        jobs,
+        maxjobs,
+        slurm,
+        min_interval=min_interval,
+        max_interval=max_interval,
+        rescan_interval=float("inf"),
+        clock=clock,
+        sleep=clock.sleep,
+        verbose=False,
+        array=array,
+        array_size=array_size,
+        array_throttle=array_throttle,
+        depends_file=None,
+    )
+
+    t0 = perf_counter()
+    submitted = wrangler.run()
+    wall_time = perf_counter() - t0
+    t_last_submit = clock()
+
+    # Let the remaining jobs drain to get the makespan. Jobs still queued
+    # when the last one was submitted (e.g. if slots < maxjobs) have no end
+    # yet, so the clock is advanced from one job end to the next
+    while slurm.active_jobs():
+        ends = [
+            job["end"]
+            for job in slurm.jobs.values()
+            if job["state"] == "RUNNING"
+        ]
+        if not ends:
+            break
+        clock.now = max(min(ends), clock.now)
+    makespan = clock()
+
+    mean_active, idle_slot_seconds = integrate(
+        slurm.history, maxjobs, t_last_submit
+    )
+    return {
+        "benchmark": "wrangler_throughput",
+        "parameters": parameters,
+        "results": {
+            "submitted": submitted,
+            "sbatch_calls": slurm._next_id - 1,
+            "failed": sum(
+                job["state"] == "FAILED" for job in slurm.jobs.values()
+            ),
+            "last_submission_time": t_last_submit,
+            "makespan": makespan,
+            "submissions_per_second": submitted / max(t_last_submit, 1e-12),
+            "mean_active_jobs": mean_active,
+            "mean_occupancy": mean_active / maxjobs,
+            "idle_slot_seconds": idle_slot_seconds,
+            "simulation_wall_time": wall_time,
+        },
+        "occupancy": sample(slurm.history, sample_interval, makespan),
+    }
+
+
+def main(argv=sys.argv[1:]):
+    ap = argparse.ArgumentParser(
+        prog="python -m benchmarks.wrangler_throughput",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    ap.add_argument("--jobs", type=int, default=10000)
+    ap.add_argument("--maxjobs", type=int, default=40)
+    ap.add_argument("--slots", type=int, default=1000)
+    ap.add_argument("--runtime", type=float, default=600.0)
+    ap.add_argument("--runtime-spread", type=float, default=0.5)
+    ap.add_argument("--failure-rate", type=float, default=0.0)
+    ap.add_argument("--min-interval", type=float, default=10.0)
+    ap.add_argument("--max-interval", type=float, default=300.0)
+    ap.add_argument("--sample-interval", type=float, default=60.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--array", action="store_true", default=False)
+    ap.add_argument("--array-size", type=int, default=1000)
+    ap.add_argument("--array-throttle", type=int, default=None)
+    ap.add_argument("--output", default=None, help="Results json file")
+    args = vars(ap.parse_args(argv))
+    output = args.pop("output")
+
+    result = run(**args)
+    print(json.dumps(result["results"], indent=4))
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,5 @@
+import logging
+
 __version__ = "0.0.0"
+
+logger = logging.getLogger("cmdr")
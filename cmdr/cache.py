@@ -0,0 +1,249 @@
+"""Persistent cache of successful job checks, used by check and report to skip
+directories which are already known to be finished.
+
+Once a job has passed its completion check its outputs never change, so
+re-reading them on every run is wasted work. Each cached success is keyed by
+the directory and the check specification (e.g. the required file and text of
+check, or the CONFIG used by report), and records the size and mtime of every
+output file that was read. On subsequent runs the output files are only
+stat'ed: if nothing changed, the cached success is reused; otherwise the
+directory is checked again. Failures are never cached.
+"""
+
+import json
+import os
+from pathlib import Path
+import sqlite3
+
+from cmdr.compression import resolve_path
+from cmdr.file_utils import directory_key
+from cmdr.profiling import timed
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS successes (
+    spec TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    stats TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (spec, directory)
+);
+"""
+
+# Number of new successes buffered before they are written to disk
+FLUSH_EVERY = 1000
+
+
+def default_cache_path(root):
+    """The default location of the result cache for a given search root, which
+    is a hidden file next to the root (see also
+    cmdr.index.default_index_path).
+
+    Parameters
+    ----------
+    root : os.PathLike
+
+    Returns
+    -------
+    pathlib.Path
+    """
+
+    root = Path(root).absolute()
+    return root.parent / f".{root.name}.cmdr-cache.sqlite"
+
+
+def make_spec(**kwargs):
+    """Serializes a check specification to a string usable as a cache key.
+
+    Returns
+    -------
+    str
+    """
+
+    return json.dumps(kwargs, sort_keys=True)
+
+
+@timed("stat")
+def file_stats(directory, filenames):
+    """Stats the files in a directory.
+
+    Parameters
+    ----------
+    directory : os.PathLike
+    filenames : list of str
+
+    Returns
+    -------
+    list
+        A list of [filename, size, mtime_ns] for every file, where size and
+        mtime_ns are None if the file does not exist. If only a compressed
+        version of a file exists (see cmdr.compression.resolve_path), that is
+        stat'ed instead.
+    """
+
+    stats = []
+    for filename in filenames:
+        try:
+            st = os.stat(resolve_path(Path(directory) / filename))
+            stats.append([filename, st.st_size, st.st_mtime_ns])
+        except OSError:
+            stats.append([filename, None, None])
+    return stats
+
+
+class ResultCache:
+    """SQLite-backed cache of successful checks.
+
+    Parameters
+    ----------
+    path : os.PathLike
+        The location of the cache database.
+    refresh : bool, optional
+        If True, existing entries are ignored (every directory is checked
+        again), but new successes are still written. Default is False.
+    clear : bool, optional
+        If True, every entry is deleted from the cache before it is used.
+        Default is False.
+
+    Notes
+    -----
+    Lookups are served from memory and are safe to call from worker threads;
+    add and flush must be called from the thread which created the cache.
+    """
+
+    def __init__(self, path, refresh=False, clear=False):
+        self.path = Path(path)
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.executescript(SCHEMA)
+        self._entries = dict()
+        self._buffer = []
+        if clear:
+            self.clear()
+        if not refresh:
+            rows = self.connection.execute(
+                "SELECT spec, directory, stats, value FROM successes"
+            )
+            for spec, directory, stats, value in rows:
+                self._entries[(spec, directory)] = (
+                    json.loads(stats),
+                    json.loads(value),
+                )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def lookup(self, spec, directory, stats):
+        """Returns the cached success for a directory, if its output files are
+        unchanged.
+
+        Parameters
+        ----------
+        spec : str
+        directory : str
+        stats : list
+            The current file stats (see file_stats).
+
+        Returns
+        -------
+        tuple
+            (hit, value), where hit is True if a valid cached success exists
+            and value is the value stored alongside it.
+        """
+
+        entry = self.get(spec, directory)
+        if entry is None or entry[0] != stats:
+            return False, None
+        return True, entry[1]
+
+    def get(self, spec, directory):
+        """Returns the cached entry of a directory without validating it, so
+        that the comparison with the current file stats can be done elsewhere
+        (e.g. in a worker process, see cmdr.report.generate_report).
+
+        Returns
+        -------
+        tuple or None
+            (stats, value), or None if the directory has no entry.
+        """
+
+        return self._entries.get((spec, directory_key(directory)))
+
+    def add(self, spec, directory, stats, value=None):
+        """Records a successful check.
+
+        Parameters
+        ----------
+        spec : str
+        directory : str
+        stats : list
+            The file stats taken before the check was run.
+        value : optional
+            Any json-serializable value to store alongside the success.
+        """
+
+        directory = directory_key(directory)
+        self._entries[(spec, directory)] = (stats, value)
+        self._buffer.append(
+            (spec, directory, json.dumps(stats), json.dumps(value))
+        )
+        if len(self._buffer) >= FLUSH_EVERY:
+            self.flush()
+
+    @timed("write")
+    def flush(self):
+        if not self._buffer:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO successes VALUES (?, ?, ?, ?)",
+                self._buffer,
+            )
+        self._buffer = []
+
+    def invalidate(self, spec=None, directories=None):
+        """Removes entries from the cache.
+
+        Parameters
+        ----------
+        spec : str, optional
+            If provided, only entries of this specification are removed.
+        directories : list of str, optional
+            If provided, only entries of these directories are removed.
+        """
+
+        self.flush()
+        query = "DELETE FROM successes WHERE 1"
+        params = []
+        if spec is not None:
+            query += " AND spec = ?"
+            params.append(spec)
+        with self.connection:
+            if directories is None:
+                self.connection.execute(query, params)
+            else:
+                self.connection.executemany(
+                    query + " AND directory = ?",
+                    [params + [directory_key(d)] for d in directories],
+                )
+        if directories is not None:
+            directories = {directory_key(d) for d in directories}
+        self._entries = {
+            key: value
+            for key, value in self._entries.items()
+            if not (
+                (spec is None or key[0] == spec)
+                and (directories is None or key[1] in directories)
+            )
+        }
+
+    def clear(self):
+        """Removes every entry from the cache."""
+
+        self.invalidate()
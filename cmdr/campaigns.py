@@ -0,0 +1,208 @@
+"""Campaigns managed by a single wrangler, sharing its maxjobs budget.
+
+Every campaign is a directory tree searched for job directories, with
+
+* a weight: the free slots of a cycle are shared so that the number of
+  active (queued or running) jobs of every campaign is proportional to its
+  weight, as far as its pending jobs allow (see fair_share);
+* an optional quota: the maximum number of active jobs of the campaign;
+* an order in which its pending jobs are submitted (see order_directories):
+  by name, by priority (read from a file in every job directory, higher
+  first), or shortest expected runtime first (with the cost estimates of
+  tether, see cmdr.tether.load_costs).
+
+Campaigns are given as a json list, e.g.::
+
+    [
+        {"directory": "relax", "weight": 2, "order": "runtime",
+         "size_file": "POSCAR"},
+        {"directory": "spectra", "quota": 50, "order": "priority"}
+    ]
+"""
+
+from copy import deepcopy
+import heapq
+import json
+import os
+from pathlib import Path
+
+from cmdr.file_utils import directory_key
+
+
+DEFAULT_CAMPAIGN = {
+    "directory": None,
+    "weight": 1.0,
+    "quota": None,
+    "order": "name",
+    # The file holding the priority of a job directory (order "priority")
+    "priority_file": "priority",
+    # The sources of runtime estimates (order "runtime"), see
+    # cmdr.tether.load_costs
+    "cost_csv": None,
+    "timings": None,
+    "size_file": None,
+}
+
+ORDERS = ["name", "priority", "runtime"]
+
+
+def make_campaign(directory, **options):
+    """Returns a campaign with the default settings, overridden by options.
+
+    Raises
+    ------
+    ValueError
+        If an option is unknown or invalid.
+    """
+
+    unknown = set(options) - set(DEFAULT_CAMPAIGN)
+    if unknown:
+        raise ValueError(f"Unknown campaign keys {sorted(unknown)}")
+    campaign = deepcopy(DEFAULT_CAMPAIGN)
+    campaign.update(options)
+    campaign["directory"] = Path(directory)
+    if campaign["order"] not in ORDERS:
+        raise ValueError(
+            f"Unknown order {campaign['order']} of {directory}, expected one "
+            f"of {ORDERS}"
+        )
+    if not campaign["weight"] > 0:
+        raise ValueError(f"The weight of {directory} must be positive")
+    return campaign
+
+
+def load_campaigns(path, defaults=None):
+    """Loads a json list of campaigns.
+
+    Parameters
+    ----------
+    path : os.PathLike
+    defaults : dict, optional
+        Settings of every campaign which are not given in the file.
+
+    Returns
+    -------
+    list of dict
+
+    Raises
+    ------
+    ValueError
+        If a campaign has no directory, or unknown or invalid keys.
+    """
+
+    with open(path, "r") as f:
+        entries = json.load(f)
+    campaigns = []
+    for entry in entries:
+        if "directory" not in entry:
+            raise ValueError(f"Campaign without a directory in {path}")
+        unknown = set(entry) - set(DEFAULT_CAMPAIGN)
+        if unknown:
+            raise ValueError(f"Unknown keys {sorted(unknown)} in {path}")
+        options = dict(defaults or dict())
+        options.update(entry)
+        campaigns.append(make_campaign(options.pop("directory"), **options))
+    return campaigns
+
+
+def read_priority(directory, filename="priority"):
+    """The priority of a job directory: the number in its priority file, or
+    0 if it has none (or it cannot be parsed)."""
+
+    try:
+        with open(Path(directory) / filename, "r") as f:
+            return float(f.read().strip())
+    except (OSError, ValueError):
+        return 0.0
+
+
+def order_directories(directories, campaign):
+    """Sorts the pending directories of a campaign in the order in which they
+    are submitted. Ties are broken by name.
+
+    Parameters
+    ----------
+    directories : list of str
+    campaign : dict
+
+    Returns
+    -------
+    list of str
+    """
+
+    directories = sorted(directories)
+    if campaign["order"] == "priority":
+        priorities = {
+            dd: read_priority(dd, campaign["priority_file"])
+            for dd in directories
+        }
+        directories.sort(key=lambda dd: -priorities[dd])
+    elif campaign["order"] == "runtime" and directories:
+        from cmdr.tether import load_costs
+
+        costs = load_costs(
+            directories,
+            cost_csv=campaign["cost_csv"],
+            timings=campaign["timings"],
+            size_file=campaign["size_file"],
+        )
+        directories.sort(key=lambda dd: costs[directory_key(dd)])
+    return directories
+
+
+def campaign_index(directory, roots):
+    """The index of the campaign containing directory, given the absolute
+    paths of the campaign roots (the innermost one if they are nested), or
+    None if it is in none of them."""
+
+    directory = directory_key(directory)
+    found = None
+    for ii, root in enumerate(roots):
+        inside = directory == root or directory.startswith(
+            os.path.join(root, "")
+        )
+        if inside and (found is None or len(root) > len(roots[found])):
+            found = ii
+    return found
+
+
+def fair_share(n, active, available, weights, quotas):
+    """Distributes n free slots among campaigns, one at a time to the
+    campaign with the fewest active jobs per unit of weight (water-filling).
+
+    Parameters
+    ----------
+    n : int
+        The number of free slots.
+    active : list of int
+        The number of active jobs of every campaign.
+    available : list of int
+        The number of jobs of every campaign which can be submitted now.
+    weights : list of float
+    quotas : list of int or None
+        The maximum number of active jobs of every campaign, or None.
+
+    Returns
+    -------
+    list of int
+        The number of slots of every campaign.
+    """
+
+    share = [0] * len(weights)
+    heap = [
+        (active[ii] / weights[ii], ii)
+        for ii in range(len(weights))
+        if available[ii] > 0
+    ]
+    heapq.heapify(heap)
+    while n > 0 and heap:
+        _, ii = heapq.heappop(heap)
+        quota = quotas[ii]
+        if quota is not None and active[ii] + share[ii] >= quota:
+            continue
+        share[ii] += 1
+        n -= 1
+        if share[ii] < available[ii]:
+            load = (active[ii] + share[ii]) / weights[ii]
+            heapq.heappush(heap, (load, ii))
+    return share
@@ -1,7 +1,54 @@
 from pathlib import Path
-from tqdm import tqdm
+from time import perf_counter
 
-from cmdr.file_utils import exhaustive_directory_search, run_command, save_json
+from rich.progress import Progress
+
+from cmdr.cache import ResultCache, default_cache_path, file_stats, make_spec
+from cmdr.file_utils import (
+    directory_key,
+    exhaustive_directory_search,
+    file_contains,
+    grep_pattern,
+    imap_as_completed,
+    save_json,
+)
+from cmdr.ledger import Ledger
+from cmdr.records import RecordWriter
+from cmdr.tracker import RUNNING, is_active, refresh_states
+
+
+def check_directory(directory, require_filename, require_text):
+    """Checks a single directory for the required file and text.
+
+    Parameters
+    ----------
+    directory : os.PathLike
+    require_filename : str
+    require_text : str, bytes or re.Pattern
+        A basic regular expression, as understood by grep, which must match
+        a line of the required file, or its translation by
+        cmdr.file_utils.grep_pattern.
+
+    Returns
+    -------
+    str or None
+        "no_file" if the required file does not exist, "unreadable" if it
+        cannot be read (e.g. for lack of permissions, or because it is a
+        corrupt compressed file), "no_line" if no line matches the required
+        text, and None if the check passed.
+    """
+
+    if isinstance(require_text, str):
+        require_text = grep_pattern(require_text)
+    path = Path(directory) / require_filename
+    try:
+        if not file_contains(path, require_text):
+            return "no_line"
+    except FileNotFoundError:
+        return "no_file"
+    except OSError:
+        return "unreadable"
+    return None
 
 
 def check(
@@ -10,6 +57,19 @@ def check(
     require_filename,
     require_text,
     report_path,
+    max_depth=None,
+    exclude=None,
+    use_index=False,
+    index_path=None,
+    workers=None,
+    use_cache=False,
+    cache_path=None,
+    refresh_cache=False,
+    clear_cache=False,
+    invalidate_cache=None,
+    records_path=None,
+    ledger_path=None,
+    sacct="sacct",
 ):
     """Summary
     
@@ -25,29 +85,156 @@ def check(
         Description
     report_path : TYPE
         Description
+    max_depth : int, optional
+        Maximum depth of the directory search.
+    exclude : list of str, optional
+        Glob patterns of directory names to prune from the directory search.
+    use_index : bool, optional
+        If True, uses the persistent directory index (see cmdr.index).
+    index_path : os.PathLike, optional
+        Location of the directory index.
+    workers : int, optional
+        The number of threads used to read the required files concurrently.
+    use_cache : bool, optional
+        If True, directories which previously passed the check are skipped,
+        unless the required file changed size or mtime since (see
+        cmdr.cache). Default is False.
+    cache_path : os.PathLike, optional
+        Location of the result cache. Default is given by default_cache_path.
+    refresh_cache : bool, optional
+        If True, ignores cached successes and checks every directory again,
+        updating the cache.
+    clear_cache : bool, optional
+        If True, deletes every entry of the result cache before running.
+    invalidate_cache : list of os.PathLike, optional
+        Directories whose cached successes are deleted before running.
+    records_path : os.PathLike, optional
+        If provided, one record per directory (with the status "success",
+        "no_file", "no_line", "unreadable" or "running") is written to this
+        file as soon as its result is known (see cmdr.records).
+    ledger_path : os.PathLike, optional
+        If provided, the submission ledger of the wrangler (see cmdr.ledger).
+        Directories whose jobs are still queued or running according to the
+        ledger are skipped (with the status "running") rather than checked.
+    sacct : str, optional
+        The sacct command with which the states of the outstanding jobs of
+        the ledger are updated first (see cmdr.tracker.refresh_states), or
+        None to use the recorded states.
     """
 
     dirs = sorted(
-        exhaustive_directory_search(search_directory, search_filename)
+        exhaustive_directory_search(
+            search_directory,
+            search_filename,
+            max_depth=max_depth,
+            exclude=exclude,
+            use_index=use_index,
+            index_path=index_path,
+        )
     )
     dirs = [str(d) for d in dirs]
 
-    failed_no_file = []
-    failed_no_line = []
-    for d in tqdm(dirs):
-        if not (Path(d) / require_filename).exists():
-            failed_no_file.append(d)
-            continue
-        cmd = f"grep '{require_text}' {Path(d) / require_filename}"
-        cmd = run_command(cmd)
-        exitcode = cmd["exitcode"]
-        if int(exitcode) == 1:
-            failed_no_line.append(d)
-
-    if len(failed_no_file) > 0 or len(failed_no_line) > 0:
+    cache = None
+    # require_text is matched like grep does, rather than literally as by
+    # earlier versions, whose cached results are thus not reused
+    spec = make_spec(
+        require_filename=require_filename,
+        require_text=require_text,
+        syntax="grep",
+    )
+    if use_cache:
+        if cache_path is None:
+            cache_path = default_cache_path(search_directory)
+        cache = ResultCache(
+            cache_path, refresh=refresh_cache, clear=clear_cache
+        )
+        if invalidate_cache is not None:
+            cache.invalidate(directories=invalidate_cache)
+
+    states = dict()
+    if ledger_path is not None:
+        with Ledger(ledger_path) as ledger:
+            states = refresh_states(ledger, sacct, log=print)
+
+    pattern = grep_pattern(require_text)
+
+    def _check(d):
+        t0 = perf_counter()
+        if is_active(states.get(directory_key(d))):
+            return RUNNING, None, perf_counter() - t0
+        if cache is None:
+            status = check_directory(d, require_filename, pattern)
+            return status, None, perf_counter() - t0
+        stats = file_stats(d, [require_filename])
+        if cache.lookup(spec, d, stats)[0]:
+            return "cached", None, perf_counter() - t0
+        status = check_directory(d, require_filename, pattern)
+        return status, stats, perf_counter() - t0
+
+    matched = {
+        None: [[require_filename, require_text]],
+        "no_line": [[require_filename, None]],
+        "no_file": [],
+        "unreadable": [],
+        RUNNING: None,
+    }
+    failed = {"no_file": [], "no_line": [], "unreadable": []}
+    n_cached = 0
+    n_running = 0
+    writer = None
+    try:
+        if records_path is not None:
+            writer = RecordWriter(records_path)
+        with Progress() as progress:
+            task = progress.add_task("Checking", total=len(dirs))
+            for d, (status, stats, elapsed) in imap_as_completed(
+                _check, dirs, workers=workers
+            ):
+                if writer is not None:
+                    hit = status == "cached"
+                    writer.write(
+                        d,
+                        "success" if status is None or hit else status,
+                        cached=hit,
+                        matched=None if hit else matched[status],
+                        elapsed=elapsed,
+                    )
+                if status == "cached":
+                    n_cached += 1
+                elif status == RUNNING:
+                    n_running += 1
+                elif status is not None:
+                    failed[status].append(d)
+                elif cache is not None:
+                    cache.add(spec, d, stats)
+                progress.update(
+                    task,
+                    advance=1,
+                    description="Checking (no file: "
+                    f"{len(failed['no_file'])}, "
+                    f"no line: {len(failed['no_line'])}, "
+                    f"unreadable: {len(failed['unreadable'])})",
+                )
+    finally:
+        if writer is not None:
+            writer.close()
+        if cache is not None:
+            cache.close()
+    if cache is not None:
+        print(f"Skipped (cached success): {n_cached}")
+    if ledger_path is not None:
+        print(f"Skipped (queued or running): {n_running}")
+    failed_no_file = sorted(failed["no_file"])
+    failed_no_line = sorted(failed["no_line"])
+    failed_unreadable = sorted(failed["unreadable"])
+
+    if failed_no_file or failed_no_line or failed_unreadable:
         print(f"Failed (no file): {len(failed_no_file)}")
         print(f"Failed (no line): {len(failed_no_line)}")
+        print(f"Failed (unreadable): {len(failed_unreadable)}")
         d = {"failed_no_file": failed_no_file, "failed_no_line": failed_no_line}
+        if failed_unreadable:
+            d["failed_unreadable"] = failed_unreadable
         save_json(d, report_path)
     else:
         print("No jobs failed, no report to write")
@@ -0,0 +1,252 @@
+"""Transparent reading of compressed output files, so that finished campaigns
+can be checked after their outputs were compressed in place (e.g. OUTCAR to
+OUTCAR.gz) without decompressing them to disk.
+
+gzip, bzip2 and xz files are supported through the standard library, and
+zstd files if the optional zstandard package is installed. Files are always
+decompressed as streams, in bounded memory.
+
+Reading the end of a compressed file (see tail) is cheapest if the file
+consists of several independently compressed members, as written by e.g.
+``pigz --independent``, ``bgzip``, ``pbzip2``, ``xz -T`` or the zstd seekable
+format: the file is then searched backwards for the start of a member, and
+only the members after it are decompressed. Files with a single member (as
+written by plain gzip) are streamed from the start, keeping only the last
+decompressed blocks in memory.
+"""
+
+import bz2
+from collections import deque
+import gzip
+import lzma
+import os
+from pathlib import Path
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# The magic bytes at the start of every member (stream) of each format
+MAGIC = {
+    ".gz": b"\x1f\x8b\x08",
+    ".bz2": b"BZh",
+    ".xz": b"\xfd7zXZ\x00",
+    ".zst": b"\x28\xb5\x2f\xfd",
+}
+
+# Block size of reads and backwards seeks in compressed files
+BLOCK_SIZE = 64 * 1024
+
+# At most this many compressed bytes at the end of a file are searched for the
+# start of a member, before the whole file is streamed instead
+MAX_MEMBER_SEARCH = 16 * 1024 * 1024
+
+_ERRORS = (OSError, EOFError, zlib.error, lzma.LZMAError)
+if zstandard is not None:
+    _ERRORS = _ERRORS + (zstandard.ZstdError,)
+
+
+def compression_suffixes():
+    """The suffixes of the compressed formats which can be read.
+
+    Returns
+    -------
+    list of str
+    """
+
+    return [xx for xx in MAGIC if xx != ".zst" or zstandard is not None]
+
+
+def is_compressed(path):
+    """Whether the file is compressed, judging by its suffix.
+
+    Parameters
+    ----------
+    path : os.PathLike
+
+    Returns
+    -------
+    bool
+    """
+
+    return Path(path).suffix in MAGIC
+
+
+def resolve_path(path):
+    """Returns the path itself if it exists, and otherwise its first existing
+    compressed variant (e.g. OUTCAR.gz for OUTCAR). If neither exists, the
+    path is returned unchanged, so that opening it raises FileNotFoundError.
+
+    Parameters
+    ----------
+    path : os.PathLike
+
+    Returns
+    -------
+    pathlib.Path
+    """
+
+    path = Path(path)
+    if path.exists() or is_compressed(path):
+        return path
+    for suffix in compression_suffixes():
+        candidate = path.with_name(path.name + suffix)
+        if candidate.exists():
+            return candidate
+    return path
+
+
+def _open_stream(fileobj, suffix):
+    """Wraps a binary file object positioned at the start of a member in a
+    decompressing stream, which reads every following member."""
+
+    if suffix == ".gz":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if suffix == ".bz2":
+        return bz2.BZ2File(fileobj, mode="rb")
+    if suffix == ".xz":
+        return lzma.LZMAFile(fileobj, mode="rb")
+    if suffix == ".zst":
+        if zstandard is None:
+            raise OSError(f"Reading {suffix} files requires zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(
+            fileobj, read_across_frames=True
+        )
+    raise ValueError(f"Unknown compression suffix {suffix}")
+
+
+def iter_blocks(path, block_size=BLOCK_SIZE):
+    """Yields the decompressed content of a compressed file in blocks.
+
+    Parameters
+    ----------
+    path : os.PathLike
+    block_size : int, optional
+
+    Yields
+    ------
+    bytes
+
+    Raises
+    ------
+    OSError
+        If the file cannot be read or decompressed.
+    """
+
+    path = Path(path)
+    with open(path, "rb") as f:
+        stream = _open_stream(f, path.suffix)
+        try:
+            while True:
+                block = stream.read(block_size)
+                if not block:
+                    break
+                yield block
+        except _ERRORS as error:
+            raise OSError(f"Cannot decompress {path}: {error}") from error
+        finally:
+            stream.close()
+
+
+def _decompress_from(f, offset, suffix, max_bytes):
+    """Decompresses every member from offset to the end of the file, keeping
+    at most the last max_bytes bytes (None keeps everything). Returns None if
+    offset is not the start of a member."""
+
+    f.seek(offset)
+    blocks = deque()
+    size = 0
+    try:
+        stream = _open_stream(f, suffix)
+        while True:
+            block = stream.read(BLOCK_SIZE)
+            if not block:
+                break
+            blocks.append(block)
+            size += len(block)
+            while max_bytes is not None and size - len(blocks[0]) >= max_bytes:
+                size -= len(blocks.popleft())
+    except _ERRORS:
+        return None
+    return b"".join(blocks)
+
+
+def _trim(blocks, size, enough):
+    """Drops blocks from the left of the deque while the remainder still
+    satisfies enough. Returns the new size."""
+
+    while len(blocks) > 1 and enough(b"".join(list(blocks)[1:])):
+        size -= len(blocks.popleft())
+    return size
+
+
+def tail(path, enough, max_bytes=None):
+    """Reads the end of the decompressed content of a compressed file.
+
+    The file is first searched backwards for the start of a member, from
+    which the rest of the file is decompressed; the search continues with
+    earlier members until enough(decompressed) holds. If no suitable member
+    is found within MAX_MEMBER_SEARCH bytes of the end, the whole file is
+    streamed instead.
+
+    Parameters
+    ----------
+    path : os.PathLike
+    enough : callable
+        Maps decompressed bytes to whether they contain enough of the end of
+        the file (e.g. enough lines).
+    max_bytes : int, optional
+        Only the last max_bytes decompressed bytes are needed.
+
+    Returns
+    -------
+    bytes
+        The end of the decompressed content, which satisfies enough unless the
+        whole content does not.
+
+    Raises
+    ------
+    OSError
+        If the file cannot be read or decompressed.
+    """
+
+    path = Path(path)
+    magic = MAGIC[path.suffix]
+    with open(path, "rb") as f:
+        end = os.fstat(f.fileno()).st_size
+        position = end
+        previous = b""
+        while position > 0 and end - position < MAX_MEMBER_SEARCH:
+            start = max(position - BLOCK_SIZE, 0)
+            f.seek(start)
+            # Include the first bytes of the previous block, so that magic
+            # bytes spanning the boundary are found
+            raw = f.read(position - start)
+            block = raw + previous[: len(magic) - 1]
+            previous = raw
+            offset = block.rfind(magic)
+            while offset != -1:
+                if start + offset > 0:
+                    data = _decompress_from(
+                        f, start + offset, path.suffix, max_bytes
+                    )
+                    if data is not None and enough(data):
+                        return data
+                offset = block.rfind(magic, 0, offset)
+            position = start
+
+    # Stream the whole file, keeping only the blocks which are needed
+    blocks = deque()
+    size = 0
+    for block in iter_blocks(path):
+        blocks.append(block)
+        size += len(block)
+        if max_bytes is not None:
+            while size - len(blocks[0]) >= max_bytes:
+                size -= len(blocks.popleft())
+        elif len(blocks) > 2 and enough(b"".join(list(blocks)[1:])):
+            size = _trim(blocks, size, enough)
+    return b"".join(blocks)
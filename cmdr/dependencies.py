@@ -0,0 +1,144 @@
+"""Dependencies between job directories, used by the wrangler to submit
+multi-stage workflows (e.g. relax, then static, then spectra) as one campaign.
+
+A job directory declares the directories it depends on in a depends_on file,
+one per line, either relative to the job directory or absolute. Blank lines
+and everything after a # are ignored::
+
+    # static/depends_on
+    ../relax
+
+A downstream job is submitted as soon as every directory it depends on was
+submitted, with --dependency=afterok:<id>:<id>... so that SLURM starts it once
+they completed and the pipeline stays in the queue continuously. If slots are
+scarce, jobs without outstanding dependencies are submitted first, and
+downstream jobs are held by the wrangler until slots are left over.
+Dependencies which already completed (according to the ledger, see
+cmdr.ledger) are not passed to SLURM, and jobs depending on a directory which
+failed for good (or which is not a job directory) are never submitted. When
+failed jobs are retried (see cmdr.retry), the downstream jobs which SLURM
+cancelled because an attempt of their dependency failed are submitted again
+behind its next attempt (see cmdr.wrangler.Wrangler.repend).
+"""
+
+from collections import deque
+from pathlib import Path
+
+from cmdr.file_utils import directory_key
+from cmdr.ledger import UNKNOWN
+from cmdr.retry import EXHAUSTED, FATAL, RETRY, SUCCESS
+from cmdr.tracker import is_active
+
+
+DEPENDS_FILE = "depends_on"
+
+# The status of a dependency: its job completed (or cannot be tracked), it
+# was not submitted yet (or is waiting for its resubmission), or it will never
+# complete. Otherwise, the status is the job ID of the dependency.
+DONE = "done"
+HELD = "held"
+BLOCKED = "blocked"
+
+# Option of the downstream jobs, so that SLURM cancels them if a dependency
+# fails rather than keeping them queued forever
+KILL_ON_INVALID = "--kill-on-invalid-dep=yes"
+
+
+def read_dependencies(directory, filename=DEPENDS_FILE):
+    """Reads the dependencies of a job directory.
+
+    Parameters
+    ----------
+    directory : os.PathLike
+    filename : str, optional
+
+    Returns
+    -------
+    list of str
+        The absolute paths of the directories it depends on, empty if it has
+        no dependency file.
+    """
+
+    try:
+        with open(Path(directory) / filename, "r") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+    dependencies = []
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if line:
+            dependencies.append(directory_key(Path(directory) / line))
+    return dependencies
+
+
+def dependency_status(entry, retrying=False):
+    """The status of a dependency from its ledger entry.
+
+    Parameters
+    ----------
+    entry : dict
+        See cmdr.ledger.Ledger.get.
+    retrying : bool, optional
+        Whether failed jobs may be resubmitted (see cmdr.retry), in which case
+        the downstream jobs of a failed job are held until its outcome is
+        known rather than blocked.
+
+    Returns
+    -------
+    str
+        DONE, HELD, BLOCKED, or the job ID of the dependency if it is still
+        queued or running.
+    """
+
+    outcome = entry["outcome"]
+    if outcome == SUCCESS:
+        return DONE
+    if outcome == RETRY:
+        return HELD
+    if outcome in (FATAL, EXHAUSTED):
+        return BLOCKED
+    state = entry["state"]
+    if state in ("COMPLETED", UNKNOWN) or entry["job_id"] is None:
+        return DONE
+    if is_active(state):
+        return entry["job_id"]
+    return HELD if retrying else BLOCKED
+
+
+def dependency_options(job_ids):
+    """The sbatch options of a job which depends on the given jobs."""
+
+    return [f"--dependency=afterok:{':'.join(job_ids)}", KILL_ON_INVALID]
+
+
+def cyclic(graph):
+    """Finds the directories which can never be submitted because they are on
+    (or downstream of) a dependency cycle.
+
+    Parameters
+    ----------
+    graph : dict
+        Maps directories to the directories they depend on. Dependencies
+        which are not keys of graph are ignored.
+
+    Returns
+    -------
+    set
+    """
+
+    dependents = {node: [] for node in graph}
+    missing = dict()
+    for node, dependencies in graph.items():
+        dependencies = {dd for dd in dependencies if dd in graph}
+        missing[node] = len(dependencies)
+        for dependency in dependencies:
+            dependents[dependency].append(node)
+    queue = deque(node for node, n in missing.items() if n == 0)
+    while queue:
+        node = queue.popleft()
+        for dependent in dependents[node]:
+            missing[dependent] -= 1
+            if missing[dependent] == 0:
+                queue.append(dependent)
+    return {node for node, n in missing.items() if n > 0}
@@ -1,14 +1,14 @@
 import argparse
 from argparse import HelpFormatter, ArgumentDefaultsHelpFormatter
 from datetime import datetime
+import logging
 from operator import attrgetter
 from pathlib import Path
-from rich.pretty import pprint
 import sys
 
-from cmdr.check import check
-from cmdr.tether import tether_constructor
-from cmdr.file_utils import run_command
+# The modules of the subcommands (and their dependencies, such as rich) are
+# only imported once a subcommand is dispatched (see SUBCOMMANDS), so that
+# --help and the cheap subcommands start quickly
 
 
 NOW = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
@@ -34,6 +34,32 @@ def global_parser(sys_argv):
         "changes the logging format to make it better for detecting issues.",
     )
 
+    ap.add_argument(
+        "--profile",
+        dest="profile",
+        default=False,
+        action="store_true",
+        help="If specified, collects per-stage wall and CPU timers (walk, "
+        "classify, read, match, write, ...) and counters of files opened, "
+        "bytes read and subprocesses spawned, prints them as a table at the "
+        "end of the run and saves them to --profile-output",
+    )
+
+    ap.add_argument(
+        "--profile-output",
+        dest="profile_path",
+        default=f"cmdr_profile_{NOW}.json",
+        help="json file the profiling metrics are saved to",
+    )
+
+    ap.add_argument(
+        "--cprofile",
+        dest="cprofile_path",
+        default=None,
+        help="If specified together with --profile, the run is also profiled "
+        "with cProfile, and the statistics are saved to this file",
+    )
+
     # --- Global options ---
 
     subparsers = ap.add_subparsers(help="Global options", dest="runtype")
@@ -76,6 +102,253 @@ def global_parser(sys_argv):
         type=str,
     )
 
+    wrangle_subparser.add_argument(
+        "--loop",
+        dest="loop",
+        default=False,
+        action="store_true",
+        help="If specified, runs the Python wrangler in the foreground "
+        "until every job is submitted, instead of installing "
+        "slurm_wrangler.sh into the crontab",
+    )
+
+    wrangle_subparser.add_argument(
+        "--daemon",
+        dest="daemon",
+        default=False,
+        action="store_true",
+        help="Same as --loop, but detaches from the terminal and logs to "
+        "--log-file",
+    )
+
+    wrangle_subparser.add_argument(
+        "--target-file",
+        dest="target_file",
+        help="Name of the submit script identifying a job directory",
+        default="submit.sbatch",
+    )
+
+    wrangle_subparser.add_argument(
+        "--min-interval",
+        dest="min_interval",
+        help="Minimum time between wrangler cycles in seconds (--loop and "
+        "--daemon only)",
+        default=10.0,
+        type=float,
+    )
+
+    wrangle_subparser.add_argument(
+        "--max-interval",
+        dest="max_interval",
+        help="Maximum time between wrangler cycles in seconds (--loop and "
+        "--daemon only)",
+        default=300.0,
+        type=float,
+    )
+
+    wrangle_subparser.add_argument(
+        "--rescan-interval",
+        dest="rescan_interval",
+        help="Time between searches of the directory for new jobs in "
+        "seconds (--loop and --daemon only)",
+        default=600.0,
+        type=float,
+    )
+
+    wrangle_subparser.add_argument(
+        "--array",
+        dest="array",
+        default=False,
+        action="store_true",
+        help="If specified, groups pending jobs into SLURM job arrays, so "
+        "that a single sbatch call submits many directories (--loop and "
+        "--daemon only). The jobs should request the same resources",
+    )
+
+    wrangle_subparser.add_argument(
+        "--array-size",
+        dest="array_size",
+        help="Maximum number of directories per job array",
+        default=1000,
+        type=int,
+    )
+
+    wrangle_subparser.add_argument(
+        "--array-throttle",
+        dest="array_throttle",
+        help="Maximum number of simultaneously running tasks per job array",
+        default=None,
+        type=int,
+    )
+
+    wrangle_subparser.add_argument(
+        "--sbatch-command",
+        dest="sbatch_command",
+        help="Command used to submit jobs (--loop and --daemon only), e.g. "
+        "'python -m cmdr.fake_slurm --state queue.json sbatch' to run "
+        "against the fake SLURM backend",
+        default="sbatch",
+    )
+
+    wrangle_subparser.add_argument(
+        "--squeue-command",
+        dest="squeue_command",
+        help="Command used to query the queue (--loop and --daemon only)",
+        default="squeue",
+    )
+
+    wrangle_subparser.add_argument(
+        "--sacct-command",
+        dest="sacct_command",
+        help="Command used to query the states of submitted jobs, which are "
+        "recorded in the ledger (--loop and --daemon only)",
+        default="sacct",
+    )
+
+    wrangle_subparser.add_argument(
+        "--submit-concurrency",
+        dest="submit_concurrency",
+        help="Maximum number of sbatch calls run at once (--loop and --daemon "
+        "only)",
+        default=4,
+        type=int,
+    )
+
+    wrangle_subparser.add_argument(
+        "--log-file",
+        dest="log_file",
+        help="Log file of the daemon (defaults to wrangler.log in the "
+        "directory)",
+        default=None,
+    )
+
+    wrangle_subparser.add_argument(
+        "--pid-file",
+        dest="pid_file",
+        help="File to write the process ID of the daemon to",
+        default=None,
+    )
+
+    wrangle_subparser.add_argument(
+        "--ledger",
+        dest="ledger_path",
+        help="SQLite ledger in which submissions are recorded (--loop and "
+        "--daemon only). Existing QUEUED markers are imported on first use. "
+        "Defaults to a hidden file next to --directory",
+        default=None,
+    )
+
+    wrangle_subparser.add_argument(
+        "--no-ledger",
+        dest="no_ledger",
+        default=False,
+        action="store_true",
+        help="If specified, submissions are recorded as QUEUED marker files "
+        "in the job directories instead of in the ledger (--loop and "
+        "--daemon only)",
+    )
+
+    wrangle_subparser.add_argument(
+        "--retry",
+        dest="retry",
+        default=False,
+        action="store_true",
+        help="If specified, finished jobs are checked like report does, and "
+        "those which failed in a retryable way are resubmitted with an "
+        "exponential backoff (--loop and --daemon only, requires the ledger)",
+    )
+
+    wrangle_subparser.add_argument(
+        "--retry-rules",
+        dest="retry_rules_path",
+        help="json file of retry rules which are merged into the default "
+        "rules (see cmdr.retry)",
+        default=None,
+    )
+
+    wrangle_subparser.add_argument(
+        "--config",
+        dest="config_path",
+        help="json file of calculation types and completion checks used by "
+        "--retry, which are merged into the default configuration of report "
+        "(see cmdr.matcher)",
+        default=None,
+    )
+
+    wrangle_subparser.add_argument(
+        "--depends-file",
+        dest="depends_file",
+        help="Name of the file listing the directories a job depends on, one "
+        "per line and relative to the job directory (--loop and --daemon "
+        "only). Jobs are chained behind their dependencies with "
+        "--dependency=afterok",
+        default="depends_on",
+    )
+
+    wrangle_subparser.add_argument(
+        "--no-chain",
+        dest="no_chain",
+        default=False,
+        action="store_true",
+        help="If specified, jobs are held by the wrangler until their "
+        "dependencies completed, rather than submitted with "
+        "--dependency=afterok (--loop and --daemon only, requires the ledger)",
+    )
+
+    wrangle_subparser.add_argument(
+        "--campaigns",
+        dest="campaigns_path",
+        help="json file listing several campaign directories (with their "
+        "weight, quota and order, see cmdr.campaigns) which share --maxjobs "
+        "(--loop and --daemon only, requires the ledger). --directory then "
+        "only holds the log file, the default ledger and the job arrays",
+        default=None,
+    )
+
+    wrangle_subparser.add_argument(
+        "--order",
+        dest="order",
+        choices=["name", "priority", "runtime"],
+        help="Order in which pending jobs are submitted: by name, by the "
+        "number in their --priority-file (highest first), or shortest "
+        "expected runtime first (--loop and --daemon only, default of every "
+        "campaign)",
+        default="name",
+    )
+
+    wrangle_subparser.add_argument(
+        "--priority-file",
+        dest="priority_file",
+        help="Name of the file holding the priority of a job directory",
+        default="priority",
+    )
+
+    wrangle_subparser.add_argument(
+        "--cost-csv",
+        dest="cost_csv",
+        help="CSV file of directory,cost rows with per-directory runtime "
+        "estimates, used by --order=runtime",
+        default=None,
+    )
+
+    wrangle_subparser.add_argument(
+        "--cost-timings",
+        dest="timings",
+        action="append",
+        help="summary.tsv file of a previous tether run (or a directory "
+        "containing them) whose task wall times are used as runtime "
+        "estimates by --order=runtime (can be repeated)",
+        default=None,
+    )
+
+    wrangle_subparser.add_argument(
+        "--cost-file-size",
+        dest="size_file",
+        help="Name of a file whose size is used as the runtime estimate of "
+        "every directory by --order=runtime",
+        default=None,
+    )
+
     # TETHER
 
     tether_subparser = subparsers.add_parser(
@@ -90,14 +363,14 @@ def global_parser(sys_argv):
         dest="filename",
         help="File to search for, which is an indicator that is a directory "
         "in which you want to run a job",
-        required=True,
+        default=None,
     )
 
     tether_subparser.add_argument(
         "--directory",
         dest="search_directory",
         help="Directory to search for the file name",
-        required=True,
+        default=None,
     )
 
     tether_subparser.add_argument(
@@ -123,7 +396,73 @@ def global_parser(sys_argv):
         dest="executable_lines",
         action="append",
         help="Executable line to be run in every directory found",
-        required=True,
+        default=None,
+    )
+
+    tether_subparser.add_argument(
+        "--parallel",
+        dest="parallel",
+        help="Number of calculations run concurrently within each staged "
+        "job (defaults to SLURM_CPUS_ON_NODE at runtime)",
+        default=None,
+        type=int,
+    )
+
+    tether_subparser.add_argument(
+        "--cost-csv",
+        dest="cost_csv",
+        help="CSV file of directory,cost rows with per-directory runtime "
+        "estimates, used to balance the wall time of the staged jobs",
+        default=None,
+    )
+
+    tether_subparser.add_argument(
+        "--cost-timings",
+        dest="timings",
+        action="append",
+        help="summary.tsv file of a previous tether run (or a directory "
+        "containing them) whose task wall times are used as cost estimates "
+        "(can be repeated)",
+        default=None,
+    )
+
+    tether_subparser.add_argument(
+        "--cost-file-size",
+        dest="size_file",
+        help="Name of a file whose size is used as the cost estimate of "
+        "every directory",
+        default=None,
+    )
+
+    tether_subparser.add_argument(
+        "--target-walltime",
+        dest="target_walltime",
+        help="Target wall time of every staged job, in the units of the "
+        "cost estimates (seconds for --cost-timings)",
+        default=None,
+        type=float,
+    )
+
+    tether_subparser.add_argument(
+        "--resume",
+        dest="resume",
+        default=False,
+        action="store_true",
+        help="If specified, writes staged jobs for only the tasks of an "
+        "existing tether directory which have not yet completed "
+        "successfully, using its stored configuration. Requires "
+        "--tether-directory; all other options except "
+        "--calculations-per-staged-job are ignored",
+    )
+
+    tether_subparser.add_argument(
+        "--work-queue",
+        dest="work_queue",
+        default=False,
+        action="store_true",
+        help="If specified, writes a single shared work manifest from which "
+        "every staged job pulls directories until none are left, instead of "
+        "a fixed list of directories per staged job",
     )
 
     tether_subparser.add_argument(
@@ -143,7 +482,43 @@ def global_parser(sys_argv):
         dest="slurm_lines",
         action="append",
         help="Slurm parameter",
-        required=True,
+        default=None,
+    )
+
+    tether_subparser.add_argument(
+        "--max-depth",
+        dest="max_depth",
+        help="Maximum depth of the directory search (the search directory "
+        "is depth 0)",
+        default=None,
+        type=int,
+    )
+
+    tether_subparser.add_argument(
+        "--use-index",
+        dest="use_index",
+        default=False,
+        action="store_true",
+        help="If specified, uses (and refreshes) a persistent index of the "
+        "search directory instead of walking the whole tree, so that "
+        "repeated searches only list directories which changed",
+    )
+
+    tether_subparser.add_argument(
+        "--index-path",
+        dest="index_path",
+        help="Location of the directory index (defaults to a hidden file "
+        "next to the search directory)",
+        default=None,
+    )
+
+    tether_subparser.add_argument(
+        "--exclude",
+        dest="exclude",
+        action="append",
+        help="Glob pattern of directory names to skip during the directory "
+        "search, together with everything below them (can be repeated)",
+        default=None,
     )
 
     # CHECK
@@ -180,7 +555,9 @@ def global_parser(sys_argv):
     check_subparser.add_argument(
         "--require-text",
         dest="require_text",
-        help="Requires that this text be found in the specified required file",
+        help="Requires that a line of the required file matches this basic "
+        "regular expression, as with grep (text without any of the special "
+        "characters .[]*^$\\ is searched for literally)",
         required=True,
     )
 
@@ -191,7 +568,560 @@ def global_parser(sys_argv):
         default="report.json"
     )
 
-    return ap.parse_args(sys_argv)
+    check_subparser.add_argument(
+        "--records",
+        dest="records_path",
+        help="Records file with one entry per directory, written as results "
+        "are produced (format given by the suffix: .jsonl, .csv or .parquet)",
+        default=None,
+    )
+
+    check_subparser.add_argument(
+        "--ledger",
+        dest="ledger_path",
+        help="Submission ledger of the Python wrangler. Directories whose "
+        "jobs are still queued or running according to the ledger are skipped "
+        "rather than checked",
+        default=None,
+    )
+
+    check_subparser.add_argument(
+        "--sacct-command",
+        dest="sacct_command",
+        help="Command used to update the states of the queued or running "
+        "jobs of --ledger before they are used (an empty string uses the "
+        "recorded states)",
+        default="sacct",
+    )
+
+    check_subparser.add_argument(
+        "--workers",
+        dest="workers",
+        help="Number of threads used to read the required files "
+        "(defaults to the thread pool default)",
+        default=None,
+        type=int,
+    )
+
+    check_subparser.add_argument(
+        "--cache",
+        dest="use_cache",
+        default=False,
+        action="store_true",
+        help="If specified, skips directories which passed the check on a "
+        "previous run and whose required file did not change since",
+    )
+
+    check_subparser.add_argument(
+        "--cache-path",
+        dest="cache_path",
+        help="Location of the result cache (defaults to a hidden file next "
+        "to the search directory)",
+        default=None,
+    )
+
+    check_subparser.add_argument(
+        "--refresh-cache",
+        dest="refresh_cache",
+        default=False,
+        action="store_true",
+        help="If specified, ignores cached results and checks every "
+        "directory again, updating the cache",
+    )
+
+    check_subparser.add_argument(
+        "--clear-cache",
+        dest="clear_cache",
+        default=False,
+        action="store_true",
+        help="If specified, deletes every entry of the result cache before "
+        "running",
+    )
+
+    check_subparser.add_argument(
+        "--invalidate-cache",
+        dest="invalidate_cache",
+        action="append",
+        help="Directory whose cached result is deleted before running (can "
+        "be repeated)",
+        default=None,
+    )
+
+    check_subparser.add_argument(
+        "--max-depth",
+        dest="max_depth",
+        help="Maximum depth of the directory search (the search directory "
+        "is depth 0)",
+        default=None,
+        type=int,
+    )
+
+    check_subparser.add_argument(
+        "--use-index",
+        dest="use_index",
+        default=False,
+        action="store_true",
+        help="If specified, uses (and refreshes) a persistent index of the "
+        "search directory instead of walking the whole tree, so that "
+        "repeated searches only list directories which changed",
+    )
+
+    check_subparser.add_argument(
+        "--index-path",
+        dest="index_path",
+        help="Location of the directory index (defaults to a hidden file "
+        "next to the search directory)",
+        default=None,
+    )
+
+    check_subparser.add_argument(
+        "--exclude",
+        dest="exclude",
+        action="append",
+        help="Glob pattern of directory names to skip during the directory "
+        "search, together with everything below them (can be repeated)",
+        default=None,
+    )
+
+    # REPORT
+
+    report_subparser = subparsers.add_parser(
+        "report",
+        formatter_class=SortingHelpFormatter,
+        description="Classifies every directory containing the file name by "
+        "calculation type (VASP, FEFF), checks whether each calculation "
+        "finished successfully, and saves the successful and failed "
+        "directories of every type to a json file",
+    )
+
+    report_subparser.add_argument(
+        "action",
+        nargs="?",
+        choices=["run", "summarize"],
+        default="run",
+        help="Either run the report, or summarize the records file of a "
+        "previous report or check (see --records) without loading it into "
+        "memory",
+    )
+
+    report_subparser.add_argument(
+        "--directory",
+        dest="search_directory",
+        help="Directory to recursively search for the file name",
+        default=None,
+    )
+
+    report_subparser.add_argument(
+        "--filename",
+        dest="search_filename",
+        help="File to search for in order to collect directories",
+        default=None,
+    )
+
+    report_subparser.add_argument(
+        "--records",
+        dest="records_path",
+        help="Records file with one entry per directory, written as results "
+        "are produced (format given by the suffix: .jsonl, .csv or .parquet). "
+        "If specified, the lists of directories are not kept in memory and no "
+        "json report is written. Read by the summarize action",
+        default=None,
+    )
+
+    report_subparser.add_argument(
+        "--ledger",
+        dest="ledger_path",
+        help="Submission ledger of the Python wrangler. Directories whose "
+        "jobs are still queued or running according to the ledger are skipped "
+        "rather than checked",
+        default=None,
+    )
+
+    report_subparser.add_argument(
+        "--sacct-command",
+        dest="sacct_command",
+        help="Command used to update the states of the queued or running "
+        "jobs of --ledger before they are used (an empty string uses the "
+        "recorded states)",
+        default="sacct",
+    )
+
+    report_subparser.add_argument(
+        "--report-path",
+        dest="report_path",
+        help="Path to the report json file that will be saved",
+        default="report.json",
+    )
+
+    report_subparser.add_argument(
+        "--config",
+        dest="config_path",
+        help="json file of calculation types and completion checks which "
+        "are merged into the default configuration (see cmdr.matcher)",
+        default=None,
+    )
+
+    report_subparser.add_argument(
+        "--workers",
+        dest="workers",
+        help="Number of pool workers checking directories concurrently (0 "
+        "uses one per CPU)",
+        default=1,
+        type=int,
+    )
+
+    report_subparser.add_argument(
+        "--processes",
+        dest="processes",
+        default=False,
+        action="store_true",
+        help="If specified, uses a process pool instead of a thread pool",
+    )
+
+    report_subparser.add_argument(
+        "--chunksize",
+        dest="chunksize",
+        help="Number of directories sent to a worker at once (defaults to "
+        "about four chunks per worker)",
+        default=None,
+        type=int,
+    )
+
+    report_subparser.add_argument(
+        "--cache",
+        dest="use_cache",
+        default=False,
+        action="store_true",
+        help="If specified, skips directories which were successful on a "
+        "previous run and whose output files did not change since",
+    )
+
+    report_subparser.add_argument(
+        "--cache-path",
+        dest="cache_path",
+        help="Location of the result cache (defaults to a hidden file next "
+        "to the search directory)",
+        default=None,
+    )
+
+    report_subparser.add_argument(
+        "--refresh-cache",
+        dest="refresh_cache",
+        default=False,
+        action="store_true",
+        help="If specified, ignores cached results and checks every "
+        "directory again, updating the cache",
+    )
+
+    report_subparser.add_argument(
+        "--clear-cache",
+        dest="clear_cache",
+        default=False,
+        action="store_true",
+        help="If specified, deletes every entry of the result cache before "
+        "running",
+    )
+
+    report_subparser.add_argument(
+        "--invalidate-cache",
+        dest="invalidate_cache",
+        action="append",
+        help="Directory whose cached result is deleted before running (can "
+        "be repeated)",
+        default=None,
+    )
+
+    report_subparser.add_argument(
+        "--max-depth",
+        dest="max_depth",
+        help="Maximum depth of the directory search (the search directory "
+        "is depth 0)",
+        default=None,
+        type=int,
+    )
+
+    report_subparser.add_argument(
+        "--use-index",
+        dest="use_index",
+        default=False,
+        action="store_true",
+        help="If specified, uses (and refreshes) a persistent index of the "
+        "search directory instead of walking the whole tree, so that "
+        "repeated searches only list directories which changed",
+    )
+
+    report_subparser.add_argument(
+        "--index-path",
+        dest="index_path",
+        help="Location of the directory index (defaults to a hidden file "
+        "next to the search directory)",
+        default=None,
+    )
+
+    report_subparser.add_argument(
+        "--exclude",
+        dest="exclude",
+        action="append",
+        help="Glob pattern of directory names to skip during the directory "
+        "search, together with everything below them (can be repeated)",
+        default=None,
+    )
+
+    args = ap.parse_args(sys_argv)
+    if args.runtype == "wrangle":
+        if args.retry and args.no_ledger:
+            wrangle_subparser.error("--retry cannot be used with --no-ledger")
+        if args.no_chain and args.no_ledger:
+            wrangle_subparser.error(
+                "--no-chain cannot be used with --no-ledger"
+            )
+        if args.campaigns_path is not None and args.no_ledger:
+            wrangle_subparser.error(
+                "--campaigns cannot be used with --no-ledger"
+            )
+    if args.runtype == "report":
+        if args.action == "summarize":
+            if args.records_path is None:
+                report_subparser.error("summarize requires --records")
+        else:
+            for flag, value in [
+                ("--directory", args.search_directory),
+                ("--filename", args.search_filename),
+            ]:
+                if value is None:
+                    report_subparser.error(f"{flag} is required")
+    if args.runtype == "tether":
+        if args.resume:
+            if args.tether_directory is None:
+                tether_subparser.error("--resume requires --tether-directory")
+        else:
+            for flag, value in [
+                ("--filename", args.filename),
+                ("--directory", args.search_directory),
+                ("--exe-line", args.executable_lines),
+                ("--slurm-line", args.slurm_lines),
+            ]:
+                if value is None:
+                    tether_subparser.error(f"{flag} is required")
+    return args
+
+
+def _wrangle(args):
+    from rich.pretty import pprint
+
+    from cmdr.file_utils import run_command
+
+    if args.loop or args.daemon:
+        from cmdr.campaigns import load_campaigns, make_campaign
+        from cmdr.ledger import Ledger, default_ledger_path
+        from cmdr.slurm import SlurmBackend
+        from cmdr.wrangler import Wrangler, daemonize
+
+        defaults = {
+            "order": args.order,
+            "priority_file": args.priority_file,
+            "cost_csv": args.cost_csv,
+            "timings": args.timings,
+            "size_file": args.size_file,
+        }
+        if args.campaigns_path is not None:
+            campaigns = load_campaigns(args.campaigns_path, defaults)
+        else:
+            campaigns = [make_campaign(args.directory, **defaults)]
+
+        if args.daemon:
+            log_file = args.log_file
+            if log_file is None:
+                log_file = Path(args.directory) / "wrangler.log"
+            daemonize(Path(log_file).absolute(), args.pid_file)
+        ledger = None
+        resubmitter = None
+        if not args.no_ledger:
+            ledger_path = args.ledger_path
+            if ledger_path is None:
+                ledger_path = default_ledger_path(args.directory)
+            ledger = Ledger(ledger_path)
+        if args.retry:
+            from cmdr.matcher import load_config
+            from cmdr.report import CONFIG
+            from cmdr.retry import Resubmitter, load_rules, report_checker
+            from cmdr.wrangler import log
+
+            config = CONFIG
+            if args.config_path is not None:
+                config = load_config(args.config_path)
+            resubmitter = Resubmitter(
+                ledger,
+                target_file=args.target_file,
+                rules=load_rules(args.retry_rules_path),
+                checker=report_checker(config["out"], config["in"]),
+                log=log,
+            )
+        wrangler = Wrangler(
+            args.directory,
+            args.maxjobs,
+            SlurmBackend(
+                args.user,
+                sbatch=args.sbatch_command,
+                squeue=args.squeue_command,
+                sacct=args.sacct_command,
+                concurrency=args.submit_concurrency,
+            ),
+            target_file=args.target_file,
+            min_interval=args.min_interval,
+            max_interval=args.max_interval,
+            rescan_interval=args.rescan_interval,
+            array=args.array,
+            array_size=args.array_size,
+            array_throttle=args.array_throttle,
+            ledger=ledger,
+            resubmitter=resubmitter,
+            depends_file=args.depends_file,
+            chain=not args.no_chain,
+            campaigns=campaigns,
+        )
+        try:
+            wrangler.run()
+        finally:
+            if ledger is not None:
+                ledger.close()
+        return
+
+    script_path = Path(__file__).parent / "scripts" / "slurm_wrangler.sh"
+    s = f"{script_path} --user={args.user} --directory={args.directory} " \
+        f"--maxjobs={args.maxjobs}"
+    if args.other_args is not None:
+        s += f" {args.other_args}"
+    out = run_command(s)
+    if out["exitcode"] != 0:
+        pprint(out)
+        raise RuntimeError("Error with slurm_wrangler")
+    pprint(out["stdout"])
+
+
+def _tether(args):
+    from cmdr.tether import tether_constructor, tether_resume
+
+    if args.resume:
+        tether_resume(
+            args.tether_directory,
+            calculations_per_staged_job=args.calculations_per_staged_job,
+        )
+        return
+
+    slurm_lines = [xx.split("=") for xx in args.slurm_lines]
+    slurm_lines = {key: value for (key, value) in slurm_lines}
+    if args.tether_directory is None:
+        tether_directory = f"{args.search_directory}_tether"
+    else:
+        tether_directory = args.tether_directory
+    tether_constructor(
+        args.search_directory,
+        args.filename,
+        tether_directory,
+        args.calculations_per_staged_job,
+        slurm_lines,
+        args.post_slurm_lines,
+        args.executable_lines,
+        max_depth=args.max_depth,
+        exclude=args.exclude,
+        use_index=args.use_index,
+        index_path=args.index_path,
+        parallel=args.parallel,
+        cost_csv=args.cost_csv,
+        timings=args.timings,
+        size_file=args.size_file,
+        target_walltime=args.target_walltime,
+        work_queue=args.work_queue,
+    )
+
+
+def _check(args):
+    from cmdr.check import check
+
+    check(
+        args.search_directory,
+        args.search_filename,
+        args.require_filename,
+        args.require_text,
+        args.report_path,
+        max_depth=args.max_depth,
+        exclude=args.exclude,
+        use_index=args.use_index,
+        index_path=args.index_path,
+        workers=args.workers,
+        use_cache=args.use_cache,
+        cache_path=args.cache_path,
+        refresh_cache=args.refresh_cache,
+        clear_cache=args.clear_cache,
+        invalidate_cache=args.invalidate_cache,
+        records_path=args.records_path,
+        ledger_path=args.ledger_path,
+        sacct=args.sacct_command or None,
+    )
+
+
+def _report(args):
+    if args.action == "summarize":
+        from cmdr.records import print_summary, summarize
+
+        print_summary(summarize(args.records_path))
+        return
+
+    from cmdr.file_utils import save_json
+    from cmdr.matcher import load_config
+    from cmdr.report import CONFIG, generate_report
+
+    config = CONFIG
+    if args.config_path is not None:
+        config = load_config(args.config_path)
+    report = generate_report(
+        args.search_directory,
+        args.search_filename,
+        output_files=config["out"],
+        input_files=config["in"],
+        max_depth=args.max_depth,
+        exclude=args.exclude,
+        use_index=args.use_index,
+        index_path=args.index_path,
+        use_cache=args.use_cache,
+        cache_path=args.cache_path,
+        refresh_cache=args.refresh_cache,
+        clear_cache=args.clear_cache,
+        invalidate_cache=args.invalidate_cache,
+        workers=args.workers if args.workers > 0 else None,
+        processes=args.processes,
+        chunksize=args.chunksize,
+        records_path=args.records_path,
+        keep_report=args.records_path is None,
+        ledger_path=args.ledger_path,
+        sacct=args.sacct_command or None,
+    )
+    if report is not None:
+        save_json(report, args.report_path)
+
+
+# Maps every subcommand to its handler, which imports the modules it needs
+SUBCOMMANDS = {
+    "wrangle": _wrangle,
+    "tether": _tether,
+    "check": _check,
+    "report": _report,
+}
+
+
+def _run(args):
+    """Runs the subcommand given by the parsed arguments.
+
+    Raises
+    ------
+    RuntimeError
+        If unknown runtime types are provided.
+    """
+
+    if args.runtype not in SUBCOMMANDS:
+        raise RuntimeError(f"Unknown runtime type {args.runtype}")
+    SUBCOMMANDS[args.runtype](args)
 
 
 def entrypoint(args=sys.argv[1:]):
@@ -204,46 +1134,33 @@ def entrypoint(args=sys.argv[1:]):
     """
 
     args = global_parser(args)
+
+    from rich.pretty import pprint
+
+    from cmdr.profiling import PROFILER
+
     pprint(args)
     print("-" * 80)
 
-    if args.runtype == "wrangle":
-        script_path = Path(__file__).parent / "scripts" / "slurm_wrangler.sh"
-        s = f"{script_path} --user={args.user} --directory={args.directory} " \
-            f"--maxjobs={args.maxjobs}"
-        if args.other_args is not None:
-            s += f" {args.other_args}"
-        out = run_command(s)
-        if out["exitcode"] != 0:
-            pprint(out)
-            raise RuntimeError("Error with slurm_wrangler")
-        pprint(out["stdout"])
-
-    elif args.runtype == "tether":
-        slurm_lines = [xx.split("=") for xx in args.slurm_lines]
-        slurm_lines = {key: value for (key, value) in slurm_lines}
-        if args.tether_directory is None:
-            tether_directory = f"{args.search_directory}_tether"
-        else:
-            tether_directory = args.tether_directory
-        tether_constructor(
-            args.search_directory,
-            args.filename,
-            tether_directory,
-            args.calculations_per_staged_job,
-            slurm_lines,
-            args.post_slurm_lines,
-            args.executable_lines,
+    if args.debug:
+        logging.basicConfig(
+            level=logging.DEBUG,
+            format="%(asctime)s %(levelname)s %(name)s:%(lineno)d "
+            "%(message)s",
         )
-
-    elif args.runtype == "check":
-        check(
-            args.search_directory,
-            args.search_filename,
-            args.require_filename,
-            args.require_text,
-            args.report_path,
-        )
-
     else:
-        raise RuntimeError(f"Unknown runtime type {args.runtype}")
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.profile:
+        PROFILER.enable(cprofile=args.cprofile_path is not None)
+    try:
+        _run(args)
+    finally:
+        if args.profile:
+            PROFILER.disable()
+            PROFILER.print_summary()
+            PROFILER.save(args.profile_path)
+            print(f"Saved profiling metrics to {args.profile_path}")
+            if args.cprofile_path is not None:
+                PROFILER.dump_cprofile(args.cprofile_path)
+                print(f"Saved cProfile statistics to {args.cprofile_path}")
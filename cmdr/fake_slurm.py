@@ -0,0 +1,380 @@
+"""A local stand-in for SLURM, used to test and tune the wrangler without
+burning real allocation.
+
+FakeSlurm models a cluster with a fixed number of slots, on which submitted
+jobs are started in FIFO order. Job arrays (--array=0-N%K) are expanded into
+one job per task, honoring the throttle K, and jobs submitted with
+--dependency=afterok:<id>:... only start once those jobs completed (or are
+cancelled if one of them did not, as with --kill-on-invalid-dep=yes). Every
+job runs for a (randomly perturbed) runtime and fails with a configurable
+probability. The queue is
+advanced lazily to the time returned by its clock whenever it is queried, so it
+can be driven either by the wall clock or by a simulated clock (see
+SimulatedClock), in which case a campaign of many hours is simulated in
+seconds.
+
+FakeSlurm has the same interface as cmdr.slurm.SlurmBackend, so it can be
+passed to cmdr.wrangler.Wrangler directly. It can also be run as a process
+which persists its state in a json file, standing in for the sbatch, squeue
+and sacct executables::
+
+    python -m cmdr.fake_slurm --state queue.json --slots 4 sbatch job.sbatch
+    python -m cmdr.fake_slurm --state queue.json squeue -u user -h -r -o %i
+    python -m cmdr.fake_slurm --state queue.json sacct -j 1,2 -n -P
+"""
+
+import argparse
+from collections import Counter, deque
+import fcntl
+import heapq
+import json
+from pathlib import Path
+import random
+import re
+import sys
+from time import time
+
+
+ARRAY_PATTERN = re.compile(r"--array=(\d+)-(\d+)(?:%(\d+))?")
+AFTEROK_PATTERN = re.compile(r"--dependency=afterok:([\d_:]+)")
+
+
+class SimulatedClock:
+    """A clock which only advances when sleep is called.
+
+    Parameters
+    ----------
+    start : float, optional
+        The initial time in seconds.
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeSlurm:
+    """In-process model of a SLURM queue.
+
+    Parameters
+    ----------
+    slots : int, optional
+        The number of jobs the cluster can run at once. Jobs beyond this are
+        queued (state PENDING).
+    runtime : float or callable, optional
+        The mean runtime of a job in seconds, or a callable mapping the job's
+        directory to its runtime.
+    runtime_spread : float, optional
+        Runtimes are drawn uniformly from runtime * (1 +/- runtime_spread).
+        Ignored if runtime is a callable.
+    failure_rate : float, optional
+        The probability that a job ends in state FAILED rather than COMPLETED.
+    seed : int, optional
+        Seed of the random number generator.
+    clock : callable, optional
+        Returns the current time in seconds. Default is time.time.
+    """
+
+    def __init__(
+        self,
+        slots=40,
+        runtime=600.0,
+        runtime_spread=0.5,
+        failure_rate=0.0,
+        seed=None,
+        clock=time,
+    ):
+        self.slots = slots
+        self.runtime = runtime
+        self.runtime_spread = runtime_spread
+        self.failure_rate = failure_rate
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.jobs = dict()
+        self.history = []
+        self._next_id = 1
+        self._queue = deque()
+        self._running = []
+        self._array_running = Counter()
+        self._time = clock()
+
+    # --- Simulation ---
+
+    def _record(self, t):
+        entry = (t, len(self._running), len(self._queue))
+        if self.history and self.history[-1][0] == t:
+            self.history[-1] = entry
+        else:
+            self.history.append(entry)
+
+    def _advance(self):
+        """Processes every job start and end up to the current time."""
+
+        now = self.clock()
+        while True:
+            job = None
+            if len(self._running) < self.slots:
+                job = self._next_eligible()
+            if job is not None:
+                job["start"] = max(job["submit"], self._time)
+                job["end"] = job["start"] + job["runtime"]
+                job["state"] = "RUNNING"
+                heapq.heappush(self._running, (job["end"], job["id"]))
+                if job["array"] is not None:
+                    self._array_running[job["array"]] += 1
+                self._record(job["start"])
+            elif self._running and self._running[0][0] <= now:
+                end, job_id = heapq.heappop(self._running)
+                job = self.jobs[job_id]
+                if job["array"] is not None:
+                    self._array_running[job["array"]] -= 1
+                job["state"] = "FAILED" if job["fails"] else "COMPLETED"
+                self._time = end
+                if job["fails"]:
+                    self._cancel_dependents()
+                self._record(end)
+            else:
+                break
+        self._time = max(self._time, now)
+
+    def _next_eligible(self):
+        """Removes and returns the first queued job which is not held back by
+        the throttle of its job array or by its dependencies, if any."""
+
+        for ii, job_id in enumerate(self._queue):
+            job = self.jobs[job_id]
+            throttle = job["throttle"]
+            running = self._array_running[job["array"]]
+            after = job.get("after") or []
+            if any(self.jobs[dd]["state"] != "COMPLETED" for dd in after):
+                continue
+            if throttle is None or running < throttle:
+                del self._queue[ii]
+                return job
+        return None
+
+    def _cancel_dependents(self):
+        """Cancels the queued jobs depending on a job which failed (or was
+        cancelled itself)."""
+
+        cancelled = True
+        while cancelled:
+            cancelled = False
+            for job_id in list(self._queue):
+                job = self.jobs[job_id]
+                after = job.get("after") or []
+                if any(
+                    self.jobs[dd]["state"] in ("FAILED", "CANCELLED")
+                    for dd in after
+                ):
+                    self._queue.remove(job_id)
+                    job["state"] = "CANCELLED"
+                    cancelled = True
+
+    def _sample_runtime(self, directory):
+        if callable(self.runtime):
+            return float(self.runtime(directory))
+        spread = self.random.uniform(-1.0, 1.0) * self.runtime_spread
+        return self.runtime * (1.0 + spread)
+
+    # --- SlurmBackend interface ---
+
+    def submit(self, directory, script, options=None):
+        """Queues a job, or every task of a job array if options contain
+        --array.
+
+        Returns
+        -------
+        str
+            The job ID.
+        """
+
+        self._advance()
+        job_id = str(self._next_id)
+        self._next_id += 1
+
+        array = None
+        after = []
+        for option in options or []:
+            array = ARRAY_PATTERN.fullmatch(option) or array
+            match = AFTEROK_PATTERN.fullmatch(option)
+            if match is not None:
+                after += [
+                    dd for dd in match.group(1).split(":") if dd in self.jobs
+                ]
+        if array is None:
+            tasks = [(job_id, str(directory))]
+            throttle = None
+        else:
+            first, last = int(array.group(1)), int(array.group(2))
+            tasks = [
+                (f"{job_id}_{ii}", f"{directory}[{ii}]")
+                for ii in range(first, last + 1)
+            ]
+            throttle = array.group(3)
+            throttle = int(throttle) if throttle is not None else None
+
+        for task_id, task_directory in tasks:
+            self.jobs[task_id] = {
+                "id": task_id,
+                "array": job_id if array is not None else None,
+                "throttle": throttle,
+                "directory": task_directory,
+                "script": script,
+                "submit": self._time,
+                "runtime": self._sample_runtime(task_directory),
+                "fails": self.random.random() < self.failure_rate,
+                "after": after,
+                "state": "PENDING",
+                "start": None,
+                "end": None,
+            }
+            self._queue.append(task_id)
+        self._cancel_dependents()
+        self._advance()
+        self._record(self._time)
+        return job_id
+
+    def submit_many(self, submissions):
+        """Queues every (directory, script, options) submission in turn.
+
+        Returns
+        -------
+        list of str
+            The job IDs.
+        """
+
+        return [
+            self.submit(directory, script, options)
+            for directory, script, options in submissions
+        ]
+
+    def active_jobs(self):
+        """Returns the number of queued or running jobs."""
+
+        self._advance()
+        return len(self._queue) + len(self._running)
+
+    def job_states(self, job_ids):
+        """Returns the states of the provided jobs, as sacct would report
+        them.
+
+        Returns
+        -------
+        dict
+            Maps job IDs to states. Unknown jobs are omitted.
+        """
+
+        self._advance()
+        return {
+            job_id: self.jobs[job_id]["state"]
+            for job_id in job_ids
+            if job_id in self.jobs
+        }
+
+    # --- Persistence ---
+
+    def state_dict(self):
+        """The state of the queue as a json-serializable dict. Only supported
+        if runtime is a number."""
+
+        return {
+            "config": {
+                "slots": self.slots,
+                "runtime": self.runtime,
+                "runtime_spread": self.runtime_spread,
+                "failure_rate": self.failure_rate,
+            },
+            "jobs": self.jobs,
+            "next_id": self._next_id,
+            "time": self._time,
+            "queue": list(self._queue),
+            "running": self._running,
+            "random": self.random.getstate(),
+        }
+
+    def load_state_dict(self, d):
+        for key, value in d["config"].items():
+            setattr(self, key, value)
+        self.jobs = d["jobs"]
+        self._next_id = d["next_id"]
+        self._time = d["time"]
+        self._queue = deque(d["queue"])
+        self._running = [tuple(xx) for xx in d["running"]]
+        heapq.heapify(self._running)
+        self._array_running = Counter(
+            self.jobs[job_id]["array"]
+            for _, job_id in self._running
+            if self.jobs[job_id]["array"] is not None
+        )
+        state = d["random"]
+        self.random.setstate((state[0], tuple(state[1]), state[2]))
+
+
+def main(argv=sys.argv[1:]):
+    """Command line stand-in for sbatch, squeue and sacct. Only the output
+    formats used by cmdr are produced: squeue prints one job ID per line, and
+    sacct prints JobID|State|ExitCode lines. The queue configuration (slots,
+    runtime, ...) is taken from the arguments of the first call, which
+    creates the state file, and is persisted from then on."""
+
+    ap = argparse.ArgumentParser(prog="python -m cmdr.fake_slurm")
+    ap.add_argument("--state", required=True, help="State json file")
+    ap.add_argument("--slots", type=int, default=40)
+    ap.add_argument("--runtime", type=float, default=600.0)
+    ap.add_argument("--runtime-spread", type=float, default=0.5)
+    ap.add_argument("--failure-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("command", choices=["sbatch", "squeue", "sacct"])
+    ap.add_argument("args", nargs=argparse.REMAINDER)
+    args = ap.parse_args(argv)
+
+    slurm = FakeSlurm(
+        slots=args.slots,
+        runtime=args.runtime,
+        runtime_spread=args.runtime_spread,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+    )
+    state_path = Path(args.state)
+    with open(state_path, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        content = f.read()
+        if content:
+            slurm.load_state_dict(json.loads(content))
+
+        if args.command == "sbatch":
+            script = [xx for xx in args.args if not xx.startswith("-")][-1]
+            options = [xx for xx in args.args if xx.startswith("-")]
+            job_id = slurm.submit(Path.cwd(), script, options)
+            print(f"Submitted batch job {job_id}")
+        elif args.command == "squeue":
+            slurm._advance()
+            for job_id in list(slurm._queue) + [
+                job_id for _, job_id in sorted(slurm._running)
+            ]:
+                print(job_id)
+        else:
+            job_ids = []
+            for ii, xx in enumerate(args.args):
+                if xx == "-j" and ii + 1 < len(args.args):
+                    job_ids = args.args[ii + 1].split(",")
+                elif xx.startswith("--jobs="):
+                    job_ids = xx.split("=", 1)[1].split(",")
+            for job_id, state in slurm.job_states(job_ids).items():
+                exitcode = "1:0" if state == "FAILED" else "0:0"
+                print(f"{job_id}|{state}|{exitcode}")
+
+        f.seek(0)
+        f.truncate()
+        json.dump(slurm.state_dict(), f)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,56 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from fnmatch import fnmatchcase
 import json
+import mmap
+import os
 from pathlib import Path
+import re
+import signal
 from subprocess import Popen, PIPE
 from time import time
 
+from cmdr.compression import is_compressed, iter_blocks, resolve_path, tail
+from cmdr.profiling import PROFILER, timed
 
+
+# Files at least this large are searched through a memory map, smaller ones
+# through buffered block reads
+MMAP_THRESHOLD = 4 * 1024 * 1024
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Block size used when seeking backwards from the end of a file
+TAIL_BLOCK_SIZE = 64 * 1024
+
+# Defaults of the batch command runner (see run_commands): the number of
+# commands run at once, and the number of bytes of stdout and stderr kept per
+# command
+COMMAND_CONCURRENCY = 8
+MAX_COMMAND_OUTPUT = 1024 * 1024
+
+# Characters which are special in a POSIX basic regular expression (as used
+# by grep). Patterns without them are searched for as literal text.
+BRE_SPECIAL = set(".[]*^$\\")
+
+# Characters which are special when escaped in a GNU basic regular expression,
+# and literal otherwise (the other way round in Python)
+BRE_ESCAPED = set("(){}|+?")
+
+# POSIX character classes in bracket expressions
+POSIX_CLASSES = {
+    "[:alnum:]": "a-zA-Z0-9",
+    "[:alpha:]": "a-zA-Z",
+    "[:blank:]": " \\t",
+    "[:digit:]": "0-9",
+    "[:lower:]": "a-z",
+    "[:punct:]": "!-/:-@\\[-`{-~",
+    "[:space:]": " \\t\\n\\r\\f\\v",
+    "[:upper:]": "A-Z",
+    "[:xdigit:]": "0-9A-Fa-f",
+}
+
+
+@timed("write")
 def save_json(d, path, indent=4, sort_keys=False):
     """Saves a json file to the path specified.
 
@@ -41,16 +88,35 @@ def read_json(path):
     return dat
 
 
+def directory_key(directory):
+    """The key identifying a directory in the ledger, the result cache and
+    the runtime estimates: its absolute path as a str, so that relative and
+    absolute paths (or str and os.PathLike) of the same directory match.
+
+    Parameters
+    ----------
+    directory : os.PathLike
+
+    Returns
+    -------
+    str
+    """
+
+    return os.path.abspath(str(directory))
+
+
+@timed("subprocess")
 def run_command(cmd):
     """Execute the external shell command and get its exitcode, stdout and
     stderr. Also returns the amount of time the command took to execute. The
     command you pass to run_command should be basically the same as using the
-    command line shell.
+    command line shell. To run many commands, see run_commands.
 
     Parameters
     ----------
-    cmd : str
-        The command to run.
+    cmd : str or list of str
+        The command to run. A list of arguments is executed directly, without
+        a shell.
 
     Returns
     -------
@@ -62,7 +128,8 @@ def run_command(cmd):
     """
 
     t0 = time()
-    proc = Popen(cmd, stdout=PIPE, stderr=PIPE, shell=True)
+    PROFILER.count("subprocesses")
+    proc = Popen(cmd, stdout=PIPE, stderr=PIPE, shell=isinstance(cmd, str))
     out, err = proc.communicate()
     exitcode = proc.returncode
     dt = time() - t0
@@ -75,11 +142,331 @@ def run_command(cmd):
     }
 
 
-def exhaustive_directory_search(root, filename, return_filename=False):
+async def _read_bounded(stream, buffer, limit):
+    """Reads a stream to its end, keeping at most limit bytes (all of them if
+    limit is None) in buffer (a dict with the keys "data" and "truncated")."""
+
+    while True:
+        chunk = await stream.read(READ_BLOCK_SIZE)
+        if not chunk:
+            return
+        if limit is None:
+            buffer["data"] += chunk
+            continue
+        room = limit - len(buffer["data"])
+        if len(chunk) > room:
+            buffer["truncated"] = True
+        if room > 0:
+            buffer["data"] += chunk[:room]
+
+
+async def _run_one(cmd, semaphore, timeout, max_output, cwd):
+    """Runs a single command of a batch (see run_commands)."""
+
+    async with semaphore:
+        t0 = time()
+        PROFILER.count("subprocesses")
+        try:
+            # In its own session, so that a timeout kills the whole process
+            # group (including the children of a shell, which would otherwise
+            # keep the pipes open)
+            kwargs = {
+                "stdout": PIPE,
+                "stderr": PIPE,
+                "cwd": cwd,
+                "start_new_session": True,
+            }
+            if isinstance(cmd, str):
+                proc = await asyncio.create_subprocess_shell(cmd, **kwargs)
+            else:
+                proc = await asyncio.create_subprocess_exec(
+                    *[str(xx) for xx in cmd], **kwargs
+                )
+        except OSError as error:
+            # Mirror the shell, which reports a missing executable as 127
+            return {
+                "exitcode": 127,
+                "stdout": "",
+                "stderr": str(error),
+                "dt": time() - t0,
+                "timed_out": False,
+                "truncated": False,
+            }
+
+        out = {"data": b"", "truncated": False}
+        err = {"data": b"", "truncated": False}
+        timed_out = False
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    _read_bounded(proc.stdout, out, max_output),
+                    _read_bounded(proc.stderr, err, max_output),
+                    proc.wait(),
+                ),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            timed_out = True
+        finally:
+            # Also reached if the batch is cancelled
+            if proc.returncode is None or timed_out:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                await proc.wait()
+        dt = time() - t0
+        if PROFILER.enabled:
+            PROFILER.add_time("subprocess", dt, 0.0)
+
+    return {
+        "exitcode": proc.returncode,
+        "stdout": out["data"].decode("utf-8", errors="replace").strip(),
+        "stderr": err["data"].decode("utf-8", errors="replace").strip(),
+        "dt": dt,
+        "timed_out": timed_out,
+        "truncated": out["truncated"] or err["truncated"],
+    }
+
+
+async def _iter_commands(commands, concurrency, timeout, max_output, cwd):
+    commands = list(commands)
+    if cwd is None or isinstance(cwd, (str, os.PathLike)):
+        cwd = [cwd] * len(commands)
+    if len(cwd) != len(commands):
+        raise ValueError("cwd must have one entry per command")
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _indexed(index):
+        result = await _run_one(
+            commands[index], semaphore, timeout, max_output, cwd[index]
+        )
+        return index, result
+
+    tasks = [
+        asyncio.ensure_future(_indexed(index))
+        for index in range(len(commands))
+    ]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def iter_commands(
+    commands,
+    concurrency=COMMAND_CONCURRENCY,
+    timeout=None,
+    max_output=MAX_COMMAND_OUTPUT,
+    cwd=None,
+):
+    """Runs many external commands concurrently on an asyncio event loop, and
+    yields their results as they complete.
+
+    Parameters
+    ----------
+    commands : iterable
+        Every command is either a str, which is run through the shell (like
+        run_command), or a list of arguments, which is executed directly
+        without a shell (and therefore needs no quoting).
+    concurrency : int, optional
+        The maximum number of commands running at once.
+    timeout : float, optional
+        The time in seconds after which a command is killed. Default is no
+        timeout.
+    max_output : int, optional
+        The maximum number of bytes of stdout and of stderr kept per command.
+        The rest of the output is read and discarded, so that a command with
+        huge output neither blocks nor exhausts memory. If None, the whole
+        output is kept.
+    cwd : os.PathLike or list, optional
+        The directory to run the commands in, or a list of directories, one
+        per command. Default is the current directory.
+
+    Yields
+    ------
+    tuple
+        The index of the command in commands and its result, a dict like
+        that of run_command with the additional keys 'timed_out' and
+        'truncated'. The exit code of a command which was killed is negative.
+        If the executable of a list of arguments does not exist, its exit code
+        is 127.
+    """
+
+    loop = asyncio.new_event_loop()
+    batch = _iter_commands(commands, concurrency, timeout, max_output, cwd)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(batch.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        # Kills the remaining commands if the caller stopped early
+        loop.run_until_complete(batch.aclose())
+        loop.close()
+
+
+def run_commands(
+    commands,
+    concurrency=COMMAND_CONCURRENCY,
+    timeout=None,
+    max_output=MAX_COMMAND_OUTPUT,
+    cwd=None,
+):
+    """Runs many external commands concurrently (see iter_commands for the
+    parameters).
+
+    Returns
+    -------
+    list of dict
+        The results, in the order of commands.
+    """
+
+    commands = list(commands)
+    results = [None] * len(commands)
+    for index, result in iter_commands(
+        commands, concurrency, timeout, max_output, cwd
+    ):
+        results[index] = result
+    return results
+
+
+def _matches_any(name, patterns):
+    return any(fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def _scan_directory(path, filename, exclude, descend, listing=False):
+    """Lists a single directory with os.scandir. Returns the entry names
+    matching filename and the subdirectories which should be descended into
+    (symlinked directories are not followed, matching Path.rglob), as well as
+    the names of all entries if listing is True (else None). Directories
+    which cannot be listed (permissions, removed mid-walk) are skipped."""
+
+    matches = []
+    subdirs = []
+    names = [] if listing else None
+    PROFILER.count("directories_listed")
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if listing:
+                    names.append(entry.name)
+                if fnmatchcase(entry.name, filename):
+                    matches.append(entry.name)
+                if not descend:
+                    continue
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir and not _matches_any(entry.name, exclude):
+                    subdirs.append(entry.path)
+    except OSError:
+        pass
+    return matches, subdirs, names
+
+
+def walk_directories(
+    root,
+    filename,
+    return_filename=False,
+    max_depth=None,
+    exclude=None,
+    workers=None,
+    return_listing=False,
+):
+    """Generator version of the exhaustive directory search. The tree is
+    listed with os.scandir, and subtrees are scanned concurrently on a thread
+    pool, which on parallel filesystems (GPFS, Lustre) hides most of the
+    metadata latency. Results are yielded as soon as they are found, so the
+    order is not deterministic.
+
+    Parameters
+    ----------
+    root : os.PathLike
+        The path (absolute or relative) to the directory from which to conduct
+        the exhaustive search.
+    filename : str
+        The name of the file which identifies a directory as one of interest.
+        Glob patterns (e.g. "*.sbatch") are accepted.
+    return_filename : bool, optional
+        If False, yields the directory in which the file is found (once per
+        directory). Else, yields the matching files themselves.
+    max_depth : int, optional
+        The maximum depth of directories to search, where the root itself is
+        at depth 0. Default is None (no limit).
+    exclude : list of str, optional
+        Glob patterns matched against directory names. Matching directories
+        and everything below them are pruned from the search (e.g.
+        ["*_tether", "scratch"]).
+    workers : int, optional
+        The number of threads used to list directories. Default is None, which
+        uses the ThreadPoolExecutor default.
+    return_listing : bool, optional
+        If True, yields (directory, names) tuples instead, where names lists
+        every entry of the directory as found during the walk, so that callers
+        inspecting the directory contents do not have to list it again.
+        Ignores return_filename. Default is False.
+
+    Yields
+    ------
+    pathlib.Path or tuple
+    """
+
+    exclude = list(exclude) if exclude is not None else []
+    root = str(root)
+
+    def _submit(executor, path, depth):
+        descend = max_depth is None or depth < max_depth
+        future = executor.submit(
+            _scan_directory, path, filename, exclude, descend, return_listing
+        )
+        pending[future] = (path, depth)
+
+    pending = dict()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        _submit(executor, root, 0)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, depth = pending.pop(future)
+                matches, subdirs, names = future.result()
+                for subdir in subdirs:
+                    _submit(executor, subdir, depth + 1)
+                if not matches:
+                    continue
+                if return_listing:
+                    yield Path(path), names
+                elif return_filename:
+                    for match in matches:
+                        yield Path(path) / match
+                else:
+                    yield Path(path)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+@timed("walk")
+def exhaustive_directory_search(
+    root,
+    filename,
+    return_filename=False,
+    max_depth=None,
+    exclude=None,
+    workers=None,
+    use_index=False,
+    index_path=None,
+):
     """Executes an exhaustive, recursive directory search of all downstream
     directories, finding directories which contain a file matching the provided
-    file name query string.
-    
+    file name query string. See walk_directories for the streaming version.
+
     Parameters
     ----------
     root : os.PathLike
@@ -91,16 +478,400 @@ def exhaustive_directory_search(root, filename, return_filename=False):
     return_filename : bool, optional
         If False, returns the directory in which the file is found. Else,
         returns the filenames themselves.
-    
+    max_depth : int, optional
+        The maximum search depth, where root is at depth 0.
+    exclude : list of str, optional
+        Glob patterns of directory names to prune from the search.
+    workers : int, optional
+        The number of threads used to list directories.
+    use_index : bool, optional
+        If True, refreshes and queries the persistent directory index of root
+        (see cmdr.index) instead of walking the entire tree. Default is False.
+    index_path : os.PathLike, optional
+        The location of the directory index, if use_index is True.
+
     Returns
     -------
     list
         A list of of os.PathLike directories containing the filename provided.
     """
 
-    if return_filename:
-        return [xx for xx in Path(root).rglob(filename)]
-    return [xx.parent for xx in Path(root).rglob(filename)]
+    if use_index:
+        from cmdr.index import indexed_directory_search
+
+        return indexed_directory_search(
+            root,
+            filename,
+            return_filename=return_filename,
+            max_depth=max_depth,
+            exclude=exclude,
+            workers=workers,
+            index_path=index_path,
+        )
+
+    return list(
+        walk_directories(
+            root,
+            filename,
+            return_filename=return_filename,
+            max_depth=max_depth,
+            exclude=exclude,
+            workers=workers,
+        )
+    )
+
+
+def imap_as_completed(function, iterable, workers=None, max_pending=None):
+    """Applies function to every item of iterable on a thread pool, yielding
+    results as they complete. At most max_pending items are submitted at any
+    given time, so arbitrarily long iterables (e.g. generators) can be
+    consumed in bounded memory.
+
+    Parameters
+    ----------
+    function : callable
+    iterable : iterable
+    workers : int, optional
+        The number of threads. Default is the ThreadPoolExecutor default.
+    max_pending : int, optional
+        The maximum number of items in flight. Default is 4 times the number
+        of workers.
+
+    Yields
+    ------
+    tuple
+        The item and the result of function(item), in completion order.
+    """
+
+    if workers is None:
+        workers = min(32, (os.cpu_count() or 1) + 4)
+    if max_pending is None:
+        max_pending = 4 * workers
+    iterator = iter(iterable)
+    pending = dict()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(function, item)] = item
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+@timed("read")
+def file_contains(
+    path, text, mmap_threshold=MMAP_THRESHOLD, block_size=READ_BLOCK_SIZE
+):
+    """Determines whether the file contains the provided text, reading it
+    in-process and stopping at the first match. Large files are searched via
+    a memory map, small files via buffered block reads. If the file does not
+    exist but a compressed version of it does (e.g. OUTCAR.gz), that is
+    searched instead, streaming its decompressed content (see
+    cmdr.compression).
+
+    Parameters
+    ----------
+    path : os.PathLike
+    text : str, bytes or re.Pattern
+        The literal text to search for (strings are UTF-8 encoded), or a
+        compiled bytes regular expression, which is matched line by line
+        (see grep_pattern).
+    mmap_threshold : int, optional
+        Files of at least this many bytes are memory mapped.
+    block_size : int, optional
+        The read size for files which are not memory mapped.
+
+    Returns
+    -------
+    bool
+    """
+
+    needle = text.encode("utf-8") if isinstance(text, str) else text
+    regex = isinstance(needle, re.Pattern)
+    search = _blocks_match if regex else _blocks_contain
+    path = resolve_path(path)
+    if is_compressed(path):
+        PROFILER.count("compressed_files_opened")
+        return search(iter_blocks(path, block_size), needle)
+    with open(path, "rb") as f:
+        PROFILER.count("files_opened")
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            # grep finds no line, not even an empty one, in an empty file
+            return False if regex else not needle
+        if size >= mmap_threshold:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if regex:
+                    PROFILER.count("bytes_read", size)
+                    end = size - 1 if mm[size - 1 :] == b"\n" else size
+                    return needle.search(mm, 0, end) is not None
+                found = mm.find(needle)
+                PROFILER.count("bytes_read", found + 1 if found >= 0 else size)
+                return found != -1
+        return search(iter(lambda: f.read(block_size), b""), needle)
+
+
+def _bracket_to_regex(pattern, start):
+    """Translates the bracket expression starting at pattern[start] (a "[")
+    and returns it with the index after its closing "]"."""
+
+    ii = start + 1
+    negate = ii < len(pattern) and pattern[ii] == "^"
+    ii += negate
+    body = ""
+    # A "]" right after the opening bracket is literal
+    if ii < len(pattern) and pattern[ii] == "]":
+        body += "\\]"
+        ii += 1
+    while ii < len(pattern) and pattern[ii] != "]":
+        for name, chars in POSIX_CLASSES.items():
+            if pattern.startswith(name, ii):
+                body += chars
+                ii += len(name)
+                break
+        else:
+            char = pattern[ii]
+            body += "\\" + char if char in "\\[" else char
+            ii += 1
+    if ii >= len(pattern):
+        raise ValueError(f"Unmatched [ in {pattern!r}")
+    # Like grep, which matches line by line, never match a newline
+    return ("[^" + body + "\\n]" if negate else "[" + body + "]"), ii + 1
+
+
+def bre_to_regex(pattern):
+    """Translates a (GNU) basic regular expression, as understood by grep,
+    into a Python regular expression.
+
+    Parameters
+    ----------
+    pattern : str
+
+    Returns
+    -------
+    str
+    """
+
+    regex = ""
+    ii = 0
+    while ii < len(pattern):
+        char = pattern[ii]
+        if char == "\\" and ii + 1 < len(pattern):
+            following = pattern[ii + 1]
+            if following in BRE_ESCAPED:
+                regex += following
+            elif following in "<>":
+                regex += "\\b"
+            else:
+                regex += "\\" + following
+            ii += 2
+            continue
+        if char == "[":
+            bracket, ii = _bracket_to_regex(pattern, ii)
+            regex += bracket
+            continue
+        if char in BRE_ESCAPED:
+            regex += "\\" + char
+        elif char == "*" and (not regex or regex.endswith(("^", "("))):
+            # A leading star is literal
+            regex += "\\*"
+        else:
+            regex += char
+        ii += 1
+    return regex
+
+
+def grep_pattern(text):
+    """Prepares text to be searched for like grep does (see file_contains).
+
+    Parameters
+    ----------
+    text : str
+        A basic regular expression (see bre_to_regex). Text without any
+        special characters is searched for literally, which is faster.
+
+    Returns
+    -------
+    bytes or re.Pattern
+    """
+
+    if not BRE_SPECIAL.intersection(text):
+        return text.encode("utf-8")
+    return re.compile(bre_to_regex(text).encode("utf-8"), re.MULTILINE)
+
+
+def _blocks_match(blocks, pattern):
+    """Searches consecutive blocks of bytes for a regular expression, line by
+    line, so that matches spanning block boundaries are found."""
+
+    carry = b""
+    found = False
+    try:
+        for block in blocks:
+            PROFILER.count("bytes_read", len(block))
+            buffer = carry + block
+            # Search the complete lines, without their final newline so that
+            # an empty match after it is not mistaken for an empty line
+            end = buffer.rfind(b"\n")
+            if end >= 0 and pattern.search(buffer, 0, end):
+                found = True
+                break
+            carry = buffer[end + 1 :]
+        else:
+            found = bool(carry) and pattern.search(carry) is not None
+    finally:
+        if hasattr(blocks, "close"):
+            blocks.close()
+    return found
+
+
+def _blocks_contain(blocks, needle):
+    """Searches consecutive blocks of bytes for the needle, including
+    occurrences spanning block boundaries."""
+
+    overlap = max(len(needle) - 1, 0)
+    carry = b""
+    found = len(needle) == 0
+    try:
+        for block in blocks:
+            PROFILER.count("bytes_read", len(block))
+            buffer = carry + block
+            if needle in buffer:
+                found = True
+                break
+            carry = buffer[-overlap:] if overlap else b""
+    finally:
+        if hasattr(blocks, "close"):
+            blocks.close()
+    return found
+
+
+@timed("read")
+def tail_bytes(path, n_bytes):
+    """Reads the last n_bytes of a file (or the whole file if it is smaller).
+    Compressed files are decompressed transparently (see file_contains).
+
+    Parameters
+    ----------
+    path : os.PathLike
+    n_bytes : int
+
+    Returns
+    -------
+    bytes
+    """
+
+    path = resolve_path(path)
+    if is_compressed(path):
+        PROFILER.count("compressed_files_opened")
+        if n_bytes <= 0:
+            return b""
+        data = tail(path, lambda d: len(d) >= n_bytes, max_bytes=n_bytes)
+        return data[-n_bytes:]
+    PROFILER.count("files_opened")
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        f.seek(max(size - n_bytes, 0))
+        data = f.read()
+        PROFILER.count("bytes_read", len(data))
+        return data
+
+
+@timed("read")
+def tail_lines(path, n_lines=100, block_size=TAIL_BLOCK_SIZE, max_bytes=None):
+    """Reads the last lines of a file in-process, equivalent to tail -n. The
+    file is read backwards from the end in fixed-size blocks until enough
+    lines have been found (or max_bytes have been read), so the cost does not
+    depend on the size of the file. Compressed files are decompressed
+    transparently (see file_contains and cmdr.compression.tail).
+
+    Parameters
+    ----------
+    path : os.PathLike
+    n_lines : int, optional
+        The number of lines to return. Default is 100.
+    block_size : int, optional
+        The number of bytes read per backwards seek.
+    max_bytes : int, optional
+        If provided, at most this many bytes are read from the end of the
+        file, even if fewer than n_lines lines were found. Note that the
+        first returned line may then be partial.
+
+    Returns
+    -------
+    list of str
+        The last n_lines lines, without line endings. Undecodable bytes are
+        replaced.
+    """
+
+    path = resolve_path(path)
+    if is_compressed(path):
+        PROFILER.count("compressed_files_opened")
+        data = tail(
+            path, lambda d: d.count(b"\n") > n_lines, max_bytes=max_bytes
+        )
+        if max_bytes is not None:
+            data = data[-max_bytes:] if max_bytes > 0 else b""
+        lines = data.decode("utf-8", errors="replace").splitlines()
+        return lines[-n_lines:] if n_lines > 0 else []
+
+    blocks = []
+    newlines = 0
+    PROFILER.count("files_opened")
+    with open(path, "rb") as f:
+        position = os.fstat(f.fileno()).st_size
+        budget = position if max_bytes is None else min(max_bytes, position)
+        # Note that a trailing newline does not start a new line, so we need
+        # n_lines + 1 newlines to be sure the first line is complete
+        while budget > 0 and newlines <= n_lines:
+            size = min(block_size, budget)
+            position -= size
+            budget -= size
+            f.seek(position)
+            block = f.read(size)
+            blocks.append(block)
+            PROFILER.count("bytes_read", len(block))
+            newlines += block.count(b"\n")
+    text = b"".join(reversed(blocks)).decode("utf-8", errors="replace")
+    lines = text.splitlines()
+    return lines[-n_lines:] if n_lines > 0 else []
+
+
+def file_nonempty(path):
+    """Whether the file exists and is not empty. For compressed files (see
+    file_contains), the decompressed content must not be empty.
+
+    Parameters
+    ----------
+    path : os.PathLike
+
+    Returns
+    -------
+    bool
+    """
+
+    path = resolve_path(path)
+    try:
+        if not is_compressed(path):
+            return path.stat().st_size > 0
+        blocks = iter_blocks(path, block_size=1)
+        try:
+            return next(blocks, b"") != b""
+        finally:
+            blocks.close()
+    except OSError:
+        return False
 
 
 def check_if_substring_match(lines, substring):
@@ -119,4 +890,4 @@ def check_if_substring_match(lines, substring):
         True if the substring was found in any of the lines. False otherwise.
     """
 
-    return any([substring in line for line in lines])
+    return any(substring in line for line in lines)
@@ -0,0 +1,349 @@
+"""Persistent on-disk index of a directory tree, so that repeated searches of a
+mostly static campaign tree do not have to list every directory again.
+
+The index is a small SQLite database which, by default, lives next to (not
+inside) the search root, e.g. ``/data/.campaign.cmdr-index.sqlite`` for a
+search root of ``/data/campaign``. It stores every directory of the tree with
+its mtime, and the entries matching each file name pattern that has been
+searched for. A directory's mtime only changes when entries are added,
+removed or renamed directly inside of it, so a refresh only has to stat the
+known directories; only those whose mtime changed are listed again, and only
+newly appearing subtrees are walked.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from fnmatch import fnmatchcase
+import json
+import os
+from pathlib import Path
+import sqlite3
+import stat
+from time import time
+
+from cmdr.file_utils import _matches_any
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS patterns (pattern TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    depth INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS matches (
+    pattern TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (pattern, path, name)
+);
+CREATE INDEX IF NOT EXISTS matches_path ON matches (path);
+"""
+
+# Directories modified less than this many seconds before they were listed
+# are stored as dirty, since a later change within the same mtime tick would
+# otherwise go unnoticed (coarse mtime resolution on some filesystems).
+RACY_SECONDS = 2.0
+
+# Maximum number of in-flight stat/list operations per worker thread
+MAX_PENDING_PER_WORKER = 64
+
+
+def default_index_path(root):
+    """The default location of the index for a given search root, which is a
+    hidden file in the parent directory of the root. Keeping the index out of
+    the tree avoids changing the root's mtime every time it is written.
+
+    Parameters
+    ----------
+    root : os.PathLike
+
+    Returns
+    -------
+    pathlib.Path
+    """
+
+    root = Path(root).absolute()
+    return root.parent / f".{root.name}.cmdr-index.sqlite"
+
+
+def _refresh_directory(root, rel, depth, old_mtime_ns, patterns, descend):
+    """Runs on a worker thread. Stats the directory and lists it if its mtime
+    differs from old_mtime_ns (or if old_mtime_ns is None)."""
+
+    path = os.path.join(root, rel)
+    try:
+        st = os.stat(path, follow_symlinks=False)
+    except OSError:
+        return "gone", rel, None, None
+    if not stat.S_ISDIR(st.st_mode):
+        return "gone", rel, None, None
+    if old_mtime_ns is not None and st.st_mtime_ns == old_mtime_ns:
+        return "unchanged", rel, None, None
+
+    mtime_ns = st.st_mtime_ns
+    if time() - st.st_mtime < RACY_SECONDS:
+        mtime_ns = -1
+
+    matches = {pattern: [] for pattern in patterns}
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                for pattern in patterns:
+                    if fnmatchcase(entry.name, pattern):
+                        matches[pattern].append(entry.name)
+                if not descend(entry.name, depth):
+                    continue
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    subdir = os.path.normpath(os.path.join(rel, entry.name))
+                    subdirs.append(subdir)
+    except OSError:
+        return "gone", rel, None, None
+    return "scanned", rel, (mtime_ns, depth, matches), subdirs
+
+
+class DirectoryIndex:
+    """SQLite-backed index of the directories below root.
+
+    Parameters
+    ----------
+    root : os.PathLike
+        The search root.
+    path : os.PathLike, optional
+        The location of the index database. Default is given by
+        default_index_path.
+    max_depth : int, optional
+        Maximum depth of the indexed tree (the root is at depth 0).
+    exclude : list of str, optional
+        Glob patterns of directory names pruned from the index.
+
+    Notes
+    -----
+    An index built with a different max_depth or exclude is discarded and
+    rebuilt from scratch.
+    """
+
+    def __init__(self, root, path=None, max_depth=None, exclude=None):
+        self.root = str(root)
+        self.path = default_index_path(root) if path is None else Path(path)
+        self.max_depth = max_depth
+        self.exclude = sorted(exclude) if exclude is not None else []
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.executescript(SCHEMA)
+        self._check_spec()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _check_spec(self):
+        spec = json.dumps(
+            {"max_depth": self.max_depth, "exclude": self.exclude}
+        )
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = 'spec'"
+        ).fetchone()
+        if row is not None and row[0] == spec:
+            return
+        with self.connection:
+            self.connection.execute("DELETE FROM directories")
+            self.connection.execute("DELETE FROM matches")
+            self.connection.execute("DELETE FROM patterns")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('spec', ?)", (spec,)
+            )
+
+    def _descend(self, name, depth):
+        if self.max_depth is not None and depth >= self.max_depth:
+            return False
+        return not _matches_any(name, self.exclude)
+
+    @property
+    def patterns(self):
+        rows = self.connection.execute("SELECT pattern FROM patterns")
+        return [row[0] for row in rows]
+
+    def refresh(self, filename=None, workers=None):
+        """Brings the index up to date with the filesystem. Every known
+        directory is stat'ed; directories whose mtime changed are listed
+        again and new subdirectories are walked.
+
+        Parameters
+        ----------
+        filename : str, optional
+            A file name pattern to track. If the pattern has not been searched
+            for before, every directory is listed once to populate it.
+        workers : int, optional
+            The number of threads used to stat and list directories.
+
+        Returns
+        -------
+        dict
+            Counts of directories which were "stat"ed, "listed", "added" and
+            "removed".
+        """
+
+        patterns = self.patterns
+        force = filename is not None and filename not in patterns
+        if force:
+            patterns.append(filename)
+
+        known = {
+            path: (mtime_ns, depth)
+            for path, mtime_ns, depth in self.connection.execute(
+                "SELECT path, mtime_ns, depth FROM directories"
+            )
+        }
+        if not known:
+            known_queue = deque([(".", 0, None)])
+        else:
+            known_queue = deque(
+                (path, depth, None if force else mtime_ns)
+                for path, (mtime_ns, depth) in known.items()
+            )
+
+        counts = {"stat": 0, "listed": 0, "added": 0, "removed": 0}
+        scanned = []
+        removed = []
+        if workers is None:
+            workers = min(32, (os.cpu_count() or 1) + 4)
+        max_pending = MAX_PENDING_PER_WORKER * workers
+        pending = dict()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            while known_queue or pending:
+                while known_queue and len(pending) < max_pending:
+                    rel, depth, old_mtime_ns = known_queue.popleft()
+                    future = executor.submit(
+                        _refresh_directory,
+                        self.root,
+                        rel,
+                        depth,
+                        old_mtime_ns,
+                        patterns,
+                        self._descend,
+                    )
+                    pending[future] = depth
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    depth = pending.pop(future)
+                    kind, rel, record, subdirs = future.result()
+                    counts["stat"] += 1
+                    if kind == "gone":
+                        removed.append(rel)
+                        continue
+                    if kind == "unchanged":
+                        continue
+                    counts["listed"] += 1
+                    scanned.append((rel, record))
+                    for subdir in subdirs:
+                        if subdir not in known:
+                            known[subdir] = (None, depth + 1)
+                            known_queue.append((subdir, depth + 1, None))
+                            counts["added"] += 1
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        with self.connection:
+            if force:
+                self.connection.execute(
+                    "INSERT INTO patterns VALUES (?)", (filename,)
+                )
+            for rel in removed:
+                self.connection.execute(
+                    "DELETE FROM directories WHERE path = ?", (rel,)
+                )
+                self.connection.execute(
+                    "DELETE FROM matches WHERE path = ?", (rel,)
+                )
+            for rel, (mtime_ns, depth, matches) in scanned:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO directories VALUES (?, ?, ?)",
+                    (rel, mtime_ns, depth),
+                )
+                self.connection.execute(
+                    "DELETE FROM matches WHERE path = ?", (rel,)
+                )
+                self.connection.executemany(
+                    "INSERT INTO matches VALUES (?, ?, ?)",
+                    [
+                        (pattern, rel, name)
+                        for pattern, names in matches.items()
+                        for name in names
+                    ],
+                )
+        counts["removed"] = len(removed)
+        return counts
+
+    def search(self, filename, return_filename=False):
+        """Returns the indexed matches for a file name pattern. Call refresh
+        first to bring the index up to date.
+
+        Parameters
+        ----------
+        filename : str
+        return_filename : bool, optional
+            If False, returns the directories containing a match. Else,
+            returns the matching files themselves.
+
+        Returns
+        -------
+        list of pathlib.Path
+        """
+
+        root = Path(self.root)
+        if return_filename:
+            rows = self.connection.execute(
+                "SELECT path, name FROM matches WHERE pattern = ?",
+                (filename,),
+            )
+            return [root / path / name for path, name in rows]
+        rows = self.connection.execute(
+            "SELECT DISTINCT path FROM matches WHERE pattern = ?", (filename,)
+        )
+        return [root if path == "." else root / path for (path,) in rows]
+
+
+def indexed_directory_search(
+    root,
+    filename,
+    return_filename=False,
+    max_depth=None,
+    exclude=None,
+    workers=None,
+    index_path=None,
+):
+    """Same as cmdr.file_utils.exhaustive_directory_search, but refreshes and
+    queries the on-disk DirectoryIndex of root instead of walking the entire
+    tree. The first call builds the index.
+
+    Parameters
+    ----------
+    root : os.PathLike
+    filename : str
+    return_filename : bool, optional
+    max_depth : int, optional
+    exclude : list of str, optional
+    workers : int, optional
+    index_path : os.PathLike, optional
+        Location of the index. Default is given by default_index_path.
+
+    Returns
+    -------
+    list
+    """
+
+    with DirectoryIndex(root, index_path, max_depth, exclude) as index:
+        index.refresh(filename, workers=workers)
+        return index.search(filename, return_filename=return_filename)
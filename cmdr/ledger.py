@@ -0,0 +1,364 @@
+"""Central submission ledger of the Python wrangler, replacing the QUEUED
+marker files written to every job directory.
+
+With markers, finding the jobs which still have to be submitted takes a stat
+of every job directory on every search, and every submission creates a file
+in the campaign tree; on parallel filesystems these metadata operations load
+the metadata server. The ledger instead keeps the submission state of every
+directory in a single SQLite database: the job ID, the submit time, the last
+known state, the number of submission attempts, the time of the last update
+and, once the finished job was checked, its outcome and the time after which
+it may be resubmitted (see cmdr.retry). The pending jobs of a cycle are then
+given by a single query, and a burst of submissions is written in a single
+transaction.
+
+Like the index and the result cache, the ledger lives next to (not inside)
+the wrangled directory by default. Existing QUEUED markers (written by
+scripts/slurm_wrangler.sh or by the wrangler without a ledger) are imported
+once, when the ledger is first used (see Ledger.migrate_markers).
+"""
+
+from pathlib import Path
+import sqlite3
+from time import time
+
+from cmdr.file_utils import directory_key
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS jobs (
+    directory TEXT PRIMARY KEY,
+    job_id TEXT,
+    submit_time REAL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated REAL,
+    outcome TEXT,
+    retry_after REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+CREATE INDEX IF NOT EXISTS jobs_job_id ON jobs (job_id);
+"""
+
+# Columns added after the first version of the schema, which are added to
+# existing ledgers when they are opened
+ADDED_COLUMNS = {"outcome": "TEXT", "retry_after": "REAL"}
+
+# The state of a job which was submitted, but whose state has not been
+# queried from the scheduler yet
+SUBMITTED = "SUBMITTED"
+
+# The state of a job imported from a QUEUED marker without a job ID, which
+# cannot be tracked
+UNKNOWN = "UNKNOWN"
+
+COLUMNS = [
+    "directory",
+    "job_id",
+    "submit_time",
+    "state",
+    "attempts",
+    "updated",
+    "outcome",
+    "retry_after",
+]
+
+
+def default_ledger_path(root):
+    """The default location of the ledger of a wrangled directory, which is a
+    hidden file next to it (see also cmdr.index.default_index_path).
+
+    Parameters
+    ----------
+    root : os.PathLike
+
+    Returns
+    -------
+    pathlib.Path
+    """
+
+    root = Path(root).absolute()
+    return root.parent / f".{root.name}.cmdr-ledger.sqlite"
+
+
+class Ledger:
+    """SQLite-backed submission state of the job directories.
+
+    Directories are stored as absolute paths, so the ledger does not depend on
+    the working directory of the wrangler.
+
+    Parameters
+    ----------
+    path : os.PathLike
+        The location of the ledger database.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.executescript(SCHEMA)
+        columns = {
+            row[1]
+            for row in self.connection.execute("PRAGMA table_info(jobs)")
+        }
+        with self.connection:
+            for column, kind in ADDED_COLUMNS.items():
+                if column not in columns:
+                    self.connection.execute(
+                        f"ALTER TABLE jobs ADD COLUMN {column} {kind}"
+                    )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_retry_after ON jobs (retry_after)"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        row = self.connection.execute("SELECT COUNT(*) FROM jobs").fetchone()
+        return row[0]
+
+    def __contains__(self, directory):
+        row = self.connection.execute(
+            "SELECT 1 FROM jobs WHERE directory = ?",
+            (directory_key(directory),),
+        ).fetchone()
+        return row is not None
+
+    def _get_meta(self, key):
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_meta(self, key, value):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value)
+            )
+
+    def get(self, directory):
+        """Returns the entry of a directory.
+
+        Returns
+        -------
+        dict or None
+            The directory, job ID, submit time, state, number of attempts,
+            time of the last update, outcome and the time after which it may
+            be resubmitted, or None if the directory was never submitted.
+        """
+
+        row = self.connection.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE directory = ?",
+            (directory_key(directory),),
+        ).fetchone()
+        return dict(zip(COLUMNS, row)) if row is not None else None
+
+    def _select(
+        self, columns, states=None, exclude_states=None, unresolved=False
+    ):
+        query = f"SELECT {', '.join(columns)} FROM jobs WHERE 1"
+        if unresolved:
+            query += " AND outcome IS NULL"
+        params = []
+        for operator, values in [("IN", states), ("NOT IN", exclude_states)]:
+            if values is not None:
+                values = list(values)
+                placeholders = ", ".join("?" * len(values))
+                query += f" AND state {operator} ({placeholders})"
+                params += values
+        return self.connection.execute(query + " ORDER BY directory", params)
+
+    def entries(self, states=None, exclude_states=None, unresolved=False):
+        """Returns the entries of every directory, optionally only of those in
+        (or not in) the given states, and only of those without an outcome if
+        unresolved is True.
+
+        Returns
+        -------
+        list of dict
+        """
+
+        rows = self._select(COLUMNS, states, exclude_states, unresolved)
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def directories(self, states=None, exclude_states=None):
+        """Returns the set of directories (as absolute paths) in the ledger,
+        optionally only those in (or not in) the given states."""
+
+        rows = self._select(["directory"], states, exclude_states)
+        return {row[0] for row in rows}
+
+    def states(self):
+        """Returns a dict mapping every directory to its last known state."""
+
+        rows = self._select(["directory", "state"])
+        return {directory: state for directory, state in rows}
+
+    def record_submissions(self, submissions, submit_time=None):
+        """Records submitted jobs in a single transaction. Resubmitting a
+        directory replaces its job ID, increments its number of attempts and
+        clears its outcome.
+
+        Parameters
+        ----------
+        submissions : list of tuple
+            The directory and job ID of every submission.
+        submit_time : float, optional
+            The unix time of the submissions. Default is now.
+        """
+
+        submit_time = time() if submit_time is None else submit_time
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO jobs "
+                "(directory, job_id, submit_time, state, attempts, updated) "
+                "VALUES (?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT (directory) DO UPDATE SET "
+                "job_id = excluded.job_id, "
+                "submit_time = excluded.submit_time, "
+                "state = excluded.state, "
+                "attempts = attempts + 1, "
+                "updated = excluded.updated, "
+                "outcome = NULL, "
+                "retry_after = NULL",
+                [
+                    (
+                        directory_key(directory),
+                        job_id,
+                        submit_time,
+                        SUBMITTED,
+                        submit_time,
+                    )
+                    for directory, job_id in submissions
+                ],
+            )
+
+    def set_states(self, states):
+        """Updates the last known state of directories.
+
+        Parameters
+        ----------
+        states : dict
+            Maps directories to their new state.
+        """
+
+        now = time()
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE jobs SET state = ?, updated = ? WHERE directory = ?",
+                [
+                    (state, now, directory_key(directory))
+                    for directory, state in states.items()
+                ],
+            )
+
+    def set_outcomes(self, outcomes):
+        """Records the outcome of finished jobs.
+
+        Parameters
+        ----------
+        outcomes : dict
+            Maps directories to (outcome, retry_after) tuples, where
+            retry_after is the unix time after which the job may be
+            resubmitted, or None if it must not be resubmitted.
+        """
+
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE jobs SET outcome = ?, retry_after = ? "
+                "WHERE directory = ?",
+                [
+                    (outcome, retry_after, directory_key(directory))
+                    for directory, (outcome, retry_after) in outcomes.items()
+                ],
+            )
+
+    def due(self, now=None):
+        """Returns the directories whose resubmission is due.
+
+        Parameters
+        ----------
+        now : float, optional
+            The current unix time. Default is now.
+
+        Returns
+        -------
+        list of str
+            The directories, in the order in which they became due.
+        """
+
+        now = time() if now is None else now
+        rows = self.connection.execute(
+            "SELECT directory FROM jobs WHERE retry_after <= ? "
+            "ORDER BY retry_after",
+            (now,),
+        )
+        return [row[0] for row in rows]
+
+    def remove(self, directories):
+        """Removes directories from the ledger, so that they are submitted
+        again."""
+
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM jobs WHERE directory = ?",
+                [(directory_key(directory),) for directory in directories],
+            )
+
+    @property
+    def migrated(self):
+        """Whether the QUEUED markers were already imported."""
+
+        return self._get_meta("migrated") is not None
+
+    def migrate_markers(self, directories, marker="QUEUED"):
+        """Imports the marker files of directories which are not in the ledger
+        yet. The job ID is read from the marker (if it contains one, otherwise
+        the state is UNKNOWN) and the submit time is the mtime of the marker.
+        Marks the ledger as migrated.
+
+        Parameters
+        ----------
+        directories : list of os.PathLike
+            The job directories, e.g. as found by the wrangler.
+        marker : str, optional
+            The name of the marker file.
+
+        Returns
+        -------
+        int
+            The number of imported markers.
+        """
+
+        known = self.directories()
+        imported = []
+        for directory in directories:
+            if directory_key(directory) in known:
+                continue
+            path = Path(directory) / marker
+            try:
+                submit_time = path.stat().st_mtime
+                job_id = path.read_text().strip() or None
+            except OSError:
+                continue
+            state = SUBMITTED if job_id is not None else UNKNOWN
+            imported.append(
+                (directory_key(directory), job_id, submit_time, state, time())
+            )
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO jobs "
+                "(directory, job_id, submit_time, state, attempts, updated) "
+                "VALUES (?, ?, ?, ?, 1, ?)",
+                imported,
+            )
+        self._set_meta("migrated", str(time()))
+        return len(imported)
@@ -0,0 +1,363 @@
+"""Compiled multi-pattern matching of output files, used to classify finished
+calculations (see cmdr.report).
+
+A completion check is a list of patterns, each of which applies to one output
+file. A pattern is either a required pattern, which must be found for the
+calculation to count as successful, or a negated ("must NOT contain")
+pattern, such as an error banner, whose presence marks the calculation as an
+error. Patterns are literal text by default, or regular expressions.
+
+All patterns of the same file are compiled into a single regular expression,
+so that every file is read once and scanned in a single pass, no matter how
+many patterns apply to it. The scan stops as soon as a negated pattern is
+found. Once every required pattern was found, the scan stops if there is no
+negated pattern, and otherwise only searches the rest of the text for the
+negated patterns. Regular expressions with backreferences, named groups or
+global inline flags, whose meaning would change in the combined expression,
+are searched for separately.
+
+Output files which were compressed in place (e.g. OUTCAR.gz) are read
+transparently (see cmdr.compression).
+
+Checks are written as in cmdr.report.CONFIG, where every element is either a
+list [filename, text] or [filename, text, n_bytes] (a required literal
+pattern; if text is None, the file only has to exist and be non-empty), or a
+dict with the keys
+
+* file: the output file name (required)
+* text: the literal text or regular expression (required)
+* regex: if true, text is a regular expression (default false)
+* negate: if true, the pattern must NOT be found (default false)
+* n_bytes: only search the last n_bytes of the file (default None)
+
+For example, a VASP check which also detects a crash could be::
+
+    [
+        ["OUTCAR", " General timing and accounting informations"],
+        {"file": "OUTCAR", "text": "VERY BAD NEWS", "negate": true},
+        {"file": "OUTCAR", "text": "ZBRENT: fatal error", "negate": true},
+    ]
+"""
+
+from copy import deepcopy
+import json
+from pathlib import Path
+import re
+
+from cmdr.file_utils import file_nonempty, tail_bytes, tail_lines
+from cmdr.profiling import timed
+
+
+SUCCESS = "success"
+FAIL = "fail"
+ERROR = "error"
+
+# A backreference to a numbered or named group
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+PLAIN_FLAGS = re.compile("", re.MULTILINE).flags
+
+
+def normalize_check(check):
+    """Converts a check to its dict form.
+
+    Parameters
+    ----------
+    check : list or dict
+        See the module documentation.
+
+    Returns
+    -------
+    dict
+        With the keys file, text, regex, negate and n_bytes.
+
+    Raises
+    ------
+    ValueError
+        If the check is malformed.
+    """
+
+    if isinstance(check, dict):
+        if "file" not in check or "text" not in check:
+            raise ValueError(f"Check {check} requires the keys file and text")
+        unknown = set(check) - {"file", "text", "regex", "negate", "n_bytes"}
+        if unknown:
+            raise ValueError(f"Unknown keys {sorted(unknown)} in {check}")
+        d = {"regex": False, "negate": False, "n_bytes": None}
+        d.update(check)
+        return d
+    if len(check) not in (2, 3):
+        raise ValueError(f"Check {check} must be [file, text(, n_bytes)]")
+    return {
+        "file": check[0],
+        "text": check[1],
+        "regex": False,
+        "negate": False,
+        "n_bytes": check[2] if len(check) > 2 else None,
+    }
+
+
+class FileMatcher:
+    """All patterns applying to one file, compiled into a single expression.
+
+    Parameters
+    ----------
+    patterns : list of dict
+        Normalized checks (see normalize_check) with a text which is not None.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.compiled = []
+        for pattern in patterns:
+            text = str(pattern["text"])
+            expression = text if pattern["regex"] else re.escape(text)
+            self.compiled.append(re.compile(expression, re.MULTILINE))
+
+        # Group numbers (and names, which must be unique) change when the
+        # patterns are combined, and global inline flags such as (?i) would
+        # apply to every pattern, so such patterns are searched for on their
+        # own
+        self.isolated = [
+            ii
+            for ii, compiled in enumerate(self.compiled)
+            if compiled.groupindex
+            or compiled.flags != PLAIN_FLAGS
+            or BACKREFERENCE.search(compiled.pattern)
+        ]
+        self.shared = [
+            ii for ii in range(len(patterns)) if ii not in self.isolated
+        ]
+        self.combined = self._combine(self.shared)
+        self.negated = self._combine(
+            [ii for ii in self.shared if patterns[ii]["negate"]]
+        )
+
+    def _combine(self, indices):
+        """Combines the patterns of the given indices into one expression, or
+        returns None if there are none."""
+
+        if not indices:
+            return None
+
+        # Every alternative is wrapped in a lookahead, so that the combined
+        # expression matches (with zero width) at every position at which any
+        # of the patterns starts, and overlapping occurrences are not skipped
+        alternatives = "|".join(
+            f"(?:{self.compiled[ii].pattern})" for ii in indices
+        )
+        return re.compile(f"(?=(?:{alternatives}))", re.MULTILINE)
+
+    @timed("match")
+    def scan(self, text):
+        """Scans the text once for all patterns, stopping as soon as a
+        negated pattern is found.
+
+        Parameters
+        ----------
+        text : str
+
+        Returns
+        -------
+        list of bool
+            Whether every pattern was found.
+        """
+
+        found = [False] * len(self.patterns)
+
+        # Patterns with groups first, since they are searched separately
+        for ii in self.isolated:
+            found[ii] = self.compiled[ii].search(text) is not None
+            if found[ii] and self.patterns[ii]["negate"]:
+                return found
+
+        required = sum(
+            not self.patterns[ii]["negate"] for ii in self.shared
+        )
+        position = 0
+        if required > 0:
+            for match in self.combined.finditer(text):
+                position = match.start()
+
+                # The combined expression only reports the first alternative
+                # which matches here, so every other pattern is tried at this
+                # position
+                for ii in self.shared:
+                    compiled = self.compiled[ii]
+                    if found[ii] or not compiled.match(text, position):
+                        continue
+                    found[ii] = True
+                    if self.patterns[ii]["negate"]:
+                        return found
+                    required -= 1
+                if required == 0:
+                    position += 1
+                    break
+            else:
+                return found
+
+        # Every required pattern was found, so only a negated pattern can
+        # change the outcome
+        if self.negated is not None:
+            match = self.negated.search(text, position)
+            if match is not None:
+                for ii in self.shared:
+                    negate = self.patterns[ii]["negate"]
+                    if negate and self.compiled[ii].match(text, match.start()):
+                        found[ii] = True
+                        break
+        return found
+
+
+class Matcher:
+    """Classifies a calculation directory from its completion checks, reading
+    every output file once.
+
+    Parameters
+    ----------
+    checks : list
+        The checks (see the module documentation).
+    n_lines : int, optional
+        The number of lines at the end of each output file to search, unless
+        the check specifies n_bytes. Default is 100.
+    n_bytes : int, optional
+        If provided, the default n_bytes of every check.
+    """
+
+    def __init__(self, checks, n_lines=100, n_bytes=None):
+        self.n_lines = n_lines
+        self.exists = []
+        self.files = dict()
+        for check in checks:
+            check = normalize_check(check)
+            if check["n_bytes"] is None:
+                check["n_bytes"] = n_bytes
+            if check["text"] is None:
+                self.exists.append(check["file"])
+                continue
+            key = (check["file"], check["n_bytes"])
+            self.files.setdefault(key, []).append(check)
+        self.files = {
+            key: FileMatcher(patterns) for key, patterns in self.files.items()
+        }
+
+    @property
+    def filenames(self):
+        """The names of all output files read by the checks."""
+
+        return sorted(set(self.exists) | {key[0] for key in self.files})
+
+    def _read(self, path, n_bytes):
+        if n_bytes is not None:
+            return tail_bytes(path, n_bytes).decode("utf-8", errors="replace")
+        return "\n".join(tail_lines(path, self.n_lines))
+
+    def classify(self, root):
+        """Classifies the calculation in a directory.
+
+        Parameters
+        ----------
+        root : os.PathLike
+
+        Returns
+        -------
+        str
+            "error" if any negated pattern was found, otherwise "fail" if a
+            required file or pattern is missing, and "success" if not.
+        """
+
+        return self.match(root)[0]
+
+    def match(self, root):
+        """Classifies the calculation in a directory (see classify), also
+        returning which checks matched.
+
+        Parameters
+        ----------
+        root : os.PathLike
+
+        Returns
+        -------
+        tuple
+            (status, matched), where matched is a list of [file, text] for
+            every pattern which was found (including negated ones), and
+            [file, None] for every file which exists and is not empty. If a
+            negated pattern is found, the remaining files are not read.
+        """
+
+        status = SUCCESS
+        matched = []
+        for filename in self.exists:
+            if file_nonempty(Path(root) / filename):
+                matched.append([filename, None])
+            else:
+                status = FAIL
+
+        for (filename, n_bytes), matcher in self.files.items():
+            try:
+                text = self._read(Path(root) / filename, n_bytes)
+            except OSError:
+                # A missing file cannot contain an error banner, but all of
+                # its required patterns are missing
+                if any(not p["negate"] for p in matcher.patterns):
+                    status = FAIL
+                continue
+            found = matcher.scan(text)
+            for pattern, hit in zip(matcher.patterns, found):
+                if hit:
+                    matched.append([filename, pattern["text"]])
+                if pattern["negate"] and hit:
+                    return ERROR, matched
+                if not pattern["negate"] and not hit:
+                    status = FAIL
+        return status, matched
+
+
+def load_config(path, config=None):
+    """Loads a user configuration file and merges it into a configuration.
+
+    The file is json, with the same structure as cmdr.report.CONFIG: an "in"
+    mapping from calculation types to their input files, and an "out" mapping
+    from calculation types to their checks. Calculation types of the file
+    replace those of the configuration, and new types are added. In addition,
+    checks listed under "extend" are appended to the checks of an existing
+    type, e.g. {"extend": {"VASP": [{"file": "OUTCAR", "text": "VERY BAD
+    NEWS", "negate": true}]}}.
+
+    Parameters
+    ----------
+    path : os.PathLike
+    config : dict, optional
+        The configuration to merge into. Default is cmdr.report.CONFIG. It is
+        not modified.
+
+    Returns
+    -------
+    dict
+
+    Raises
+    ------
+    ValueError
+        If a check is malformed, or a calculation type has checks but no input
+        files.
+    """
+
+    if config is None:
+        from cmdr.report import CONFIG as config
+
+    config = deepcopy(config)
+    with open(path, "r") as f:
+        user = json.load(f)
+    unknown = set(user) - {"in", "out", "extend"}
+    if unknown:
+        raise ValueError(f"Unknown keys {sorted(unknown)} in {path}")
+    config["in"].update(user.get("in", {}))
+    config["out"].update(user.get("out", {}))
+    for ctype, checks in user.get("extend", {}).items():
+        config["out"].setdefault(ctype, []).extend(checks)
+
+    for ctype, checks in config["out"].items():
+        if ctype not in config["in"]:
+            raise ValueError(f"Calculation type {ctype} has no input files")
+        for check in checks:
+            normalize_check(check)
+    return config
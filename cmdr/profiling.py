@@ -0,0 +1,176 @@
+"""Lightweight instrumentation of the cmdr subcommands (see the --profile
+option of the command line interface).
+
+The profiler collects, per named stage (e.g. walk, classify, read, match,
+write), the number of calls and the wall and CPU time spent, as well as
+counters such as the number of files opened, bytes read and subprocesses
+spawned. It is disabled by default, in which case instrumented code only pays
+for a flag check. Stages may be entered from worker threads, in which case
+their times are summed over all threads (and can exceed the total wall time);
+the CPU time of a stage is that of the thread running it. Stages may also be
+nested (e.g. read within walk), so their times do not add up to the total wall
+time either. Work done in worker processes (e.g. report with processes=True)
+is not recorded.
+
+Optionally, the whole run is also profiled with cProfile.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+import cProfile
+from functools import wraps
+import json
+import threading
+from time import perf_counter, process_time, thread_time
+
+
+class Profiler:
+    """Collects stage timers and counters."""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._cprofile = None
+        self.reset()
+
+    def reset(self):
+        self.stages = dict()
+        self.counters = Counter()
+        self._t0 = perf_counter()
+        self._c0 = process_time()
+        self._t1 = None
+        self._c1 = None
+
+    def enable(self, cprofile=False):
+        """Resets and starts collecting.
+
+        Parameters
+        ----------
+        cprofile : bool, optional
+            If True, the run is also profiled with cProfile.
+        """
+
+        self.reset()
+        self.enabled = True
+        if cprofile:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def disable(self):
+        self.enabled = False
+        self._t1 = perf_counter()
+        self._c1 = process_time()
+        if self._cprofile is not None:
+            self._cprofile.disable()
+
+    @contextmanager
+    def stage(self, name):
+        """Times the enclosed block as the named stage."""
+
+        if not self.enabled:
+            yield
+            return
+        w0 = perf_counter()
+        c0 = thread_time()
+        try:
+            yield
+        finally:
+            self.add_time(name, perf_counter() - w0, thread_time() - c0)
+
+    def add_time(self, name, wall, cpu, calls=1):
+        with self._lock:
+            entry = self.stages.setdefault(
+                name, {"calls": 0, "wall": 0.0, "cpu": 0.0}
+            )
+            entry["calls"] += calls
+            entry["wall"] += wall
+            entry["cpu"] += cpu
+
+    def count(self, name, n=1):
+        """Increments the named counter by n."""
+
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] += n
+
+    def metrics(self):
+        """The collected metrics as a json-serializable dict."""
+
+        t1 = self._t1 if self._t1 is not None else perf_counter()
+        c1 = self._c1 if self._c1 is not None else process_time()
+        return {
+            "total": {"wall": t1 - self._t0, "cpu": c1 - self._c0},
+            "stages": self.stages,
+            "counters": dict(self.counters),
+        }
+
+    def save(self, path):
+        """Saves the metrics to a json file."""
+
+        with open(path, "w") as f:
+            json.dump(self.metrics(), f, indent=4)
+
+    def dump_cprofile(self, path):
+        """Saves the cProfile statistics (readable with pstats or e.g.
+        snakeviz), if cProfile was enabled."""
+
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(str(path))
+
+    def print_summary(self):
+        """Prints the metrics as tables."""
+
+        from rich.console import Console
+        from rich.table import Table
+
+        metrics = self.metrics()
+        total = metrics["total"]
+        table = Table(
+            title=f"Total: {total['wall']:.3f} s wall, "
+            f"{total['cpu']:.3f} s CPU"
+        )
+        table.add_column("Stage")
+        for column in ["Calls", "Wall (s)", "CPU (s)", "Wall (%)"]:
+            table.add_column(column, justify="right")
+        for name, entry in sorted(
+            metrics["stages"].items(), key=lambda xx: -xx[1]["wall"]
+        ):
+            share = entry["wall"] / total["wall"] if total["wall"] else 0.0
+            table.add_row(
+                name,
+                str(entry["calls"]),
+                f"{entry['wall']:.3f}",
+                f"{entry['cpu']:.3f}",
+                f"{100 * share:.1f}",
+            )
+        console = Console()
+        console.print(table)
+
+        if metrics["counters"]:
+            counters = Table()
+            counters.add_column("Counter")
+            counters.add_column("Value", justify="right")
+            for name, value in sorted(metrics["counters"].items()):
+                counters.add_row(name, str(value))
+            console.print(counters)
+
+
+PROFILER = Profiler()
+
+
+def timed(name):
+    """Decorator which times every call of a function as the named stage of
+    the global profiler."""
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            with PROFILER.stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
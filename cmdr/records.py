@@ -0,0 +1,306 @@
+"""Streaming per-directory result records of check and report.
+
+Rather than collecting every result in memory and writing a single json file
+at the end, check and report can write one record per directory as soon as
+its result is known (see RecordWriter). Buffered records are flushed on the
+next write after FLUSH_INTERVAL seconds (or once FLUSH_EVERY records are
+buffered), and memory use does not grow with the size of the campaign. A run
+which died thus loses the records written within FLUSH_INTERVAL of its last
+write; nothing is flushed between writes, e.g. while a slow directory is
+being checked. Every record has the fields
+
+* directory: the directory checked
+* type: the calculation type (report), or None (check)
+* status: e.g. "success", "fail", "error" (report) or "success", "no_file",
+  "no_line", "unreadable" (check)
+* cached: whether the result was taken from the result cache
+* matched: the list of [file, text] checks which matched (see
+  cmdr.matcher.Matcher.match), or None for cached results
+* elapsed: the time in seconds spent checking the directory
+* time: the unix time at which the record was produced
+
+The format is chosen by the suffix of the output file: JSON lines (.jsonl,
+the default), CSV (.csv) or, if pyarrow is installed, Parquet (.parquet). In
+the columnar formats, matched is stored as a json string. Record files are
+read back in a streaming fashion by read_records and summarize. Note that a
+Parquet file is only readable once its writer was closed, so only JSON lines
+and CSV files keep the partial results of a run which died.
+"""
+
+import csv
+import json
+from pathlib import Path
+from time import time
+
+from cmdr.profiling import timed
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+FIELDS = [
+    "directory",
+    "type",
+    "status",
+    "cached",
+    "matched",
+    "elapsed",
+    "time",
+]
+
+# Number of records buffered before they are written to disk (JSON lines and
+# CSV), or written as one row group (Parquet)
+FLUSH_EVERY = 1000
+# Time in seconds after which the next record written flushes the buffer
+# (JSON lines and CSV)
+FLUSH_INTERVAL = 1.0
+PARQUET_ROW_GROUP = 100000
+
+
+def _format(path, format=None):
+    if format is not None:
+        return format
+    suffix = Path(path).suffix
+    if suffix == ".csv":
+        return "csv"
+    if suffix == ".parquet":
+        return "parquet"
+    return "jsonl"
+
+
+def _parquet_schema():
+    return pyarrow.schema(
+        [
+            ("directory", pyarrow.string()),
+            ("type", pyarrow.string()),
+            ("status", pyarrow.string()),
+            ("cached", pyarrow.bool_()),
+            ("matched", pyarrow.string()),
+            ("elapsed", pyarrow.float64()),
+            ("time", pyarrow.float64()),
+        ]
+    )
+
+
+class RecordWriter:
+    """Writes result records to a file as they are produced.
+
+    Parameters
+    ----------
+    path : os.PathLike
+        The output file. Existing files are overwritten.
+    format : str, optional
+        One of "jsonl", "csv" and "parquet". Default is inferred from the
+        suffix of path (JSON lines unless .csv or .parquet).
+
+    Raises
+    ------
+    RuntimeError
+        If the Parquet format is requested but pyarrow is not installed.
+    """
+
+    def __init__(self, path, format=None):
+        self.path = Path(path)
+        self.format = _format(path, format)
+        self.n_records = 0
+        self._buffer = []
+        self._flushed = time()
+        self._writer = None
+        if self.format == "parquet":
+            if pyarrow is None:
+                raise RuntimeError("Writing Parquet records requires pyarrow")
+            self._writer = pyarrow.parquet.ParquetWriter(
+                str(self.path), _parquet_schema()
+            )
+            self._file = None
+        else:
+            self._file = open(self.path, "w", newline="")
+            if self.format == "csv":
+                self._writer = csv.writer(self._file)
+                self._writer.writerow(FIELDS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(
+        self,
+        directory,
+        status,
+        type=None,
+        cached=False,
+        matched=None,
+        elapsed=None,
+    ):
+        """Writes the record of one directory (see the module
+        documentation)."""
+
+        now = time()
+        self._buffer.append(
+            {
+                "directory": str(directory),
+                "type": type,
+                "status": status,
+                "cached": cached,
+                "matched": matched,
+                "elapsed": elapsed,
+                "time": now,
+            }
+        )
+        self.n_records += 1
+        if self.format == "parquet":
+            if len(self._buffer) >= PARQUET_ROW_GROUP:
+                self.flush()
+        elif (
+            len(self._buffer) >= FLUSH_EVERY
+            or now - self._flushed >= FLUSH_INTERVAL
+        ):
+            self.flush()
+
+    @timed("write")
+    def flush(self):
+        if not self._buffer:
+            return
+        if self.format == "jsonl":
+            for record in self._buffer:
+                self._file.write(json.dumps(record) + "\n")
+        elif self.format == "csv":
+            for record in self._buffer:
+                record["matched"] = json.dumps(record["matched"])
+                self._writer.writerow([record[key] for key in FIELDS])
+        else:
+            for record in self._buffer:
+                record["matched"] = json.dumps(record["matched"])
+            self._writer.write_table(
+                pyarrow.Table.from_pylist(
+                    self._buffer, schema=_parquet_schema()
+                )
+            )
+        if self._file is not None:
+            self._file.flush()
+        self._buffer = []
+        self._flushed = time()
+
+    def close(self):
+        self.flush()
+        if self.format == "parquet":
+            self._writer.close()
+        else:
+            self._file.close()
+
+
+def read_records(path, format=None):
+    """Reads the records of a file written by RecordWriter one at a time.
+
+    Parameters
+    ----------
+    path : os.PathLike
+    format : str, optional
+        Default is inferred from the suffix of path.
+
+    Yields
+    ------
+    dict
+    """
+
+    format = _format(path, format)
+    if format == "parquet":
+        if pyarrow is None:
+            raise RuntimeError("Reading Parquet records requires pyarrow")
+        parquet_file = pyarrow.parquet.ParquetFile(str(path))
+        for batch in parquet_file.iter_batches():
+            for record in batch.to_pylist():
+                record["matched"] = json.loads(record["matched"])
+                yield record
+        return
+
+    with open(path, "r", newline="") as f:
+        if format == "jsonl":
+            for line in f:
+                # A run which was killed may have left a partial last line
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+            return
+        for row in csv.DictReader(f):
+            row["type"] = row["type"] or None
+            row["cached"] = row["cached"] == "True"
+            row["matched"] = json.loads(row["matched"])
+            row["elapsed"] = float(row["elapsed"]) if row["elapsed"] else None
+            row["time"] = float(row["time"])
+            yield row
+
+
+def summarize(path, format=None):
+    """Aggregates a record file without loading it into memory.
+
+    Parameters
+    ----------
+    path : os.PathLike
+    format : str, optional
+        Default is inferred from the suffix of path.
+
+    Returns
+    -------
+    dict
+        For every calculation type (None for the records of check), the
+        number of records of every status ("counts"), the total number of
+        records ("total") and of cached results ("cached"), and the total and
+        maximum time spent checking ("elapsed", "max_elapsed").
+    """
+
+    summary = dict()
+    for record in read_records(path, format):
+        entry = summary.setdefault(
+            record["type"],
+            {
+                "counts": dict(),
+                "total": 0,
+                "cached": 0,
+                "elapsed": 0.0,
+                "max_elapsed": 0.0,
+            },
+        )
+        status = record["status"]
+        entry["counts"][status] = entry["counts"].get(status, 0) + 1
+        entry["total"] += 1
+        entry["cached"] += int(bool(record["cached"]))
+        elapsed = record["elapsed"] or 0.0
+        entry["elapsed"] += elapsed
+        entry["max_elapsed"] = max(entry["max_elapsed"], elapsed)
+    return summary
+
+
+def print_summary(summary):
+    """Prints the output of summarize as a table."""
+
+    from rich.console import Console
+    from rich.table import Table
+
+    statuses = sorted(
+        {status for entry in summary.values() for status in entry["counts"]}
+    )
+    table = Table()
+    table.add_column("Type")
+    for status in statuses:
+        table.add_column(status, justify="right")
+    for column in ["total", "cached", "mean time (s)", "max time (s)"]:
+        table.add_column(column, justify="right")
+    for ctype in sorted(summary, key=lambda xx: (xx is None, xx or "")):
+        entry = summary[ctype]
+        mean = entry["elapsed"] / entry["total"] if entry["total"] else 0.0
+        table.add_row(
+            ctype if ctype is not None else "-",
+            *[str(entry["counts"].get(status, 0)) for status in statuses],
+            str(entry["total"]),
+            str(entry["cached"]),
+            f"{mean:.4f}",
+            f"{entry['max_elapsed']:.4f}",
+        )
+    Console().print(table)
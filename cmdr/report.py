@@ -8,15 +8,31 @@
 """
 
 from collections import Counter
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from math import ceil
+import os
 from pathlib import Path
+from time import perf_counter
+
+from rich.progress import Progress
 
 from cmdr import logger
 
+from cmdr.cache import ResultCache, default_cache_path, file_stats, make_spec
 from cmdr.file_utils import (
+    directory_key,
     exhaustive_directory_search,
-    run_command,
-    check_if_substring_match,
+    walk_directories,
 )
+from cmdr.ledger import Ledger
+from cmdr.matcher import SUCCESS, Matcher
+from cmdr.profiling import PROFILER, timed
+from cmdr.records import RecordWriter
+from cmdr.tracker import RUNNING, is_active, refresh_states
 
 
 CONFIG = {
@@ -36,7 +52,8 @@ CONFIG = {
 }
 
 
-def check_computation_type(root, input_files=CONFIG["in"]):
+@timed("classify")
+def check_computation_type(root, input_files=CONFIG["in"], contained=None):
     """Determines which type of computation has been completed in the directory
     of interest. In the cases when no input file types can be matched, or when
     multiple input file types are found, warnings/errors will be logged and
@@ -51,6 +68,10 @@ def check_computation_type(root, input_files=CONFIG["in"]):
         (e.g. VASP) and values of lists of file names. These file names must
         _all_ be present in a given directory to confirm that the calculation
         is of a certain type.
+    contained : list of str, optional
+        The names of the entries of the directory, if already known (e.g. from
+        the directory walk). Default is None, in which case the directory is
+        listed.
 
     Returns
     -------
@@ -59,7 +80,10 @@ def check_computation_type(root, input_files=CONFIG["in"]):
         options are found in DEFAULT_INPUT_FILES.
     """
 
-    contained = {xx.parts[-1] for xx in list(Path(root).iterdir())}
+    if contained is None:
+        contained = {xx.parts[-1] for xx in list(Path(root).iterdir())}
+    else:
+        contained = set(contained)
     overlap = {
         key: set(value).issubset(contained)
         for key, value in input_files.items()
@@ -81,21 +105,33 @@ def check_computation_type(root, input_files=CONFIG["in"]):
     return calc_type
 
 
-def check_job_status(root, checks):
+def check_job_status(root, checks, n_lines=100, n_bytes=None):
     """Checks the status of a job by looking in the directory of interest for
     the appropriate completion status. This function does not check that the
     provided root directory actually corresponds to the type of calculation
-    provided will error ungracefully if it does not contain the appropriate
-    files. Output files have their last 100 lines checked.
+    provided. Output files have their last n_lines lines checked, which are
+    read in-process by seeking backwards from the end of the file. Every
+    output file is read once, no matter how many checks apply to it (see
+    cmdr.matcher).
 
     Parameters
     ----------
     root : os.PathLike
         The directory containing input and output files.
-    checks : list of list of str
-        A doubly nested list. The outer lists correspond to filename-substring
-        pairs. If the substring is None, then this will simply check whether or
-        not the file exists and is not empty.
+    checks : list
+        The outer lists correspond to filename-substring pairs. If the
+        substring is None, then this will simply check whether or not the file
+        exists and is not empty. An optional third element overrides n_bytes
+        for that check only. Checks may also be dicts, which support regular
+        expressions and patterns which must not be found (see cmdr.matcher).
+    n_lines : int, optional
+        The number of lines at the end of each output file to search. Default
+        is 100.
+    n_bytes : int, optional
+        If provided, only the last n_bytes bytes of each output file are
+        searched, regardless of line structure. This is the cheapest option
+        when the substring is known to be close to the end of the file (such
+        as the VASP timing banner).
 
     Returns
     -------
@@ -103,33 +139,89 @@ def check_job_status(root, checks):
         True if the job has completed successfully, False otherwise.
     """
 
-    for filename, substring in checks:
-        path = Path(root) / Path(filename)
-        logger.debug(f"Running checks {checks} on {path}")
-
-        # Check for existence and that the file size is > 0
-        if substring is None:
-            if not path.exists():
-                logger.debug(f"{path} does not exist - status FALSE")
-                return False
-            if path.stat().st_size == 0:
-                logger.debug(f"{path} is empty - status FALSE")
-                return False
-        else:
-            command = f"tail -n 100 {str(path)}"
-            res = run_command(command)
-            lines = res["stdout"].split("\n")
-            cond = check_if_substring_match(lines, str(substring))
-
-            if not cond:
-                logger.debug(f"{path} missing {substring} - status FALSE")
-                return False
-
-    logger.debug(f"{path} - status TRUE")
-    return True
+    status = Matcher(checks, n_lines=n_lines, n_bytes=n_bytes).classify(root)
+    logger.debug(f"{root} - status {status}")
+    return status == SUCCESS
+
+
+def _report_directory(
+    directory,
+    contained,
+    cached,
+    active,
+    input_files,
+    matchers,
+    output_filenames,
+):
+    """Classifies and checks a single directory. If active is True (the job
+    is still queued or running according to the ledger), the output files are
+    not read. Otherwise, if output_filenames is not None, the output files are
+    stat'ed first, and the cached entry (stats, ctype) is reused if the stats
+    are unchanged.
 
+    Returns
+    -------
+    tuple
+        (ctype, status, stats, hit, matched, elapsed), where ctype is None if
+        the directory could not be classified, status is one of "success",
+        "fail", "error" and "running", matched lists the checks which matched
+        (see cmdr.matcher.Matcher.match) and elapsed is the time taken in
+        seconds.
+    """
 
-def generate_report(root, filename, output_files=CONFIG["out"]):
+    t0 = perf_counter()
+    stats = None
+    if active:
+        ctype = check_computation_type(directory, input_files, contained)
+        return ctype, RUNNING, None, False, None, perf_counter() - t0
+    if output_filenames is not None:
+        stats = file_stats(directory, output_filenames)
+        if cached is not None and cached[0] == stats:
+            elapsed = perf_counter() - t0
+            return cached[1], SUCCESS, stats, True, None, elapsed
+    ctype = check_computation_type(directory, input_files, contained)
+    if ctype is None:
+        return None, None, stats, False, None, perf_counter() - t0
+    status, matched = matchers[ctype].match(directory)
+    logger.debug(f"{directory} - status {status}")
+    return ctype, status, stats, False, matched, perf_counter() - t0
+
+
+def _report_chunk(items, input_files, matchers, output_filenames):
+    """Runs _report_directory on every (directory, contained, cached, active)
+    item of a chunk. This is the unit of work sent to the pool workers."""
+
+    return [
+        (
+            item[0],
+            _report_directory(*item, input_files, matchers, output_filenames),
+        )
+        for item in items
+    ]
+
+
+def generate_report(
+    root,
+    filename,
+    output_files=CONFIG["out"],
+    input_files=CONFIG["in"],
+    max_depth=None,
+    exclude=None,
+    use_index=False,
+    index_path=None,
+    use_cache=False,
+    cache_path=None,
+    refresh_cache=False,
+    clear_cache=False,
+    invalidate_cache=None,
+    workers=1,
+    processes=False,
+    chunksize=None,
+    records_path=None,
+    keep_report=True,
+    ledger_path=None,
+    sacct="sacct",
+):
     """Generates a report of which jobs have finished, which are still ongoing
     and which have failed. Currently, returns True if the job completed with
     seemingly no issues, and False otherwise.
@@ -147,6 +239,17 @@ def generate_report(root, filename, output_files=CONFIG["out"]):
     information.
     * FEFF: If the job completed, there will be a non-empty xmu.dat file.
 
+    Every output file is read once and scanned for all of its patterns in a
+    single pass (see cmdr.matcher). Calculations whose output contains a
+    pattern which must not be found (such as an error banner) are reported
+    under "error" rather than "fail".
+
+    Directories are classified using the listing obtained during the
+    directory walk (unless use_index is True, in which case every directory
+    is listed again). With more than one worker, directories are dispatched
+    to a pool in chunks, and the report is assembled as the chunks complete.
+    The report is the same regardless of the number of workers.
+
     Parameters
     ----------
     root : os.PathLike
@@ -154,52 +257,230 @@ def generate_report(root, filename, output_files=CONFIG["out"]):
     filename : str
         Looks exhaustively in root for directories containing a file matching
         this name.
-    identifiers : dict, optional
+    output_files : dict, optional
+        The completion checks of every computation type (see cmdr.matcher).
+        Default is CONFIG["out"].
+    input_files : dict, optional
         A dictionary containing strings as keys, which identify the computation
         type, and sets as values, which identify input files that all must be
         contained in the directory to identify the directory as corresponding
-        to a certain computation type. Default is DEFAULT_INPUT_FILES.
+        to a certain computation type. Default is CONFIG["in"].
+    max_depth : int, optional
+        Maximum depth of the directory search.
+    exclude : list of str, optional
+        Glob patterns of directory names to prune from the directory search.
+    use_index : bool, optional
+        If True, uses the persistent directory index (see cmdr.index).
+    index_path : os.PathLike, optional
+        Location of the directory index.
+    use_cache : bool, optional
+        If True, directories which were successful on a previous run are not
+        checked again, unless one of their output files changed size or mtime
+        since (see cmdr.cache). Default is False.
+    cache_path : os.PathLike, optional
+        Location of the result cache. Default is given by default_cache_path.
+    refresh_cache : bool, optional
+        If True, ignores cached successes and checks every directory again,
+        updating the cache.
+    clear_cache : bool, optional
+        If True, deletes every entry of the result cache before running.
+    invalidate_cache : list of os.PathLike, optional
+        Directories whose cached successes are deleted before running.
+    workers : int, optional
+        The number of pool workers. Default is 1, which runs every check
+        in-process. None uses one worker per CPU.
+    processes : bool, optional
+        If True, uses a process pool instead of a thread pool. Threads are
+        usually sufficient, since the checks mostly wait on the filesystem;
+        processes also parallelize the (GIL-bound) text matching. Default is
+        False.
+    chunksize : int, optional
+        The number of directories sent to a worker at once. Default is chosen
+        such that every worker receives about four chunks (at most 256
+        directories each).
+    records_path : os.PathLike, optional
+        If provided, one record per classified directory is written to this
+        file as soon as its result is known, including its status, calculation
+        type, matched checks and the time taken (see cmdr.records). The format
+        is given by the suffix (.jsonl, .csv or .parquet).
+    keep_report : bool, optional
+        If False, the lists of directories are not kept in memory, and None is
+        returned. Useful for very large campaigns together with records_path.
+        Default is True.
+    ledger_path : os.PathLike, optional
+        If provided, the submission ledger of the wrangler (see cmdr.ledger).
+        The output files of directories whose jobs are still queued or
+        running according to the ledger (see cmdr.tracker.is_active) are not
+        read, and the directories are reported as "running".
+    sacct : str, optional
+        The sacct command with which the states of the outstanding jobs of
+        the ledger are updated first (see cmdr.tracker.refresh_states), or
+        None to use the recorded states.
 
     Returns
     -------
     dict
-        A dictionary with keys as the paths to the directories checked and
-        boolean values, indicating the success status of the calculation.
+        For every computation type, the lists of "success", "fail" and "error"
+        directories (and "running" directories, if any). The calculation
+        types and the directories of every list are sorted.
     """
 
     logger.info(f"Generating report at {root} (searching for {filename})")
 
-    # Get the directories matching the filename of the directory search
-    directories = exhaustive_directory_search(root, filename)
-
-    # For each directory in the tree, determine the type of calculation that
-    # was run.
-    calculation_types = {dd: check_computation_type(dd) for dd in directories}
-    calculation_types = {
-        key: value
-        for key, value in calculation_types.items()
-        if value is not None
+    # Get the directories matching the filename of the directory search,
+    # along with their listing, which is reused to classify them
+    if use_index:
+        directories = exhaustive_directory_search(
+            root,
+            filename,
+            max_depth=max_depth,
+            exclude=exclude,
+            use_index=use_index,
+            index_path=index_path,
+        )
+        listing = [(dd, None) for dd in directories]
+    else:
+        with PROFILER.stage("walk"):
+            listing = list(
+                walk_directories(
+                    root,
+                    filename,
+                    max_depth=max_depth,
+                    exclude=exclude,
+                    return_listing=True,
+                )
+            )
+
+    cache = None
+    if use_cache:
+        if cache_path is None:
+            cache_path = default_cache_path(root)
+        cache = ResultCache(
+            cache_path, refresh=refresh_cache, clear=clear_cache
+        )
+        if invalidate_cache is not None:
+            cache.invalidate(directories=invalidate_cache)
+    spec = make_spec(input_files=input_files, output_files=output_files)
+    matchers = {
+        ctype: Matcher(checks) for ctype, checks in output_files.items()
     }
-    cc = Counter(list(calculation_types.values()))
-
-    # Get the statuses
-    status = dict()
-    complete = {ctype: 0 for ctype in cc.keys()}
-    report = {ctype: {"success": [], "fail": []} for ctype in cc.keys()}
-    for dd, ctype in calculation_types.items():
-        checks = output_files[ctype] if ctype is not None else None
-        status[dd] = check_job_status(dd, checks=checks)
-        complete[ctype] += int(status[dd])
-
-        if status[dd]:
-            report[ctype]["success"].append(str(dd))
+    output_filenames = None
+    if cache is not None:
+        output_filenames = sorted(
+            {
+                filename
+                for matcher in matchers.values()
+                for filename in matcher.filenames
+            }
+        )
+
+    states = dict()
+    if ledger_path is not None:
+        with Ledger(ledger_path) as ledger:
+            states = refresh_states(ledger, sacct, log=logger.warning)
+
+    # Directories with a valid cached success are not classified again, since
+    # their calculation type is cached alongside
+    items = [
+        (
+            dd,
+            contained,
+            cache.get(spec, dd) if cache is not None else None,
+            is_active(states.get(directory_key(dd))),
+        )
+        for dd, contained in listing
+    ]
+    args = (input_files, matchers, output_filenames)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, min(256, ceil(len(items) / (4 * workers))))
+    batches = [
+        items[ii : ii + chunksize] for ii in range(0, len(items), chunksize)
+    ]
+
+    cc = Counter()
+    complete = Counter()
+    errors = Counter()
+    n_cached = 0
+    n_running = 0
+    report = dict()
+
+    def _description():
+        counts = ", ".join(
+            f"{ctype}: {complete[ctype]}/{cc[ctype]}" for ctype in sorted(cc)
+        )
+        return f"Reporting ({counts})" if counts else "Reporting"
+
+    executor = None
+    writer = None
+    try:
+        if records_path is not None:
+            writer = RecordWriter(records_path)
+        if workers == 1:
+            results = (_report_chunk(batch, *args) for batch in batches)
         else:
-            report[ctype]["fail"].append(str(dd))
-
-    for ctype, ncomplete in complete.items():
-        if ncomplete == cc[ctype]:
-            logger.success(f"{ctype}: all {ncomplete} complete")
+            pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            executor = pool(max_workers=workers)
+            futures = [
+                executor.submit(_report_chunk, batch, *args)
+                for batch in batches
+            ]
+            results = (future.result() for future in as_completed(futures))
+
+        with Progress() as progress:
+            task = progress.add_task(_description(), total=len(items))
+            for chunk in results:
+                for dd, result in chunk:
+                    ctype, status, stats, hit, matched, elapsed = result
+                    if ctype is None:
+                        continue
+                    if writer is not None:
+                        writer.write(
+                            dd, status, ctype, hit, matched, elapsed
+                        )
+                    if keep_report:
+                        if ctype not in report:
+                            report[ctype] = {
+                                key: [] for key in ("success", "fail", "error")
+                            }
+                        report[ctype].setdefault(status, []).append(str(dd))
+                    cc[ctype] += 1
+                    complete[ctype] += int(status == SUCCESS)
+                    errors[ctype] += int(status == "error")
+                    n_cached += int(hit)
+                    n_running += int(status == RUNNING)
+                    if status == SUCCESS and not hit and cache is not None:
+                        cache.add(spec, dd, stats, ctype)
+                progress.update(
+                    task, advance=len(chunk), description=_description()
+                )
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if writer is not None:
+            writer.close()
+        if cache is not None:
+            cache.close()
+
+    if cache is not None:
+        logger.info(f"Skipped {n_cached} cached successes")
+    if ledger_path is not None:
+        logger.info(f"Skipped {n_running} queued or running jobs")
+
+    for ctype in sorted(cc):
+        if complete[ctype] == cc[ctype]:
+            logger.info(f"{ctype}: all {complete[ctype]} complete")
         else:
-            logger.warning(f"{ctype} incomplete: {ncomplete}/{cc[ctype]}")
+            logger.warning(
+                f"{ctype} incomplete: {complete[ctype]}/{cc[ctype]} "
+                f"({errors[ctype]} errors)"
+            )
 
-    return report
+    if not keep_report:
+        return None
+    return {
+        ctype: {key: sorted(value) for key, value in report[ctype].items()}
+        for ctype in sorted(report)
+    }
@@ -0,0 +1,305 @@
+"""Closed-loop resubmission of failed jobs by the wrangler.
+
+Once the tracker (see cmdr.tracker) reports a job as finished, its directory
+is checked like report does (see report_checker), and the job is given an
+outcome according to configurable rules (see DEFAULT_RULES and load_rules):
+
+* "success": the completion check passed.
+* "retry": the job failed in a retryable way, e.g. it ended in the TIMEOUT
+  state. It is resubmitted after an exponential backoff.
+* "fatal": the job failed in a way which a resubmission would not fix, e.g.
+  an error banner was found in its output (status "error" of report) or it
+  was cancelled.
+* "exhausted": the job would be retried, but already used its maximum number
+  of attempts.
+
+The outcomes and resubmission times are kept in the ledger (see
+cmdr.ledger), so the loop survives restarts of the wrangler. Jobs which hit
+their time limit can also have the time limit of their submit script raised
+before they are resubmitted (see bump_time_limit).
+"""
+
+from copy import deepcopy
+import json
+from pathlib import Path
+import re
+from time import time
+
+from cmdr.ledger import UNKNOWN
+from cmdr.matcher import ERROR, FAIL, Matcher
+from cmdr.slurm import format_time, parse_time
+from cmdr.tracker import FINISHED_STATES
+
+
+SUCCESS = "success"
+RETRY = "retry"
+FATAL = "fatal"
+EXHAUSTED = "exhausted"
+
+DEFAULT_RULES = {
+    # The maximum number of submissions of a job, including the first one
+    "max_attempts": 3,
+    # The delay before the first resubmission in seconds, which is multiplied
+    # by backoff_factor for every further attempt, up to max_backoff
+    "backoff": 300.0,
+    "backoff_factor": 2.0,
+    "max_backoff": 6 * 3600.0,
+    # Final SLURM states in which a job is retried
+    "retry_states": ["TIMEOUT", "NODE_FAIL", "PREEMPTED", "BOOT_FAIL"],
+    # Whether jobs which ended in any other final state without passing their
+    # completion check (status "fail", but not "error") are retried
+    "retry_incomplete": False,
+    # If provided, the time limit of jobs which ended in the TIMEOUT state is
+    # multiplied by this factor before they are resubmitted, up to max_time
+    # (a SLURM time string, e.g. "48:00:00")
+    "time_factor": None,
+    "max_time": None,
+}
+
+# The time limit line of a submit script, e.g. "#SBATCH --time=1:00:00"
+TIME_PATTERN = re.compile(r"^(#SBATCH\s+(?:--time[=\s]\s*|-t\s*))(\S+)(.*)$")
+
+
+def load_rules(path=None):
+    """Loads the retry rules from a json file, whose keys override those of
+    DEFAULT_RULES.
+
+    Parameters
+    ----------
+    path : os.PathLike, optional
+        If None, the default rules are returned.
+
+    Returns
+    -------
+    dict
+
+    Raises
+    ------
+    ValueError
+        If the file contains unknown keys.
+    """
+
+    rules = deepcopy(DEFAULT_RULES)
+    if path is None:
+        return rules
+    with open(path, "r") as f:
+        user = json.load(f)
+    unknown = set(user) - set(DEFAULT_RULES)
+    if unknown:
+        raise ValueError(f"Unknown keys {sorted(unknown)} in {path}")
+    rules.update(user)
+    return rules
+
+
+def classify(state, status, attempts, rules=DEFAULT_RULES):
+    """Determines the outcome of a finished job.
+
+    Parameters
+    ----------
+    state : str
+        The final SLURM state of the job.
+    status : str or None
+        The status of its completion check ("success", "fail" or "error"),
+        or None if the directory could not be checked (in which case the
+        job is successful if it ended in the COMPLETED state).
+    attempts : int
+        The number of times the job was submitted.
+    rules : dict, optional
+
+    Returns
+    -------
+    str
+        One of SUCCESS, RETRY, FATAL and EXHAUSTED.
+    """
+
+    if status == SUCCESS or (status is None and state == "COMPLETED"):
+        return SUCCESS
+    if status == ERROR:
+        return FATAL
+    retryable = state in rules["retry_states"] or (
+        rules["retry_incomplete"] and status == FAIL
+    )
+    if not retryable:
+        return FATAL
+    if attempts >= rules["max_attempts"]:
+        return EXHAUSTED
+    return RETRY
+
+
+def backoff_delay(attempts, rules=DEFAULT_RULES):
+    """The delay in seconds before the resubmission of a job which was
+    submitted attempts times."""
+
+    delay = rules["backoff"] * rules["backoff_factor"] ** max(attempts - 1, 0)
+    return min(delay, rules["max_backoff"])
+
+
+def bump_time_limit(script_path, factor, max_time=None):
+    """Multiplies the time limit (#SBATCH --time or -t) of a submit script in
+    place.
+
+    Parameters
+    ----------
+    script_path : os.PathLike
+    factor : float
+    max_time : str, optional
+        The maximum time limit, as a SLURM time string.
+
+    Returns
+    -------
+    tuple or None
+        The old and new time limits, or None if the script has no time limit
+        (or it is already at max_time).
+    """
+
+    script_path = Path(script_path)
+    lines = script_path.read_text().split("\n")
+    for ii, line in enumerate(lines):
+        match = TIME_PATTERN.match(line)
+        if match is None:
+            continue
+        prefix, old, suffix = match.groups()
+        seconds = parse_time(old) * factor
+        if max_time is not None:
+            seconds = min(seconds, parse_time(max_time))
+        new = format_time(seconds)
+        if parse_time(new) <= parse_time(old):
+            return None
+        lines[ii] = f"{prefix}{new}{suffix}"
+        script_path.write_text("\n".join(lines))
+        return old, new
+    return None
+
+
+def report_checker(output_files=None, input_files=None):
+    """Returns a function which checks a directory like report does.
+
+    Parameters
+    ----------
+    output_files : dict, optional
+        Default is cmdr.report.CONFIG["out"].
+    input_files : dict, optional
+        Default is cmdr.report.CONFIG["in"].
+
+    Returns
+    -------
+    callable
+        Maps a directory to its status ("success", "fail" or "error"), or to
+        None if its calculation type could not be determined.
+    """
+
+    from cmdr.report import CONFIG, check_computation_type
+
+    output_files = CONFIG["out"] if output_files is None else output_files
+    input_files = CONFIG["in"] if input_files is None else input_files
+    matchers = {
+        ctype: Matcher(checks) for ctype, checks in output_files.items()
+    }
+
+    def _check(directory):
+        ctype = check_computation_type(directory, input_files)
+        if ctype is None:
+            return None
+        return matchers[ctype].classify(directory)
+
+    return _check
+
+
+class Resubmitter:
+    """Decides the outcome of finished jobs and schedules the resubmission of
+    retryable ones.
+
+    Parameters
+    ----------
+    ledger : cmdr.ledger.Ledger
+    target_file : str, optional
+        The name of the submit script in every job directory.
+    rules : dict, optional
+        Default is DEFAULT_RULES.
+    checker : callable, optional
+        Maps a directory to the status of its completion check. Default is
+        report_checker().
+    clock : callable, optional
+        Returns the current unix time. Default is time.time.
+    log : callable, optional
+        Called with every message. Default discards them.
+    """
+
+    def __init__(
+        self,
+        ledger,
+        target_file="submit.sbatch",
+        rules=None,
+        checker=None,
+        clock=time,
+        log=None,
+    ):
+        self.ledger = ledger
+        self.target_file = target_file
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.checker = report_checker() if checker is None else checker
+        self._clock = clock
+        self._log = log if log is not None else (lambda message: None)
+
+    def resolve(self):
+        """Checks every finished job without an outcome, records its outcome
+        in the ledger and, for retryable jobs, the time after which they may
+        be resubmitted.
+
+        Returns
+        -------
+        dict
+            Maps directories to their new outcome.
+        """
+
+        now = self._clock()
+        outcomes = dict()
+        for entry in self.ledger.entries(
+            states=FINISHED_STATES, unresolved=True
+        ):
+            directory = entry["directory"]
+            try:
+                status = self.checker(directory)
+            except OSError:
+                status = None
+            outcome = classify(
+                entry["state"], status, entry["attempts"], self.rules
+            )
+            retry_after = None
+            if outcome == RETRY:
+                retry_after = now + backoff_delay(
+                    entry["attempts"], self.rules
+                )
+                if entry["state"] == "TIMEOUT" and self.rules["time_factor"]:
+                    self._bump(directory)
+            outcomes[directory] = (outcome, retry_after)
+            self._log(f"{outcome} ({entry['state']}, {status}): {directory}")
+        self.ledger.set_outcomes(outcomes)
+        return {key: value[0] for key, value in outcomes.items()}
+
+    def _bump(self, directory):
+        try:
+            bumped = bump_time_limit(
+                Path(directory) / self.target_file,
+                self.rules["time_factor"],
+                self.rules["max_time"],
+            )
+        except (OSError, ValueError) as error:
+            self._log(f"cannot raise the time limit of {directory}: {error}")
+            return
+        if bumped is not None:
+            self._log(f"time limit {bumped[0]} -> {bumped[1]}: {directory}")
+
+    def due(self):
+        """The directories whose resubmission is due."""
+
+        return self.ledger.due(self._clock())
+
+    def waiting(self):
+        """Whether any job is still queued, running, finished without an
+        outcome or scheduled for resubmission (now or in the future)."""
+
+        unresolved = self.ledger.entries(
+            exclude_states={UNKNOWN}, unresolved=True
+        )
+        return bool(unresolved) or bool(self.ledger.due(float("inf")))
@@ -0,0 +1,222 @@
+"""Thin interface to the SLURM command line tools used by the wrangler."""
+
+import re
+import shlex
+
+from cmdr.file_utils import run_commands
+from cmdr.tracker import SACCT_FORMAT, parse_sacct
+
+
+SUBMITTED_PATTERN = re.compile(r"Submitted batch job (\d+)")
+
+# Maximum number of job IDs per sacct call, which keeps the command line short
+SACCT_BATCH_SIZE = 1000
+
+
+def parse_time(value):
+    """Parses a SLURM time limit ("minutes", "minutes:seconds",
+    "hours:minutes:seconds", "days-hours", "days-hours:minutes" or
+    "days-hours:minutes:seconds").
+
+    Parameters
+    ----------
+    value : str
+
+    Returns
+    -------
+    int
+        The time limit in seconds.
+
+    Raises
+    ------
+    ValueError
+        If value is not a valid time limit.
+    """
+
+    days = 0
+    value = value.strip()
+    if "-" in value:
+        days, value = value.split("-", 1)
+        days = int(days)
+        parts = [int(xx) for xx in value.split(":")]
+        parts += [0] * (3 - len(parts))
+        hours, minutes, seconds = parts
+    else:
+        parts = [int(xx) for xx in value.split(":")]
+        if len(parts) == 1:
+            hours, minutes, seconds = 0, parts[0], 0
+        elif len(parts) == 2:
+            hours, minutes, seconds = 0, parts[0], parts[1]
+        elif len(parts) == 3:
+            hours, minutes, seconds = parts
+        else:
+            raise ValueError(f"Invalid time limit {value}")
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def format_time(seconds):
+    """Formats a time limit in seconds as days-hours:minutes:seconds (or
+    hours:minutes:seconds if shorter than a day)."""
+
+    seconds = int(round(seconds))
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    formatted = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    return f"{days}-{formatted}" if days else formatted
+
+
+class SlurmBackend:
+    """Runs the SLURM commands.
+
+    Parameters
+    ----------
+    user : str
+        The SLURM username whose jobs are counted.
+    sbatch : str, optional
+        The sbatch command (e.g. a full path).
+    squeue : str, optional
+        The squeue command.
+    sacct : str, optional
+        The sacct command.
+    concurrency : int, optional
+        The maximum number of sbatch calls running at once in submit_many.
+    timeout : float, optional
+        The time in seconds after which a SLURM command is killed (and, for
+        sbatch, the submission is considered failed).
+    """
+
+    def __init__(
+        self,
+        user,
+        sbatch="sbatch",
+        squeue="squeue",
+        sacct="sacct",
+        concurrency=4,
+        timeout=300.0,
+    ):
+        self.user = user
+        self.sbatch = sbatch
+        self.squeue = squeue
+        self.sacct = sacct
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    def active_jobs(self):
+        """Returns the number of queued or running jobs of the user. Job arrays
+        are expanded, so every array task counts as one job.
+
+        Returns
+        -------
+        int
+
+        Raises
+        ------
+        RuntimeError
+            If squeue fails.
+        """
+
+        # The job count needs the whole listing
+        argv = shlex.split(self.squeue) + ["-u", self.user, "-h", "-r"]
+        out = run_commands(
+            [argv + ["-o", "%i"]], timeout=self.timeout, max_output=None
+        )[0]
+        if out["exitcode"] != 0:
+            raise RuntimeError(f"squeue failed: {out['stderr']}")
+        return len([line for line in out["stdout"].split("\n") if line])
+
+    def _submit_argv(self, script, options=None):
+        return shlex.split(self.sbatch) + list(options or []) + [script]
+
+    @staticmethod
+    def _job_id(out):
+        match = SUBMITTED_PATTERN.search(out["stdout"])
+        if out["exitcode"] != 0 or match is None:
+            return None
+        return match.group(1)
+
+    def submit(self, directory, script, options=None):
+        """Submits a script from within a directory.
+
+        Parameters
+        ----------
+        directory : os.PathLike
+            The directory to run sbatch from.
+        script : str
+            The script name, relative to directory.
+        options : list of str, optional
+            Extra sbatch options, e.g. ["--array=0-9"].
+
+        Returns
+        -------
+        str or None
+            The job ID, or None if the submission failed.
+        """
+
+        return self.submit_many([(directory, script, options)])[0]
+
+    def submit_many(self, submissions):
+        """Submits many scripts, running up to concurrency sbatch calls at
+        once.
+
+        Parameters
+        ----------
+        submissions : list of tuple
+            The directory, script and options (see submit) of every
+            submission.
+
+        Returns
+        -------
+        list
+            The job ID of every submission, or None where it failed.
+        """
+
+        outs = run_commands(
+            [
+                self._submit_argv(script, options)
+                for _, script, options in submissions
+            ],
+            concurrency=self.concurrency,
+            timeout=self.timeout,
+            cwd=[str(directory) for directory, _, _ in submissions],
+        )
+        return [self._job_id(out) for out in outs]
+
+    def job_states(self, job_ids):
+        """Queries the states of jobs with sacct, in a single call unless
+        there are more than SACCT_BATCH_SIZE of them.
+
+        Parameters
+        ----------
+        job_ids : list of str
+
+        Returns
+        -------
+        dict
+            Maps job IDs to states (see cmdr.tracker.parse_sacct). Jobs
+            unknown to sacct are omitted.
+
+        Raises
+        ------
+        RuntimeError
+            If sacct fails.
+        """
+
+        job_ids = list(job_ids)
+        commands = [
+            shlex.split(self.sacct)
+            + ["-j", ",".join(job_ids[ii : ii + SACCT_BATCH_SIZE])]
+            + SACCT_FORMAT
+            for ii in range(0, len(job_ids), SACCT_BATCH_SIZE)
+        ]
+        states = dict()
+        for out in run_commands(
+            commands,
+            concurrency=self.concurrency,
+            timeout=self.timeout,
+            max_output=None,
+        ):
+            if out["exitcode"] != 0:
+                raise RuntimeError(f"sacct failed: {out['stderr']}")
+            states.update(parse_sacct(out["stdout"]))
+        return states
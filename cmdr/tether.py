@@ -4,12 +4,24 @@ to submit, but each job is cheap and does not require significant
 parallelization. Perhaps each job is even faster than a minute (the minimum
 cronjob time)."""
 
+import csv
+from datetime import datetime
+import heapq
 from math import floor, log10, ceil
-import numpy as np
+import os
 from pathlib import Path
+import shlex
+import shutil
+from statistics import median
 
 from rich.pretty import pprint
-from cmdr.file_utils import exhaustive_directory_search
+from cmdr.file_utils import (
+    directory_key,
+    exhaustive_directory_search,
+    read_json,
+    save_json,
+)
+from cmdr.profiling import timed
 
 
 def chunks(original_list, chunk_size):
@@ -26,31 +38,371 @@ def chunks(original_list, chunk_size):
     list
     """
 
+    # Same split as numpy.array_split: the first L % n_chunks chunks are one
+    # element longer than the others
     L = len(original_list)
-    chunks = ceil(L / chunk_size)
-    return np.array_split(original_list, chunks)
+    n_chunks = ceil(L / chunk_size)
+    if n_chunks == 0:
+        return
+    size, extra = divmod(L, n_chunks)
+    start = 0
+    for ii in range(n_chunks):
+        stop = start + size + (1 if ii < extra else 0)
+        yield list(original_list[start:stop])
+        start = stop
 
 
-def get_file_lines(slurm_config, chunk, executable_lines, post_slurm_lines):
-    """Summary
+@timed("costs")
+def load_costs(directories, cost_csv=None, timings=None, size_file=None):
+    """Estimates the cost (runtime) of the calculation in every directory.
+    Sources are consulted in order of precedence: a user-supplied CSV file,
+    the timing summaries of a previous tether run, and finally the size of a
+    file in every directory. Directories without an estimate are assigned
+    the median of the known costs.
 
     Parameters
     ----------
-    slurm_config : TYPE
-        Description
-    chunk : TYPE
-        Description
-    executable_lines : TYPE
-        Description
-    post_slurm_lines : TYPE
-        Description
+    directories : list of os.PathLike
+    cost_csv : os.PathLike, optional
+        A CSV file with rows of directory,cost (a header row is allowed).
+    timings : list of os.PathLike, optional
+        summary.tsv files written by staged jobs (see get_task_lines), or
+        directories which are searched recursively for them. The elapsed time
+        of successful tasks is used as their cost.
+    size_file : str, optional
+        If provided, the size in bytes of this file in every directory is used
+        as the cost (e.g. a structure file, as a proxy for system size).
+        Note that these costs are in arbitrary units.
 
     Returns
     -------
-    TYPE
-        Description
+    dict
+        The cost of every directory, keyed by its directory_key (see
+        cmdr.file_utils).
     """
 
+    known = dict()
+    if size_file is not None:
+        for dd in directories:
+            try:
+                size = os.stat(Path(dd) / size_file).st_size
+            except OSError:
+                continue
+            known[directory_key(dd)] = float(size)
+
+    for path in timings or []:
+        path = Path(path)
+        paths = path.rglob("summary.tsv") if path.is_dir() else [path]
+        for summary in paths:
+            with open(summary, "r") as f:
+                for row in csv.DictReader(f, delimiter="\t"):
+                    if row["exitcode"] != "0":
+                        continue
+                    key = directory_key(row["directory"])
+                    known[key] = float(row["elapsed"])
+
+    if cost_csv is not None:
+        with open(cost_csv, "r") as f:
+            for row in csv.reader(f):
+                if len(row) < 2:
+                    continue
+                try:
+                    known[directory_key(row[0])] = float(row[1])
+                except ValueError:
+                    continue  # header
+
+    keys = [directory_key(dd) for dd in directories]
+    costs = {key: known.get(key) for key in keys}
+    values = [cost for cost in costs.values() if cost is not None]
+    default = median(values) if values else 1.0
+    return {
+        key: (default if cost is None else cost)
+        for key, cost in costs.items()
+    }
+
+
+def _lpt(directories, costs, n_bins, max_tasks):
+    """Longest-processing-time-first assignment of directories to n_bins
+    bins of at most max_tasks tasks each."""
+
+    order = sorted(directories, key=lambda dd: -costs[directory_key(dd)])
+    bins = [[] for _ in range(n_bins)]
+    loads = [(0.0, ii) for ii in range(n_bins)]
+    heapq.heapify(loads)
+    for dd in order:
+        load, ii = heapq.heappop(loads)
+        bins[ii].append(dd)
+        if len(bins[ii]) < max_tasks:
+            heapq.heappush(loads, (load + costs[directory_key(dd)], ii))
+    return [chunk for chunk in bins if chunk]
+
+
+def estimate_makespan(chunk, costs, parallel):
+    """A lower bound on the wall time of a staged job running its tasks with
+    the given parallelism: the larger of the longest task and the total cost
+    divided by the parallelism."""
+
+    chunk_costs = [costs[directory_key(dd)] for dd in chunk]
+    return max(max(chunk_costs), sum(chunk_costs) / parallel)
+
+
+@timed("pack")
+def pack(directories, costs, max_tasks, target_walltime=None, parallel=None):
+    """Packs directories into chunks (staged jobs) such that the estimated
+    wall times of the chunks are balanced, using the longest processing time
+    first heuristic. The number of chunks is the smallest for which no chunk
+    holds more than max_tasks directories and, if target_walltime is
+    provided, no chunk's estimated wall time exceeds it (where possible,
+    found by a binary search over the number of chunks).
+
+    Parameters
+    ----------
+    directories : list of os.PathLike
+    costs : dict
+        The cost of every directory (see load_costs).
+    max_tasks : int
+        The maximum number of directories per chunk.
+    target_walltime : float, optional
+        The target wall time of every chunk, in the units of costs.
+    parallel : int, optional
+        The number of tasks a staged job runs concurrently. Default is
+        max_tasks.
+
+    Returns
+    -------
+    list of list
+        The chunks, each ordered from the most to the least expensive task.
+    """
+
+    if not directories:
+        return []
+    if parallel is None:
+        parallel = max_tasks
+    # No packing can beat the single most expensive task
+    if target_walltime is not None:
+        longest = max(costs[directory_key(dd)] for dd in directories)
+        target_walltime = max(target_walltime, longest)
+
+    n_bins = ceil(len(directories) / max_tasks)
+    if target_walltime is not None:
+        total = sum(costs[directory_key(dd)] for dd in directories)
+        n_bins = max(n_bins, ceil(total / (parallel * target_walltime)))
+    n_bins = min(n_bins, len(directories))
+
+    packed = _lpt(directories, costs, n_bins, max_tasks)
+    if target_walltime is None:
+        return packed
+    if _fits(packed, costs, parallel, target_walltime):
+        return packed
+
+    # Binary search for the smallest number of chunks meeting the target.
+    # One directory per chunk always does, since the target is at least the
+    # most expensive task.
+    low, high = n_bins, len(directories)
+    best = None
+    while high - low > 1:
+        middle = (low + high) // 2
+        candidate = _lpt(directories, costs, middle, max_tasks)
+        if _fits(candidate, costs, parallel, target_walltime):
+            high, best = middle, candidate
+        else:
+            low = middle
+    if best is None:
+        best = _lpt(directories, costs, high, max_tasks)
+    return best
+
+
+def _fits(packed, costs, parallel, target_walltime):
+    """Whether the estimated wall time of every chunk is within the
+    target."""
+
+    return all(
+        estimate_makespan(chunk, costs, parallel) <= target_walltime
+        for chunk in packed
+    )
+
+
+def get_task_lines(
+    executable_lines, parallel=None, summary_path=None, done_path=None
+):
+    """Constructs the bash functions which run the tasks of a staged job
+    concurrently. Every task runs in its own subshell, and at most parallel
+    tasks run at any given time. The exit code and wall time of every task
+    are appended to a tab-separated summary file with the columns index,
+    directory, exitcode, start, end and elapsed (seconds). If done_path is
+    provided, an empty marker file named after the index of every task which
+    exits successfully is created in it, and tasks whose marker already
+    exists are skipped, so that a staged job which was killed (e.g. at its
+    time limit) can simply be resubmitted.
+
+    Parameters
+    ----------
+    executable_lines : list of str
+        The commands run in the directory of every task.
+    parallel : int, optional
+        The maximum number of tasks running at once. Default is None, which
+        uses SLURM_CPUS_ON_NODE (or 1 if it is not set) at runtime.
+    summary_path : os.PathLike, optional
+        The summary file. Default is summary.tsv in the directory the job was
+        submitted from.
+    done_path : os.PathLike, optional
+        The directory of the completion markers. Default is None, in which
+        case no markers are written.
+
+    Returns
+    -------
+    list of str
+    """
+
+    if parallel is None:
+        parallel = "${SLURM_CPUS_ON_NODE:-1}"
+    if summary_path is None:
+        summary_path = '"${SLURM_SUBMIT_DIR:-$PWD}/summary.tsv"'
+    else:
+        summary_path = shlex.quote(str(summary_path))
+    lines = [
+        f"PARALLEL={parallel}",
+        f"SUMMARY={summary_path}",
+        '[ -e "$SUMMARY" ] || printf '
+        "'index\\tdirectory\\texitcode\\tstart\\tend\\telapsed\\n' "
+        '> "$SUMMARY"',
+    ]
+    if done_path is not None:
+        lines.append(f"DONE={shlex.quote(str(done_path))}")
+    lines += [
+        "",
+        "run_task() {",
+        '    local index="$1" directory="$2" start end exitcode',
+    ]
+    if done_path is not None:
+        lines.append('    [ -e "$DONE/$index" ] && return 0')
+    lines += [
+        "    start=$(date +%s.%N)",
+        "    (",
+        '        cd "$directory" || exit 1',
+    ]
+    lines += [f"        {exe_line}" for exe_line in executable_lines]
+    lines += [
+        "    )",
+        "    exitcode=$?",
+        "    end=$(date +%s.%N)",
+        "    printf '%s\\t%s\\t%s\\t%s\\t%s\\t%s\\n' "
+        '"$index" "$directory" "$exitcode" "$start" "$end" '
+        '"$(awk "BEGIN {print $end - $start}")" >> "$SUMMARY"',
+    ]
+    if done_path is not None:
+        lines.append('    [ "$exitcode" -eq 0 ] && touch "$DONE/$index"')
+    lines += [
+        "}",
+        "",
+        "launch() {",
+        '    while [ "$(jobs -rp | wc -l)" -ge "$PARALLEL" ]; do',
+        "        wait -n",
+        "    done",
+        '    run_task "$@" &',
+        "}",
+        "",
+    ]
+    return lines
+
+
+def get_queue_lines(work_queue):
+    """Constructs the worker loops of a staged job pulling tasks from a shared
+    work queue. The queue is a directory containing manifest.txt (one task
+    directory per line) and a claims directory. A worker claims task i by
+    creating claims/i with mkdir, which is atomic even on NFS and Lustre, so
+    every task is run exactly once no matter how many staged jobs (on however
+    many nodes) pull from the queue. Each worker walks the manifest in order
+    and keeps pulling until it reaches the end. Since every index below a
+    worker's position has been claimed, workers publish their position to
+    claims/cursor (via an atomic rename), from which newly started workers
+    begin instead of re-trying every claimed task.
+
+    Parameters
+    ----------
+    work_queue : os.PathLike
+        The directory of the work queue.
+
+    Returns
+    -------
+    list of str
+    """
+
+    work_queue = Path(work_queue).absolute()
+    return [
+        f"MANIFEST={shlex.quote(str(work_queue / 'manifest.txt'))}",
+        f"CLAIMS={shlex.quote(str(work_queue / 'claims'))}",
+        'mapfile -t DIRECTORIES < "$MANIFEST"',
+        "",
+        "worker() {",
+        "    local index=0",
+        '    [ -e "$CLAIMS/cursor" ] && index=$(cat "$CLAIMS/cursor")',
+        '    while [ "$index" -lt "${#DIRECTORIES[@]}" ]; do',
+        '        if mkdir "$CLAIMS/$index" 2>/dev/null; then',
+        '            echo "${SLURM_JOB_ID:-$$} $(hostname)" '
+        '> "$CLAIMS/$index/owner"',
+        '            echo "$index" > "$CLAIMS/cursor.$$.$BASHPID"',
+        '            mv "$CLAIMS/cursor.$$.$BASHPID" "$CLAIMS/cursor"',
+        '            run_task "$index" "${DIRECTORIES[$index]}"',
+        "        fi",
+        "        index=$((index + 1))",
+        "    done",
+        "}",
+        "",
+        "for ((w = 0; w < PARALLEL; w++)); do",
+        "    worker &",
+        "done",
+    ]
+
+
+def get_file_lines(
+    slurm_config,
+    chunk,
+    executable_lines,
+    post_slurm_lines,
+    parallel=None,
+    summary_path=None,
+    indices=None,
+    work_queue=None,
+    done_path=None,
+):
+    """Constructs the lines of a staged SLURM script, which runs the
+    executable lines in every directory of the chunk, with up to parallel
+    tasks running concurrently (see get_task_lines).
+
+    Parameters
+    ----------
+    slurm_config : dict
+        The keys and values of the SBATCH lines.
+    chunk : list of os.PathLike
+        The directories of the tasks.
+    executable_lines : list of str
+        The commands run in every directory.
+    post_slurm_lines : list of str
+        Lines run once before any task (such as export or module loading).
+    parallel : int, optional
+        The maximum number of concurrently running tasks. Default uses
+        SLURM_CPUS_ON_NODE.
+    summary_path : os.PathLike, optional
+        The file the exit code and wall time of every task is written to.
+    indices : list of int, optional
+        The index of every task, as written to the summary. Default is the
+        position in the chunk.
+    work_queue : os.PathLike, optional
+        If provided, chunk is ignored and tasks are instead pulled from the
+        shared work queue in this directory (see get_queue_lines).
+    done_path : os.PathLike, optional
+        The directory of the per-task completion markers (see
+        get_task_lines).
+
+    Returns
+    -------
+    list of str
+    """
+
+    if indices is None:
+        indices = range(len(chunk))
+
     lines = ["#!/bin/bash"]
     lines = lines + [
         f"#SBATCH --{key}={value}" for key, value in slurm_config.items()
@@ -60,10 +412,15 @@ def get_file_lines(slurm_config, chunk, executable_lines, post_slurm_lines):
         lines = lines + post_slurm_lines
         lines[-1] += "\n"
 
-    for dd in chunk:
-        lines.append(f"cd {dd.absolute()}")
-        for exe_line in executable_lines:
-            lines.append(exe_line)
+    lines += get_task_lines(
+        executable_lines, parallel, summary_path, done_path
+    )
+    if work_queue is not None:
+        lines += get_queue_lines(work_queue)
+        chunk = []
+    for index, dd in zip(indices, chunk):
+        directory = shlex.quote(str(Path(dd).absolute()))
+        lines.append(f"launch {index} {directory}")
     lines.append("\nwait\nexit")
     return lines
 
@@ -85,6 +442,16 @@ def tether_constructor(
     slurm_header_lines={"job-name": "test_job"},
     post_slurm_lines=[],
     executable_lines=["echo test"],
+    max_depth=None,
+    exclude=None,
+    use_index=False,
+    index_path=None,
+    parallel=None,
+    cost_csv=None,
+    timings=None,
+    size_file=None,
+    target_walltime=None,
+    work_queue=False,
 ):
     """The tether constructor. Writes composite SLURM jobs.
 
@@ -110,6 +477,41 @@ def tether_constructor(
     executable_lines : list
         A list of commands which are executed, in order, after changing
         directory to all directories found matching the provided filename.
+    max_depth : int, optional
+        Maximum depth of the directory search.
+    exclude : list of str, optional
+        Glob patterns of directory names to prune from the directory search.
+    use_index : bool, optional
+        If True, uses the persistent directory index (see cmdr.index).
+    index_path : os.PathLike, optional
+        Location of the directory index.
+    parallel : int, optional
+        The number of calculations which run concurrently within a staged job.
+        Default is None, which uses SLURM_CPUS_ON_NODE at runtime. The exit
+        code and wall time of every calculation are written to summary.tsv in
+        the directory of the staged job.
+    cost_csv : os.PathLike, optional
+        A CSV file of directory,cost rows with per-directory cost estimates.
+    timings : list of os.PathLike, optional
+        summary.tsv files of a previous run (or directories containing them)
+        from which per-directory costs are taken.
+    size_file : str, optional
+        A file whose size is used as the cost estimate of every directory.
+    target_walltime : float, optional
+        The target wall time of every staged job, in the units of the costs.
+    work_queue : bool, optional
+        If True, rather than a fixed list of directories per staged job, a
+        single shared work manifest is written to the tether directory, from
+        which every staged job pulls tasks until none are left (see
+        get_queue_lines). Directories are queued from the most to the least
+        expensive if cost estimates are available. The number of staged jobs
+        is unchanged. Default is False.
+
+    Notes
+    -----
+    If any cost source is provided, directories are packed into staged jobs
+    with balanced estimated wall times (see pack). Otherwise, every staged job
+    receives an equal number of directories.
     """
 
     print(
@@ -119,30 +521,202 @@ def tether_constructor(
     print(f"Calculations per staged job: {calculations_per_staged_job}")
 
     directories = sorted(
-        exhaustive_directory_search(search_directory, filename)
+        exhaustive_directory_search(
+            search_directory,
+            filename,
+            max_depth=max_depth,
+            exclude=exclude,
+            use_index=use_index,
+            index_path=index_path,
+        )
     )
     print(f"Found a total of {len(directories)} corresponding to {filename}")
 
-    chunked_directories = list(
-        chunks(directories, calculations_per_staged_job)
-    )
-    submit_script_lines = []
-    for chunk in chunked_directories:
-        # For each chunk, we write a single SLURM script which changes
-        # directories into the one where the executable should be
-        lines = get_file_lines(
-            slurm_header_lines, chunk, executable_lines, post_slurm_lines
+    if cost_csv is None and not timings and size_file is None:
+        chunked_directories = list(
+            chunks(directories, calculations_per_staged_job)
+        )
+    else:
+        costs = load_costs(directories, cost_csv, timings, size_file)
+        chunked_directories = pack(
+            directories,
+            costs,
+            calculations_per_staged_job,
+            target_walltime=target_walltime,
+            parallel=parallel,
+        )
+        makespans = [
+            estimate_makespan(
+                chunk, costs, parallel or calculations_per_staged_job
+            )
+            for chunk in chunked_directories
+        ]
+        print(
+            f"Estimated staged job wall times: min {min(makespans):.1f}, "
+            f"max {max(makespans):.1f}"
         )
-        submit_script_lines.append(lines)
+    task_index = {dd: ii for ii, dd in enumerate(directories)}
+
+    target_search_directory = Path(tether_directory)
+    if work_queue:
+        if cost_csv is not None or timings or size_file is not None:
+            directories = sorted(
+                directories, key=lambda dd: -costs[directory_key(dd)]
+            )
+
+    config = {
+        "search_directory": str(Path(search_directory).absolute()),
+        "filename": filename,
+        "calculations_per_staged_job": calculations_per_staged_job,
+        "slurm_header_lines": slurm_header_lines,
+        "post_slurm_lines": post_slurm_lines,
+        "executable_lines": executable_lines,
+        "parallel": parallel,
+        "work_queue": work_queue,
+        "directories": [str(Path(dd).absolute()) for dd in directories],
+    }
+
+    # Now save those jobs to the appropriate directory structure. Their
+    # directories are created first, so that running the tether again into
+    # the same directory fails before anything of the first run is
+    # overwritten, and tether.json is written last.
+    if (target_search_directory / "tether.json").exists():
+        raise FileExistsError(
+            f"{target_search_directory} already contains a tether"
+        )
+    _write_staged_jobs(
+        target_search_directory,
+        target_search_directory,
+        chunked_directories,
+        [[task_index[dd] for dd in chunk] for chunk in chunked_directories],
+        config,
+    )
+    if work_queue:
+        (target_search_directory / "claims").mkdir()
+        with open(target_search_directory / "manifest.txt", "w") as f:
+            for dd in directories:
+                f.write(f"{Path(dd).absolute()}\n")
+        print(f"Wrote a work queue of {len(directories)} tasks")
+    (target_search_directory / "done").mkdir(exist_ok=True)
+    save_json(config, target_search_directory / "tether.json")
+
+
+@timed("write")
+def _write_staged_jobs(
+    tether_directory, staging_directory, chunked_directories, indices, config
+):
+    """Writes one submit script per chunk to numbered subdirectories of the
+    staging directory."""
 
-    # Now save those jobs to the appropriate directory structure
-    L = len(submit_script_lines)
+    tether_directory = Path(tether_directory).absolute()
+    L = len(chunked_directories)
     print(f"Saving {L} submit scripts to staging directory")
     oom = floor(log10(L)) + 1
-    target_search_directory = Path(tether_directory)
-    for ii, submit_script in enumerate(submit_script_lines):
-        dd = target_search_directory / Path(str(ii).zfill(oom))
+    staged = [
+        Path(staging_directory) / Path(str(ii).zfill(oom)) for ii in range(L)
+    ]
+    for dd in staged:
         dd.mkdir(exist_ok=False, parents=True)
+    for ii, (dd, chunk) in enumerate(zip(staged, chunked_directories)):
+        # For each chunk, we write a single SLURM script which runs the
+        # executable in every directory of the chunk
+        submit_script = get_file_lines(
+            config["slurm_header_lines"],
+            chunk,
+            config["executable_lines"],
+            config["post_slurm_lines"],
+            parallel=config["parallel"],
+            summary_path=dd.absolute() / "summary.tsv",
+            indices=indices[ii],
+            work_queue=tether_directory if config["work_queue"] else None,
+            done_path=tether_directory / "done",
+        )
         with open(dd / Path("submit.sbatch"), "w") as f:
             for line in submit_script:
                 f.write(f"{line}\n")
+
+
+def unfinished_tasks(tether_directory):
+    """Finds the tasks of a tether directory which have not yet completed
+    successfully, i.e. which have no completion marker.
+
+    Parameters
+    ----------
+    tether_directory : os.PathLike
+
+    Returns
+    -------
+    list of int
+        The indices of the unfinished tasks.
+    """
+
+    tether_directory = Path(tether_directory)
+    config = read_json(tether_directory / "tether.json")
+    finished = set(os.listdir(tether_directory / "done"))
+    return [
+        ii
+        for ii in range(len(config["directories"]))
+        if str(ii) not in finished
+    ]
+
+
+def tether_resume(tether_directory, calculations_per_staged_job=None):
+    """Writes staged jobs which only run the unfinished tasks of a previous
+    tether, e.g. after its staged jobs were killed at their time limit. The
+    new submit scripts are saved to a resume_<timestamp> subdirectory of the
+    tether directory, and use the configuration stored in its tether.json.
+
+    Tasks which completed successfully are recorded by a marker file in the
+    done subdirectory of the tether directory. Since the original staged jobs
+    skip those tasks as well, resubmitting them is also possible, but
+    generally leaves most of their allocation unused.
+
+    Parameters
+    ----------
+    tether_directory : os.PathLike
+        The directory of the original tether.
+    calculations_per_staged_job : int, optional
+        The number of calculations per staged job. Default is the value of the
+        original tether.
+
+    Notes
+    -----
+    In work queue mode, the claims of the unfinished tasks are released, so
+    they are pulled again by the new staged jobs. This must only be done once
+    no staged job of the tether is still running.
+    """
+
+    tether_directory = Path(tether_directory)
+    config = read_json(tether_directory / "tether.json")
+    if calculations_per_staged_job is None:
+        calculations_per_staged_job = config["calculations_per_staged_job"]
+    unfinished = unfinished_tasks(tether_directory)
+    n_total = len(config["directories"])
+    print(f"Unfinished tasks: {len(unfinished)} of {n_total}")
+    if len(unfinished) == 0:
+        print("Every task has completed, nothing to resume")
+        return
+
+    now = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    staging_directory = tether_directory / f"resume_{now}"
+    if config["work_queue"]:
+        claims = tether_directory / "claims"
+        for ii in unfinished:
+            shutil.rmtree(claims / str(ii), ignore_errors=True)
+        if (claims / "cursor").exists():
+            (claims / "cursor").unlink()
+        n_jobs = ceil(len(unfinished) / calculations_per_staged_job)
+        chunked = [[] for _ in range(n_jobs)]
+        indices = [[] for _ in range(n_jobs)]
+    else:
+        indices = [
+            [int(ii) for ii in chunk]
+            for chunk in chunks(unfinished, calculations_per_staged_job)
+        ]
+        chunked = [
+            [config["directories"][ii] for ii in chunk] for chunk in indices
+        ]
+    _write_staged_jobs(
+        tether_directory, staging_directory, chunked, indices, config
+    )
+    print(f"Staged to {staging_directory}")
@@ -0,0 +1,187 @@
+"""Tracks the SLURM state of the jobs recorded in the submission ledger (see
+cmdr.ledger), so that the completion of a job is known without reading its
+output files.
+
+Every update runs a single bulk sacct query over all outstanding job IDs
+(those whose last known state is not a finished state), in the parsable
+format::
+
+    sacct -j <id>,<id>,... -n -P -X --format=JobID,State,ExitCode
+
+and writes the new states back to the ledger. report and check use the
+ledger to skip the output files of jobs which are still queued or running
+(see is_active), and only read those of jobs SLURM reports as finished. Since
+the wrangler may have exited before the last jobs it submitted finished,
+they first bring the ledger up to date with the same query (see
+refresh_states).
+"""
+
+import re
+
+from cmdr.ledger import UNKNOWN
+
+
+# States in which a job will not run (again) without being resubmitted
+FINISHED_STATES = {
+    "BOOT_FAIL",
+    "CANCELLED",
+    "COMPLETED",
+    "DEADLINE",
+    "FAILED",
+    "NODE_FAIL",
+    "OUT_OF_MEMORY",
+    "PREEMPTED",
+    "TIMEOUT",
+}
+
+# Status of the directories of active jobs in report and check
+RUNNING = "running"
+
+SACCT_FORMAT = ["-n", "-P", "-X", "--format=JobID,State,ExitCode"]
+
+# Pending job arrays are reported as a single line, e.g. 1234_[0-9,12%4]
+ARRAY_RANGE_PATTERN = re.compile(r"^(\d+)_\[([^\]]+)\]$")
+
+
+def is_active(state):
+    """Whether a job in the given state is still queued or running. Jobs
+    without a known state (None or UNKNOWN) are not considered active."""
+
+    return state not in (None, UNKNOWN) and state not in FINISHED_STATES
+
+
+def _expand_job_id(job_id):
+    """Expands the ID of a pending job array into the IDs of its tasks."""
+
+    match = ARRAY_RANGE_PATTERN.match(job_id)
+    if match is None:
+        return [job_id]
+    array_id, ranges = match.groups()
+    ranges = ranges.split("%")[0]
+    job_ids = []
+    for part in ranges.split(","):
+        first, _, last = part.partition("-")
+        last = last or first
+        job_ids += [
+            f"{array_id}_{ii}" for ii in range(int(first), int(last) + 1)
+        ]
+    return job_ids
+
+
+def parse_sacct(stdout):
+    """Parses the output of sacct in the format SACCT_FORMAT.
+
+    Parameters
+    ----------
+    stdout : str
+
+    Returns
+    -------
+    dict
+        Maps job IDs to their state. States such as "CANCELLED by 1234" are
+        reduced to their first word, and pending job arrays are expanded
+        into their tasks.
+    """
+
+    states = dict()
+    for line in stdout.splitlines():
+        fields = line.strip().split("|")
+        if len(fields) < 2 or not fields[0]:
+            continue
+        state = fields[1].split()[0] if fields[1].strip() else None
+        if state is None:
+            continue
+        for job_id in _expand_job_id(fields[0]):
+            states[job_id] = state
+    return states
+
+
+class JobTracker:
+    """Updates the states of the outstanding jobs of a ledger.
+
+    Parameters
+    ----------
+    ledger : cmdr.ledger.Ledger
+    backend : cmdr.slurm.SlurmBackend
+        Anything with a job_states method mapping a list of job IDs to their
+        states (e.g. cmdr.fake_slurm.FakeSlurm).
+    """
+
+    def __init__(self, ledger, backend):
+        self.ledger = ledger
+        self.backend = backend
+
+    def outstanding(self):
+        """The entries of the ledger whose jobs are not known to be finished.
+
+        Returns
+        -------
+        dict
+            Maps job IDs to ledger entries.
+        """
+
+        return {
+            entry["job_id"]: entry
+            for entry in self.ledger.entries(
+                exclude_states=FINISHED_STATES | {UNKNOWN}
+            )
+            if entry["job_id"] is not None
+        }
+
+    def update(self):
+        """Queries the states of all outstanding jobs at once and records
+        those which changed in the ledger. Jobs unknown to the scheduler keep
+        their last known state.
+
+        Returns
+        -------
+        dict
+            Maps the directories whose state changed to their new state.
+        """
+
+        outstanding = self.outstanding()
+        if not outstanding:
+            return dict()
+        states = self.backend.job_states(list(outstanding))
+        changed = {
+            outstanding[job_id]["directory"]: state
+            for job_id, state in states.items()
+            if job_id in outstanding
+            and outstanding[job_id]["state"] != state
+        }
+        self.ledger.set_states(changed)
+        return changed
+
+
+def refresh_states(ledger, sacct="sacct", log=None):
+    """Updates the states of the outstanding jobs of a ledger with a single
+    sacct query (see JobTracker.update), and returns the states of all of its
+    entries.
+
+    Parameters
+    ----------
+    ledger : cmdr.ledger.Ledger
+    sacct : str, optional
+        The sacct command. If None, the recorded states are returned as is.
+    log : callable, optional
+        Called with a message if sacct fails (e.g. when it is not available
+        on the machine running report), in which case the recorded states
+        are returned. Default discards it.
+
+    Returns
+    -------
+    dict
+        See cmdr.ledger.Ledger.states.
+    """
+
+    from cmdr.slurm import SlurmBackend
+
+    if sacct is not None:
+        # The user is only needed to count the jobs in the queue
+        backend = SlurmBackend(None, sacct=sacct)
+        try:
+            JobTracker(ledger, backend).update()
+        except RuntimeError as error:
+            if log is not None:
+                log(f"Using the recorded job states of the ledger: {error}")
+    return ledger.states()
@@ -0,0 +1,896 @@
+"""Python-native SLURM wrangler. This is the long-running replacement for
+scripts/slurm_wrangler.sh, which is executed from the crontab once a minute.
+
+The wrangler searches the directory tree once and keeps the list of pending
+jobs (directories containing the target file which were not submitted yet) in
+memory. Submissions are recorded in a central ledger (see cmdr.ledger), or
+as QUEUED marker files in the job directories if no ledger is used.
+Every cycle it queries squeue once, and submits as many pending jobs as there
+are free slots in a single burst, running several sbatch calls at once. The
+time between cycles adapts to the rate at which jobs leave the queue, rather
+than being fixed at the one minute granularity of cron. With a resubmitter
+(see cmdr.retry), finished jobs which failed in a retryable way are put back
+into the pending list once their backoff expired. Jobs declaring
+dependencies on other job directories (see cmdr.dependencies) are chained
+behind them with --dependency=afterok. A single wrangler can also manage
+several campaigns, which share the maxjobs budget according to their weights
+and quotas, and whose jobs are submitted in order of priority or expected
+runtime (see cmdr.campaigns).
+"""
+
+import atexit
+from collections import Counter
+from datetime import datetime
+import os
+from pathlib import Path
+import re
+import shlex
+import signal
+import sys
+import threading
+from time import monotonic
+
+from cmdr.campaigns import (
+    campaign_index,
+    fair_share,
+    make_campaign,
+    order_directories,
+)
+from cmdr.dependencies import (
+    BLOCKED,
+    DEPENDS_FILE,
+    DONE,
+    HELD,
+    cyclic,
+    dependency_options,
+    dependency_status,
+    read_dependencies,
+)
+from cmdr.file_utils import directory_key, exhaustive_directory_search
+from cmdr.retry import RETRY
+from cmdr.tracker import JobTracker
+
+
+# Directory (below the wrangled directory) holding job array manifests
+ARRAY_DIRECTORY = ".cmdr_arrays"
+
+# SBATCH options of the individual submit scripts which are not carried over
+# to the header of a job array
+ARRAY_STRIPPED_OPTIONS = re.compile(
+    r"^#SBATCH\s+(--output|--error|--array|--chdir|-o|-e|-a|-D)\b"
+)
+
+
+def log(message):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{now}] {message}", flush=True)
+
+
+def get_array_lines(header_lines, manifest_path, target_file):
+    """Constructs the driver script of a job array. Array task i changes
+    directory to the i'th line of the manifest and runs the target file there
+    with bash, writing its output to slurm-<array job ID>_<task ID>.out in
+    that directory.
+
+    Parameters
+    ----------
+    header_lines : list of str
+        The shebang and SBATCH lines of the array script.
+    manifest_path : os.PathLike
+        The manifest, containing one directory per line.
+    target_file : str
+        The name of the script to run in every directory.
+
+    Returns
+    -------
+    list of str
+    """
+
+    lines = list(header_lines)
+    lines[-1] += "\n"
+    lines += [
+        f"MANIFEST={shlex.quote(str(manifest_path))}",
+        'dir=$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" "$MANIFEST")',
+        'cd "$dir" || exit 1',
+        'export SLURM_SUBMIT_DIR="$dir"',
+        'log="slurm-${SLURM_ARRAY_JOB_ID}_${SLURM_ARRAY_TASK_ID}.out"',
+        f'bash {shlex.quote(target_file)} > "$log" 2>&1',
+    ]
+    return lines
+
+
+def get_array_header(script_path):
+    """Extracts the shebang and SBATCH lines of a submit script to be used as
+    the header of a job array, dropping options which only make sense for a
+    single job (output, error, array and chdir).
+
+    Parameters
+    ----------
+    script_path : os.PathLike
+
+    Returns
+    -------
+    list of str
+    """
+
+    header = []
+    with open(script_path, "r") as f:
+        for ii, line in enumerate(f):
+            line = line.rstrip("\n")
+            if ii == 0 and line.startswith("#!"):
+                header.append(line)
+            elif line.startswith("#SBATCH"):
+                if not ARRAY_STRIPPED_OPTIONS.match(line):
+                    header.append(line)
+    if not header or not header[0].startswith("#!"):
+        header.insert(0, "#!/bin/bash")
+    return header
+
+
+class Wrangler:
+    """Submits the jobs in a directory tree while keeping at most maxjobs
+    queued or running.
+
+    Parameters
+    ----------
+    directory : os.PathLike
+        The directory to search recursively for target files, unless
+        campaigns are provided. Job arrays are written below it.
+    maxjobs : int
+        The maximum number of jobs queued or running at once.
+    backend : cmdr.slurm.SlurmBackend
+        Used to count active jobs and submit new ones.
+    target_file : str, optional
+        The name of the submit script identifying a job directory.
+    queued_marker : str, optional
+        The name of the marker file written to a directory once its job has
+        been submitted (containing the job ID), if no ledger is used.
+        Directories containing it are never submitted again.
+    min_interval : float, optional
+        The minimum time between cycles, in seconds.
+    max_interval : float, optional
+        The maximum time between cycles, in seconds.
+    rescan_interval : float, optional
+        The time between searches of the directory tree for new jobs, in
+        seconds.
+    exclude : list of str, optional
+        Glob patterns of directory names to prune from the search.
+    clock : callable, optional
+        Returns the current time in seconds. Default is time.monotonic.
+    sleep : callable, optional
+        Called with the number of seconds to wait between cycles. Default
+        waits on the stop event, so that stop interrupts the wait. Together
+        with clock, this allows running the wrangler against a simulated
+        scheduler (see cmdr.fake_slurm).
+    verbose : bool, optional
+        If False, nothing is logged. Default is True.
+    array : bool, optional
+        If True, pending jobs are grouped into SLURM job arrays, so that a
+        single sbatch call submits up to array_size directories. The header of
+        every array is taken from the target file of its first directory, so
+        the jobs are assumed to request the same resources. Default is False.
+    array_size : int, optional
+        The maximum number of directories per job array (bounded by the
+        MaxArraySize of the cluster).
+    array_throttle : int, optional
+        If provided, at most this many tasks of an array run at once
+        (--array=0-N%K).
+    ledger : cmdr.ledger.Ledger, optional
+        If provided, submissions are recorded in the ledger instead of in
+        marker files, and directories in the ledger are never submitted
+        again. The markers of directories which are not in the ledger yet are
+        imported on the first search.
+    track : bool, optional
+        If True and a ledger is used, the states of the submitted jobs are
+        updated in the ledger with one bulk query (see cmdr.tracker) every
+        cycle. Default is True.
+    resubmitter : cmdr.retry.Resubmitter, optional
+        If provided (together with a ledger and tracking), the outcome of
+        every finished job is decided each cycle, and jobs whose
+        resubmission is due are submitted again before the pending jobs. The
+        run loop then only finishes once no job is queued, running or
+        scheduled for resubmission.
+    depends_file : str, optional
+        The name of the file listing the directories a job depends on (see
+        cmdr.dependencies). If None, jobs are submitted independently.
+    chain : bool, optional
+        If True, jobs are submitted as soon as their dependencies were
+        submitted, with --dependency=afterok on their job IDs, using the
+        slots left over by jobs without outstanding dependencies. If False,
+        they are held until their dependencies completed (which requires a
+        ledger with tracking). Default is True.
+    campaigns : list of dict, optional
+        The campaigns to search instead of directory (see cmdr.campaigns).
+        Their pending jobs are submitted in the order of the campaign, and
+        the free slots of every cycle are shared according to their weights
+        and quotas. Multiple campaigns and quotas require a ledger with
+        tracking, from which the active jobs of every campaign are counted.
+    """
+
+    def __init__(
+        self,
+        directory,
+        maxjobs,
+        backend,
+        target_file="submit.sbatch",
+        queued_marker="QUEUED",
+        min_interval=10.0,
+        max_interval=300.0,
+        rescan_interval=600.0,
+        exclude=None,
+        clock=monotonic,
+        sleep=None,
+        verbose=True,
+        array=False,
+        array_size=1000,
+        array_throttle=None,
+        ledger=None,
+        track=True,
+        resubmitter=None,
+        depends_file=DEPENDS_FILE,
+        chain=True,
+        campaigns=None,
+    ):
+        self.directory = Path(directory)
+        self.maxjobs = maxjobs
+        self.backend = backend
+        self.target_file = target_file
+        self.queued_marker = queued_marker
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.rescan_interval = rescan_interval
+        self.exclude = list(exclude) if exclude is not None else []
+        self.exclude.append(ARRAY_DIRECTORY)
+        self.array = array
+        self.array_size = array_size
+        self.array_throttle = array_throttle
+        self.ledger = ledger
+        self.tracker = None
+        if ledger is not None and track:
+            self.tracker = JobTracker(ledger, backend)
+        self.resubmitter = resubmitter
+        self.depends_file = depends_file
+        self.chain = chain
+        self.dependencies = dict()
+        self.blocked = set()
+        if campaigns is None:
+            campaigns = [make_campaign(directory)]
+        self.campaigns = campaigns
+        self._roots = [
+            directory_key(campaign["directory"]) for campaign in campaigns
+        ]
+        self._campaign_of = dict()
+        self.shared = len(campaigns) > 1 or any(
+            campaign["quota"] is not None for campaign in campaigns
+        )
+        if self.shared and self.tracker is None:
+            raise ValueError(
+                "Multiple campaigns and quotas require a ledger with tracking"
+            )
+        self._array_count = 0
+        self.pending = []
+        self.submitted = dict()
+        self.interval = min_interval
+        self._last_active = None
+        self._last_scan = None
+        self._stop = threading.Event()
+        self._clock = clock
+        self._sleep = self._stop.wait if sleep is None else sleep
+        self.verbose = verbose
+
+    def _log(self, message):
+        if self.verbose:
+            log(message)
+
+    def discover(self):
+        """Searches the directory tree for job directories which have not been
+        queued yet, and replaces the pending list with them.
+
+        Returns
+        -------
+        int
+            The number of pending jobs.
+        """
+
+        found = [
+            list(
+                exhaustive_directory_search(
+                    campaign["directory"],
+                    self.target_file,
+                    exclude=self.exclude,
+                )
+            )
+            for campaign in self.campaigns
+        ]
+        known = set()
+        if self.ledger is not None:
+            if not self.ledger.migrated:
+                marker = self.queued_marker
+                n = self.ledger.migrate_markers(
+                    [dd for directories in found for dd in directories],
+                    marker,
+                )
+                self._log(f"Imported {n} {marker} markers into the ledger")
+            known = self.ledger.directories()
+        self.pending = []
+        for campaign, directories in zip(self.campaigns, found):
+            directories = [
+                str(dd)
+                for dd in directories
+                if str(dd) not in self.submitted
+                and directory_key(dd) not in known
+                and directory_key(dd) not in self.blocked
+                and (
+                    self.ledger is not None
+                    or not (dd / self.queued_marker).exists()
+                )
+            ]
+            self.pending += order_directories(directories, campaign)
+        if self.depends_file is not None:
+            self.dependencies = {
+                directory_key(directory): read_dependencies(
+                    directory, self.depends_file
+                )
+                for directory in self.pending
+            }
+            self.block(cyclic(self.dependencies), "dependency cycle")
+        self._last_scan = self._clock()
+        self._log(f"Found {len(self.pending)} pending jobs")
+        return len(self.pending)
+
+    def block(self, directories, reason):
+        """Removes directories from the pending list for good, e.g. because
+        a job they depend on failed."""
+
+        keys = {directory_key(directory) for directory in directories}
+        if not keys:
+            return
+        for directory in self.pending:
+            if directory_key(directory) in keys:
+                self._log(f"blocked ({reason}): {directory}")
+        self.blocked |= keys
+        self.pending = [
+            dd for dd in self.pending if directory_key(dd) not in keys
+        ]
+
+    def _dependencies(self, directory):
+        if self.depends_file is None:
+            return []
+        key = directory_key(directory)
+        if key not in self.dependencies:
+            self.dependencies[key] = read_dependencies(
+                directory, self.depends_file
+            )
+        return self.dependencies[key]
+
+    def _dependency_status(self, dependency, unsubmitted, submitted):
+        if dependency in unsubmitted:
+            return HELD
+        if self.ledger is not None:
+            entry = self.ledger.get(dependency)
+            if entry is not None:
+                return dependency_status(entry, self.resubmitter is not None)
+        elif dependency in submitted:
+            return submitted[dependency]
+        elif (Path(dependency) / self.queued_marker).exists():
+            return DONE
+        return BLOCKED
+
+    def _campaign(self, directory):
+        """The index of the campaign of directory (the first one if it is in
+        none of them)."""
+
+        if len(self.campaigns) == 1:
+            return 0
+        key = directory_key(directory)
+        if key not in self._campaign_of:
+            index = campaign_index(key, self._roots)
+            self._campaign_of[key] = 0 if index is None else index
+        return self._campaign_of[key]
+
+    def _active(self):
+        """The number of active jobs of every campaign according to the
+        ledger, or None if the campaigns do not share the slots."""
+
+        if not self.shared:
+            return None
+        active = [0] * len(self.campaigns)
+        for entry in self.tracker.outstanding().values():
+            active[self._campaign(entry["directory"])] += 1
+        return active
+
+    def _share(self, n, available, active):
+        if active is None:
+            return [min(n, available[0])]
+        return fair_share(
+            n,
+            active,
+            available,
+            [campaign["weight"] for campaign in self.campaigns],
+            [campaign["quota"] for campaign in self.campaigns],
+        )
+
+    def select(self, n, waiting=()):
+        """Removes up to n directories which can be submitted now from the
+        pending list. Jobs without outstanding dependencies come first, then
+        jobs chained behind their dependencies (see cmdr.dependencies), which
+        thus only use the slots left over. Jobs depending on a job which
+        failed for good are blocked. With several campaigns, the slots are
+        shared according to their weights and quotas (see
+        cmdr.campaigns.fair_share), and the jobs of every campaign are taken
+        in the order of the pending list.
+
+        Parameters
+        ----------
+        n : int
+        waiting : list, optional
+            Directories which are not pending, but not submitted yet either
+            (e.g. failed submissions).
+
+        Returns
+        -------
+        list of tuple
+            The directory and the additional sbatch options (or None) of
+            every job to submit.
+        """
+
+        unsubmitted = set()
+        submitted = dict()
+        if self.depends_file is not None:
+            unsubmitted = {directory_key(dd) for dd in self.pending}
+            unsubmitted |= {directory_key(dd) for dd in waiting}
+            if self.ledger is None:
+                submitted = {
+                    directory_key(dd): job_id
+                    for dd, job_id in self.submitted.items()
+                }
+        statuses = dict()
+        ready = [[] for _ in self.campaigns]
+        chained = [[] for _ in self.campaigns]
+        blocked = []
+        n_full = 0
+        scanned = len(self.pending)
+        for ii, directory in enumerate(self.pending):
+            campaign = self._campaign(directory)
+            if len(ready[campaign]) >= n:
+                continue
+            status = []
+            for dependency in self._dependencies(directory):
+                if dependency not in statuses:
+                    statuses[dependency] = self._dependency_status(
+                        dependency, unsubmitted, submitted
+                    )
+                status.append(statuses[dependency])
+            job_ids = [xx for xx in status if xx not in (DONE, HELD, BLOCKED)]
+            if BLOCKED in status:
+                blocked.append(directory)
+            elif HELD in status:
+                continue
+            elif not job_ids:
+                ready[campaign].append((directory, None))
+                if len(ready[campaign]) == n:
+                    n_full += 1
+                    if n_full == len(self.campaigns):
+                        scanned = ii + 1
+                        break
+            elif self.chain and len(chained[campaign]) < n:
+                chained[campaign].append(
+                    (directory, dependency_options(job_ids))
+                )
+
+        self.block(blocked, "failed or missing dependency")
+        active = self._active()
+        selected = []
+        for candidates in [ready, chained]:
+            available = [len(xx) for xx in candidates]
+            share = self._share(n - len(selected), available, active)
+            for xx, k in zip(candidates, share):
+                selected += xx[:k]
+            if active is not None:
+                active = [xx + k for xx, k in zip(active, share)]
+        # Only the scanned part of the pending list can contain selected jobs
+        taken = {directory for directory, _ in selected}
+        self.pending = [
+            dd for dd in self.pending[:scanned] if dd not in taken
+        ] + self.pending[scanned:]
+        return selected
+
+    def mark_queued(self, directory, job_id):
+        """Records the submission of directory in the ledger, or writes its
+        QUEUED marker (containing the job ID) if no ledger is used."""
+
+        if self.ledger is not None:
+            self.ledger.record_submissions([(directory, job_id)])
+            return
+        with open(Path(directory) / self.queued_marker, "w") as f:
+            f.write(f"{job_id}\n")
+
+    def mark_queued_many(self, submissions):
+        """Records many (directory, job ID) submissions, in a single
+        transaction if a ledger is used."""
+
+        if self.ledger is not None:
+            self.ledger.record_submissions(submissions)
+            return
+        for directory, job_id in submissions:
+            self.mark_queued(directory, job_id)
+
+    def submit(self, directory):
+        """Submits the job in directory and records it (see mark_queued).
+
+        Returns
+        -------
+        str or None
+            The job ID, or None if the submission failed.
+        """
+
+        job_id = self.backend.submit(directory, self.target_file)
+        if job_id is None:
+            self._log(f"submit error: {directory}")
+            return None
+        self.mark_queued(directory, job_id)
+        self.submitted[directory] = job_id
+        self._log(f"submitted job id {job_id}: {directory}")
+        return job_id
+
+    def submit_batch(self, directories, options=None):
+        """Submits the jobs in directories, running several sbatch calls at
+        once (see cmdr.slurm.SlurmBackend.submit_many), and records those
+        which were submitted (see mark_queued_many).
+
+        Parameters
+        ----------
+        directories : list
+        options : list, optional
+            The additional sbatch options (or None) of every directory.
+
+        Returns
+        -------
+        list
+            The job ID of every directory, or None where the submission
+            failed.
+        """
+
+        if options is None:
+            options = [None] * len(directories)
+        job_ids = self.backend.submit_many(
+            [
+                (directory, self.target_file, opts)
+                for directory, opts in zip(directories, options)
+            ]
+        )
+        submitted = []
+        for directory, job_id in zip(directories, job_ids):
+            if job_id is None:
+                self._log(f"submit error: {directory}")
+                continue
+            submitted.append((directory, job_id))
+            self.submitted[directory] = job_id
+            self._log(f"submitted job id {job_id}: {directory}")
+        self.mark_queued_many(submitted)
+        return job_ids
+
+    def prepare_array(self, directories):
+        """Writes the manifest and driver script of a job array.
+
+        Returns
+        -------
+        tuple
+            The directory to submit from and the name of the driver script.
+        """
+
+        self._array_count += 1
+        now = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        array_directory = (
+            self.directory.absolute()
+            / ARRAY_DIRECTORY
+            / f"{now}_{self._array_count:04d}"
+        )
+        array_directory.mkdir(parents=True, exist_ok=False)
+        manifest_path = array_directory / "manifest.txt"
+        with open(manifest_path, "w") as f:
+            for directory in directories:
+                f.write(f"{Path(directory).absolute()}\n")
+
+        header = get_array_header(Path(directories[0]) / self.target_file)
+        header.append(f"#SBATCH --output={array_directory}/%A_%a.out")
+        lines = get_array_lines(header, manifest_path, self.target_file)
+        with open(array_directory / "array.sbatch", "w") as f:
+            for line in lines:
+                f.write(f"{line}\n")
+        return array_directory, "array.sbatch"
+
+    def submit_array(self, directories):
+        """Submits the jobs in directories as a single job array and records
+        them with the job IDs <array job ID>_<task ID>.
+
+        Returns
+        -------
+        str or None
+            The array job ID, or None if the submission failed.
+        """
+
+        array_directory, script = self.prepare_array(directories)
+        option = f"--array=0-{len(directories) - 1}"
+        if self.array_throttle is not None:
+            option += f"%{self.array_throttle}"
+        job_id = self.backend.submit(array_directory, script, [option])
+        if job_id is None:
+            self._log(f"submit error: array {array_directory}")
+            return None
+        submitted = [
+            (directory, f"{job_id}_{ii}")
+            for ii, directory in enumerate(directories)
+        ]
+        self.mark_queued_many(submitted)
+        self.submitted.update(submitted)
+        self._log(
+            f"submitted array job id {job_id} ({len(directories)} tasks): "
+            f"{array_directory}"
+        )
+        return job_id
+
+    def cycle(self):
+        """Runs a single cycle: queries the number of active jobs once, then
+        submits pending jobs until the free slots are filled.
+
+        Returns
+        -------
+        int
+            The number of jobs submitted.
+        """
+
+        if self.tracker is not None:
+            self.track()
+        if self.resubmitter is not None:
+            self.requeue()
+        active = self.backend.active_jobs()
+        free = self.maxjobs - active
+        self._adapt_interval(active)
+
+        # Every round submits the jobs which can be submitted given the job
+        # IDs of the previous rounds, so that a chain of dependent jobs is
+        # submitted in a single cycle
+        failed = []
+        n_submitted = 0
+        while free > 0 and self.pending and not self._stop.is_set():
+            selected = self.select(free, failed)
+            if not selected:
+                break
+            free -= len(selected)
+            if self.array:
+                # Chained jobs have their own dependencies, so only the others
+                # are grouped into arrays, one campaign at a time
+                independent = dict()
+                for directory, opts in selected:
+                    if opts is None:
+                        campaign = self._campaign(directory)
+                        independent.setdefault(campaign, []).append(directory)
+                selected = [xx for xx in selected if xx[1] is not None]
+                for group in independent.values():
+                    for ii in range(0, len(group), self.array_size):
+                        directories = group[ii : ii + self.array_size]
+                        if self.submit_array(directories) is None:
+                            failed.extend(directories)
+                            continue
+                        n_submitted += len(directories)
+            if not selected:
+                continue
+            directories = [directory for directory, _ in selected]
+            options = [opts for _, opts in selected]
+            for directory, job_id in zip(
+                directories, self.submit_batch(directories, options)
+            ):
+                if job_id is None:
+                    failed.append(directory)
+                    continue
+                n_submitted += 1
+
+        # Failed submissions are retried on the next cycle, after the others
+        self.pending.extend(failed)
+        self._last_active = active + n_submitted
+        return n_submitted
+
+    def track(self):
+        """Updates the states of the submitted jobs in the ledger. A failed
+        query is logged, but does not stop the cycle.
+
+        Returns
+        -------
+        dict
+            Maps the directories whose state changed to their new state.
+        """
+
+        try:
+            changed = self.tracker.update()
+        except RuntimeError as error:
+            self._log(f"tracking failed: {error}")
+            return dict()
+        if changed:
+            counts = sorted(Counter(changed.values()).items())
+            summary = ", ".join(f"{n} {state}" for state, n in counts)
+            self._log(f"job states changed: {summary}")
+        return changed
+
+    def requeue(self):
+        """Decides the outcome of the finished jobs (see
+        cmdr.retry.Resubmitter.resolve) and puts the directories whose
+        resubmission is due in front of the pending list.
+
+        Returns
+        -------
+        int
+            The number of directories put back into the pending list.
+        """
+
+        outcomes = self.resubmitter.resolve()
+        if outcomes:
+            counts = sorted(Counter(outcomes.values()).items())
+            summary = ", ".join(f"{n} {outcome}" for outcome, n in counts)
+            self._log(f"job outcomes: {summary}")
+        pending = {directory_key(directory) for directory in self.pending}
+        due = [
+            directory
+            for directory in self.resubmitter.due() + self.repend()
+            if directory not in pending
+        ]
+        if due:
+            self._log(f"Resubmitting {len(due)} jobs")
+        self.pending = due + self.pending
+        return len(due)
+
+    def repend(self):
+        """Finds the chained jobs which SLURM cancelled because an attempt of
+        a job they depend on failed (see cmdr.dependencies.KILL_ON_INVALID),
+        although that job is being retried, and removes them from the ledger
+        so that they are submitted again behind its next attempt.
+
+        Returns
+        -------
+        list of str
+            The directories to submit again.
+        """
+
+        if self.depends_file is None:
+            return []
+        candidates = {
+            entry["directory"]: entry
+            for entry in self.ledger.entries(states=["CANCELLED"])
+            if entry["outcome"] is not None
+            and self._dependencies(entry["directory"])
+        }
+        # A job is cancelled with the jobs depending on it, so a whole chain
+        # is put back at once
+        repended = dict()
+        changed = True
+        while changed:
+            changed = False
+            for directory, entry in candidates.items():
+                if directory in repended:
+                    continue
+                restarted = False
+                blocked = False
+                for dependency in self._dependencies(directory):
+                    if dependency in repended:
+                        restarted = True
+                        continue
+                    upstream = self.ledger.get(dependency)
+                    if upstream is None:
+                        blocked = True
+                        break
+                    status = dependency_status(upstream, retrying=True)
+                    if status == BLOCKED:
+                        blocked = True
+                        break
+                    # Either the attempt it was chained behind failed, or the
+                    # dependency was resubmitted since
+                    restarted = restarted or upstream["outcome"] == RETRY
+                    restarted = restarted or (
+                        upstream["submit_time"] > entry["submit_time"]
+                    )
+                if restarted and not blocked:
+                    repended[directory] = entry
+                    changed = True
+        if not repended:
+            return []
+        self.ledger.remove(repended)
+        for directory in list(self.submitted):
+            if directory_key(directory) in repended:
+                del self.submitted[directory]
+        for directory in repended:
+            self._log(f"requeued (dependency is retried): {directory}")
+        return sorted(repended)
+
+    def _adapt_interval(self, active):
+        """Shortens the interval when jobs left the queue since the previous
+        cycle, and backs off when nothing changed."""
+
+        if self._last_active is None:
+            return
+        if active < self._last_active:
+            self.interval = max(self.min_interval, self.interval / 2.0)
+        else:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+
+    def stop(self, *args):
+        """Requests the run loop to finish after the current cycle. Also used
+        as the SIGTERM handler."""
+
+        self._log("Stop requested, shutting down")
+        self._stop.set()
+
+    def run(self):
+        """Runs cycles until every job has been submitted (and, with a
+        resubmitter, has finished without being scheduled for resubmission)
+        or stop is called.
+        SIGTERM and SIGINT stop the loop cleanly when called from the main
+        thread.
+
+        Returns
+        -------
+        int
+            The total number of jobs submitted.
+        """
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        self.discover()
+        if self.maxjobs == 0:
+            self._log("DRYRUN - would attempt to submit the following jobs")
+            for directory in self.pending:
+                print(directory)
+            return 0
+
+        total = 0
+        while not self._stop.is_set():
+            if self._clock() - self._last_scan > self.rescan_interval:
+                self.discover()
+            waiting = (
+                self.resubmitter is not None and self.resubmitter.waiting()
+            )
+            if not self.pending and not waiting and self.discover() == 0:
+                self._log("!!! Finished !!!")
+                break
+            try:
+                total += self.cycle()
+            except RuntimeError as error:
+                self._log(f"cycle failed: {error}")
+            self._log(
+                f"{len(self.pending)} jobs pending, next cycle in "
+                f"{self.interval:.1f} s"
+            )
+            self._sleep(self.interval)
+        return total
+
+
+def daemonize(log_file, pid_file=None):
+    """Detaches the current process from the terminal (double fork), and
+    redirects stdout and stderr to log_file.
+
+    Parameters
+    ----------
+    log_file : os.PathLike
+    pid_file : os.PathLike, optional
+        If provided, the daemon's process ID is written to this file, which is
+        removed again when the daemon exits.
+    """
+
+    if os.fork() > 0:
+        os._exit(0)
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with open(os.devnull, "r") as devnull:
+        os.dup2(devnull.fileno(), sys.stdin.fileno())
+    with open(log_file, "a") as f:
+        os.dup2(f.fileno(), sys.stdout.fileno())
+        os.dup2(f.fileno(), sys.stderr.fileno())
+
+    if pid_file is not None:
+        Path(pid_file).write_text(f"{os.getpid()}\n")
+        atexit.register(lambda: Path(pid_file).unlink(missing_ok=True))
@@ -0,0 +1,17 @@
+import pytest
+
+from benchmarks import wrangler_throughput
+
+
+@pytest.mark.parametrize("array", [False, True])
+def test_wrangler_throughput_with_fewer_slots_than_maxjobs(array):
+    result = wrangler_throughput.run(
+        jobs=500, maxjobs=50, slots=40, runtime=100.0, array=array
+    )
+    results = result["results"]
+    assert results["submitted"] == 500
+    assert results["makespan"] >= results["last_submission_time"]
+    # At most 40 jobs run at once, so the campaign takes at least
+    # 500 / 40 rounds of the shortest runtime
+    assert results["makespan"] >= 500 / 40 * 50.0
+    assert max(running for _, running, _ in result["occupancy"]) <= 40
@@ -0,0 +1,112 @@
+import gzip
+import os
+
+from cmdr.cache import (
+    ResultCache,
+    default_cache_path,
+    file_stats,
+    make_spec,
+)
+from cmdr.check import check
+
+
+SPEC = make_spec(require_filename="OUTCAR", require_text="timing")
+
+
+def _job(root, name, text="timing\n"):
+    (root / name).mkdir(parents=True)
+    (root / name / "OUTCAR").write_text(text)
+    return root / name
+
+
+def test_make_spec_is_order_independent():
+    assert make_spec(a=1, b=[2]) == make_spec(b=[2], a=1)
+    assert default_cache_path("/data/campaign").name == (
+        ".campaign.cmdr-cache.sqlite"
+    )
+
+
+def test_file_stats(tmp_path):
+    job = _job(tmp_path, "a")
+    with gzip.open(job / "xmu.dat.gz", "wt") as f:
+        f.write("1 2\n")
+    stats = file_stats(job, ["OUTCAR", "xmu.dat", "missing"])
+    assert stats[0][:2] == ["OUTCAR", 7]
+    assert stats[1][0] == "xmu.dat" and stats[1][1] > 0
+    assert stats[2] == ["missing", None, None]
+
+
+def test_lookup_invalidated_by_file_stats(tmp_path):
+    job = _job(tmp_path, "a")
+    path = tmp_path / "cache.sqlite"
+    with ResultCache(path) as cache:
+        cache.add(SPEC, job, file_stats(job, ["OUTCAR"]), value="VASP")
+        assert cache.lookup(SPEC, job, file_stats(job, ["OUTCAR"])) == (
+            True,
+            "VASP",
+        )
+
+    # Persisted, and keyed by the specification
+    with ResultCache(path) as cache:
+        stats = file_stats(job, ["OUTCAR"])
+        assert cache.lookup(SPEC, job, stats) == (True, "VASP")
+        assert cache.lookup(make_spec(x=1), job, stats) == (False, None)
+
+        # A changed mtime invalidates the entry
+        st = os.stat(job / "OUTCAR")
+        os.utime(job / "OUTCAR", ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+        assert cache.lookup(SPEC, job, file_stats(job, ["OUTCAR"]))[0] is False
+
+        # So does a changed size, or a compressed file replacing the output
+        cache.add(SPEC, job, file_stats(job, ["OUTCAR"]))
+        (job / "OUTCAR").write_text("timing and more\n")
+        assert cache.lookup(SPEC, job, file_stats(job, ["OUTCAR"]))[0] is False
+        cache.add(SPEC, job, file_stats(job, ["OUTCAR"]))
+        with gzip.open(job / "OUTCAR.gz", "wt") as f:
+            f.write("timing and more\n")
+        os.remove(job / "OUTCAR")
+        assert cache.lookup(SPEC, job, file_stats(job, ["OUTCAR"]))[0] is False
+
+
+def _cached(cache, spec, job, filenames):
+    return cache.lookup(spec, job, file_stats(job, filenames))[0]
+
+
+def test_refresh_clear_and_invalidate(tmp_path):
+    jobs = [_job(tmp_path, name) for name in ["a", "b"]]
+    path = tmp_path / "cache.sqlite"
+    with ResultCache(path) as cache:
+        for job in jobs:
+            cache.add(SPEC, job, file_stats(job, ["OUTCAR"]))
+        cache.add(make_spec(x=1), jobs[1], [])
+
+    with ResultCache(path, refresh=True) as cache:
+        assert not _cached(cache, SPEC, jobs[0], ["OUTCAR"])
+    with ResultCache(path) as cache:
+        assert _cached(cache, SPEC, jobs[0], ["OUTCAR"])
+        cache.invalidate(directories=[jobs[0]])
+        assert not _cached(cache, SPEC, jobs[0], ["OUTCAR"])
+        assert _cached(cache, SPEC, jobs[1], ["OUTCAR"])
+        cache.invalidate(spec=SPEC)
+        assert not _cached(cache, SPEC, jobs[1], ["OUTCAR"])
+        assert _cached(cache, make_spec(x=1), jobs[1], [])
+    with ResultCache(path, clear=True) as cache:
+        assert not _cached(cache, make_spec(x=1), jobs[1], [])
+
+
+def test_check_reuses_cache(tmp_path):
+    root = tmp_path / "campaign"
+    for name in ["done", "failed"]:
+        _job(root, name, "timing\n" if name == "done" else "crash\n")
+        (root / name / "INCAR").touch()
+    report_path = tmp_path / "report.json"
+    arguments = [root, "INCAR", "OUTCAR", "timing", report_path]
+    check(*arguments, use_cache=True)
+    with ResultCache(default_cache_path(root)) as cache:
+        assert len(cache._entries) == 1
+
+    # A finished job which is rewritten is checked again
+    (root / "done" / "OUTCAR").write_text("crash, restarted\n")
+    os.utime(root / "done" / "OUTCAR", ns=(0, 0))
+    check(*arguments, use_cache=True)
+    assert report_path.read_text().count("campaign/") == 2
@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+
+from cmdr.campaigns import (
+    campaign_index,
+    fair_share,
+    load_campaigns,
+    make_campaign,
+    order_directories,
+)
+
+
+def test_fair_share_by_weight():
+    assert fair_share(6, [0, 0], [10, 10], [2.0, 1.0], [None, None]) == [
+        4,
+        2,
+    ]
+    # Slots first go to the campaign with the fewest active jobs
+    assert fair_share(4, [6, 0], [10, 10], [1.0, 1.0], [None, None]) == [
+        0,
+        4,
+    ]
+    assert fair_share(6, [6, 0], [10, 10], [1.0, 1.0], [None, None]) == [
+        0,
+        6,
+    ]
+    assert fair_share(8, [6, 0], [10, 10], [1.0, 1.0], [None, None]) == [
+        1,
+        7,
+    ]
+
+
+def test_fair_share_available_and_quota():
+    # Slots a campaign cannot use go to the others
+    assert fair_share(10, [0, 0], [2, 20], [1.0, 1.0], [None, None]) == [
+        2,
+        8,
+    ]
+    assert fair_share(10, [0, 3], [20, 20], [1.0, 1.0], [None, 5]) == [8, 2]
+    assert fair_share(10, [0, 5], [20, 20], [1.0, 1.0], [None, 5]) == [
+        10,
+        0,
+    ]
+    # Slots are left over if no campaign can use them
+    assert fair_share(10, [0, 0], [1, 2], [1.0, 1.0], [None, 1]) == [1, 1]
+    assert fair_share(3, [0], [0], [1.0], [None]) == [0]
+    assert fair_share(0, [0], [5], [1.0], [None]) == [0]
+
+
+def test_campaign_index(tmp_path):
+    roots = [str(tmp_path / "a"), str(tmp_path / "a" / "b")]
+    assert campaign_index(tmp_path / "a" / "x", roots) == 0
+    assert campaign_index(tmp_path / "a", roots) == 0
+    assert campaign_index(tmp_path / "a" / "b" / "x", roots) == 1
+    assert campaign_index(tmp_path / "a" / "bc", roots) == 0
+    assert campaign_index(tmp_path / "ab", roots) is None
+
+
+def test_order_directories(tmp_path):
+    directories = []
+    for name, priority in [("c", "1"), ("a", "1"), ("b", "5"), ("d", "x")]:
+        directory = tmp_path / name
+        directory.mkdir()
+        (directory / "priority").write_text(priority)
+        directories.append(str(directory))
+    by_name = order_directories(directories, make_campaign(tmp_path))
+    assert [os.path.basename(dd) for dd in by_name] == ["a", "b", "c", "d"]
+    campaign = make_campaign(tmp_path, order="priority")
+    by_priority = order_directories(directories, campaign)
+    assert [os.path.basename(dd) for dd in by_priority] == [
+        "b",
+        "a",
+        "c",
+        "d",
+    ]
+
+
+def test_load_campaigns(tmp_path):
+    path = tmp_path / "campaigns.json"
+    path.write_text(
+        json.dumps(
+            [
+                {"directory": "relax", "weight": 2},
+                {"directory": "spectra", "quota": 50, "order": "priority"},
+            ]
+        )
+    )
+    relax, spectra = load_campaigns(path, defaults={"order": "runtime"})
+    assert relax["weight"] == 2
+    assert relax["order"] == "runtime"
+    assert spectra["quota"] == 50
+    assert spectra["order"] == "priority"
+    for entries in [
+        [{"weight": 2}],
+        [{"directory": "relax", "wieght": 2}],
+        [{"directory": "relax", "order": "size"}],
+        [{"directory": "relax", "weight": 0}],
+    ]:
+        path.write_text(json.dumps(entries))
+        with pytest.raises(ValueError):
+            load_campaigns(path)
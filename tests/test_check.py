@@ -0,0 +1,103 @@
+import gzip
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from cmdr.check import check, check_directory
+from cmdr.file_utils import bre_to_regex, file_contains, grep_pattern
+
+
+CONTENT = (
+    "hello world\n"
+    "foo (bar) 12+3\n"
+    "\n"
+    "TOTAL-FORCE a.b\n"
+    " General timing and accounting informations for this job:\n"
+)
+
+PATTERNS = [
+    "hello",
+    "wor.d",
+    "^foo",
+    "job:$",
+    "(bar)",
+    "\\(bar\\)",
+    "12+3",
+    "2\\+3",
+    "[0-9]\\{2\\}",
+    "[[:upper:]]\\{5\\}-",
+    "a\\.b",
+    "*x",
+    "^$",
+    "\\<world\\>",
+    "[^a-z ]orld",
+    "foo\\|nomatch",
+    "o\\{3\\}",
+]
+
+
+def _grep(pattern, path):
+    return subprocess.run(["grep", "-q", pattern, str(path)]).returncode == 0
+
+
+@pytest.mark.skipif(shutil.which("grep") is None, reason="requires grep")
+@pytest.mark.parametrize("pattern", PATTERNS)
+@pytest.mark.parametrize(
+    "kwargs", [{}, {"mmap_threshold": 1}, {"block_size": 3}]
+)
+def test_file_contains_matches_grep(tmp_path, pattern, kwargs):
+    path = tmp_path / "OUTCAR"
+    path.write_text(CONTENT)
+    expected = _grep(pattern, path)
+    assert file_contains(path, grep_pattern(pattern), **kwargs) == expected
+
+
+def test_file_contains_compressed(tmp_path):
+    with gzip.open(tmp_path / "OUTCAR.gz", "wt") as f:
+        f.write(CONTENT)
+    assert file_contains(tmp_path / "OUTCAR", grep_pattern("^TOTAL-F"))
+    assert not file_contains(tmp_path / "OUTCAR", grep_pattern("^hello$"))
+
+
+def test_grep_pattern_literal():
+    assert grep_pattern("General timing") == b"General timing"
+    assert bre_to_regex("a(b)+c") == "a\\(b\\)\\+c"
+    assert bre_to_regex("\\(ab\\)\\{2\\}") == "(ab){2}"
+
+
+def test_check_directory_statuses(tmp_path):
+    for name in ["ok", "no_line", "no_file", "corrupt"]:
+        (tmp_path / name).mkdir()
+    (tmp_path / "ok" / "OUTCAR").write_text(CONTENT)
+    (tmp_path / "no_line" / "OUTCAR").write_text("nothing\n")
+    (tmp_path / "corrupt" / "OUTCAR.gz").write_bytes(b"\x1f\x8b\x08garbage")
+
+    def _check(name):
+        return check_directory(tmp_path / name, "OUTCAR", "timing.*job")
+
+    assert _check("ok") is None
+    assert _check("no_line") == "no_line"
+    assert _check("no_file") == "no_file"
+    assert _check("corrupt") == "unreadable"
+
+
+def test_check_report(tmp_path):
+    root = tmp_path / "campaign"
+    for name in ["ok", "no_line", "no_file", "corrupt"]:
+        (root / name).mkdir(parents=True)
+        (root / name / "INCAR").touch()
+    (root / "ok" / "OUTCAR").write_text(CONTENT)
+    (root / "no_line" / "OUTCAR").write_text("nothing\n")
+    (root / "corrupt" / "OUTCAR.gz").write_bytes(b"\x1f\x8b\x08garbage")
+    report_path = tmp_path / "report.json"
+
+    check(root, "INCAR", "OUTCAR", "^ General timing", report_path)
+    with open(report_path) as f:
+        report = json.load(f)
+    assert report == {
+        "failed_no_file": [str(root / "no_file")],
+        "failed_no_line": [str(root / "no_line")],
+        "failed_unreadable": [str(root / "corrupt")],
+    }
@@ -0,0 +1,113 @@
+import bz2
+import gzip
+import lzma
+import random
+
+import pytest
+
+from cmdr import compression
+from cmdr.compression import (
+    compression_suffixes,
+    is_compressed,
+    iter_blocks,
+    resolve_path,
+    tail,
+)
+from cmdr.file_utils import (
+    file_contains,
+    file_nonempty,
+    tail_bytes,
+    tail_lines,
+)
+
+
+COMPRESS = {
+    ".gz": gzip.compress,
+    ".bz2": bz2.compress,
+    ".xz": lzma.compress,
+}
+
+
+def _text(n_lines, seed=0):
+    rng = random.Random(seed)
+    lines = [
+        f"{ii} " + "".join(rng.choice("xyz \x1f\x8b") for _ in range(20))
+        for ii in range(n_lines)
+    ]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _write(path, data, suffix, members=1):
+    """Writes data compressed as the given number of independent members."""
+
+    size = -(-len(data) // members)
+    with open(path, "wb") as f:
+        for ii in range(0, len(data), size):
+            f.write(COMPRESS[suffix](data[ii : ii + size]))
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    # Small blocks exercise the member search across block boundaries
+    monkeypatch.setattr(compression, "BLOCK_SIZE", 256)
+
+
+@pytest.mark.parametrize("suffix", list(COMPRESS))
+@pytest.mark.parametrize("members", [1, 2, 17])
+def test_tail_lines_and_bytes(tmp_path, suffix, members):
+    data = _text(500)
+    _write(tmp_path / f"OUTCAR{suffix}", data, suffix, members)
+    lines = data.decode().splitlines()
+    for n_lines in [0, 1, 10, 499, 1000]:
+        expected = lines[-n_lines:] if n_lines > 0 else []
+        assert tail_lines(tmp_path / "OUTCAR", n_lines) == expected
+    for n_bytes in [0, 1, 100, 5000, 100000]:
+        expected = data[-n_bytes:] if n_bytes > 0 else b""
+        assert tail_bytes(tmp_path / "OUTCAR", n_bytes) == expected
+    assert tail_lines(tmp_path / "OUTCAR", 5, max_bytes=30) == (
+        data[-30:].decode().splitlines()
+    )
+
+
+@pytest.mark.parametrize("suffix", list(COMPRESS))
+@pytest.mark.parametrize("members", [1, 5])
+def test_iter_blocks(tmp_path, suffix, members):
+    data = _text(300, seed=1)
+    path = tmp_path / f"OUTCAR{suffix}"
+    _write(path, data, suffix, members)
+    assert b"".join(iter_blocks(path, block_size=100)) == data
+    assert file_contains(tmp_path / "OUTCAR", data[-50:])
+    assert not file_contains(tmp_path / "OUTCAR", b"not in the file")
+    assert file_nonempty(tmp_path / "OUTCAR")
+
+
+def test_tail_enough_stops_at_last_members(tmp_path):
+    data = _text(1000)
+    path = tmp_path / "OUTCAR.gz"
+    _write(path, data, ".gz", members=50)
+    result = tail(path, lambda d: d.count(b"\n") > 3)
+    assert data.endswith(result)
+    assert len(result) < len(data) // 10
+
+
+def test_resolve_path(tmp_path):
+    assert resolve_path(tmp_path / "OUTCAR") == tmp_path / "OUTCAR"
+    (tmp_path / "OUTCAR.xz").write_bytes(lzma.compress(b"x"))
+    assert resolve_path(tmp_path / "OUTCAR") == tmp_path / "OUTCAR.xz"
+    (tmp_path / "OUTCAR").touch()
+    assert resolve_path(tmp_path / "OUTCAR") == tmp_path / "OUTCAR"
+    assert is_compressed(tmp_path / "OUTCAR.bz2")
+    assert not is_compressed(tmp_path / "OUTCAR")
+    assert {".gz", ".bz2", ".xz"} <= set(compression_suffixes())
+
+
+def test_empty_and_corrupt(tmp_path):
+    (tmp_path / "empty.gz").write_bytes(gzip.compress(b""))
+    assert not file_nonempty(tmp_path / "empty")
+    assert tail_lines(tmp_path / "empty", 10) == []
+
+    (tmp_path / "corrupt.gz").write_bytes(b"\x1f\x8b\x08garbage")
+    with pytest.raises(OSError):
+        tail_lines(tmp_path / "corrupt", 10)
+    with pytest.raises(OSError):
+        file_contains(tmp_path / "corrupt", b"x")
@@ -0,0 +1,164 @@
+from pathlib import Path
+
+import pytest
+
+from cmdr.dependencies import (
+    BLOCKED,
+    DONE,
+    HELD,
+    KILL_ON_INVALID,
+    cyclic,
+    dependency_options,
+    dependency_status,
+    read_dependencies,
+)
+from cmdr.fake_slurm import FakeSlurm, SimulatedClock
+from cmdr.ledger import UNKNOWN, Ledger
+from cmdr.retry import (
+    EXHAUSTED,
+    FATAL,
+    RETRY,
+    SUCCESS,
+    Resubmitter,
+    load_rules,
+)
+from cmdr.wrangler import Wrangler
+
+
+def test_read_dependencies(tmp_path):
+    (tmp_path / "static").mkdir()
+    (tmp_path / "static" / "depends_on").write_text(
+        "# comment\n../relax\n\n/abs/path  # trailing\n"
+    )
+    assert read_dependencies(tmp_path / "static") == [
+        str(tmp_path / "relax"),
+        "/abs/path",
+    ]
+    assert read_dependencies(tmp_path) == []
+
+
+def test_cyclic():
+    graph = {
+        "a": [],
+        "b": ["a"],
+        "c": ["b", "d"],
+        "d": ["c"],
+        "e": ["d"],
+        "f": ["a", "missing"],
+    }
+    assert cyclic(graph) == {"c", "d", "e"}
+    assert cyclic({"a": ["a"]}) == {"a"}
+    assert cyclic(dict()) == set()
+
+
+def _entry(state, outcome=None, job_id="1"):
+    return {"state": state, "outcome": outcome, "job_id": job_id}
+
+
+@pytest.mark.parametrize(
+    "entry, retrying, expected",
+    [
+        (_entry("COMPLETED", SUCCESS), False, DONE),
+        (_entry("FAILED", RETRY), True, HELD),
+        (_entry("FAILED", FATAL), True, BLOCKED),
+        (_entry("TIMEOUT", EXHAUSTED), True, BLOCKED),
+        (_entry("COMPLETED"), False, DONE),
+        (_entry(UNKNOWN, job_id=None), False, DONE),
+        (_entry("RUNNING", job_id="7"), False, "7"),
+        (_entry("FAILED"), False, BLOCKED),
+        (_entry("FAILED"), True, HELD),
+    ],
+)
+def test_dependency_status(entry, retrying, expected):
+    assert dependency_status(entry, retrying) == expected
+
+
+def test_dependency_options():
+    assert dependency_options(["1", "2_3"]) == [
+        "--dependency=afterok:1:2_3",
+        KILL_ON_INVALID,
+    ]
+
+
+class FailingSlurm(FakeSlurm):
+    """Fails the first attempts of the jobs of the given directories."""
+
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = dict(failures)
+
+    def submit(self, directory, script, options=None):
+        job_id = super().submit(directory, script, options)
+        name = Path(directory).name
+        if self.failures.get(name, 0) > 0:
+            self.failures[name] -= 1
+            self.jobs[job_id]["fails"] = True
+        return job_id
+
+
+def _pipeline(root, stages):
+    previous = None
+    for name in stages:
+        (root / name).mkdir()
+        (root / name / "submit.sbatch").write_text("#!/bin/bash\n")
+        if previous is not None:
+            (root / name / "depends_on").write_text(f"../{previous}\n")
+        previous = name
+
+
+def _wrangle(root, failures, max_attempts=3):
+    clock = SimulatedClock()
+    slurm = FailingSlurm(
+        failures, slots=4, runtime=100.0, runtime_spread=0.0, clock=clock
+    )
+    rules = load_rules()
+    rules.update(retry_states=["FAILED"], backoff=30.0)
+    rules["max_attempts"] = max_attempts
+    with Ledger(root / "ledger.sqlite") as ledger:
+        resubmitter = Resubmitter(
+            ledger, rules=rules, checker=lambda directory: None, clock=clock
+        )
+        wrangler = Wrangler(
+            root,
+            4,
+            slurm,
+            ledger=ledger,
+            resubmitter=resubmitter,
+            clock=clock,
+            sleep=clock.sleep,
+            min_interval=10.0,
+            max_interval=10.0,
+            verbose=False,
+        )
+        wrangler.run()
+        entries = {
+            Path(entry["directory"]).name: entry for entry in ledger.entries()
+        }
+    return entries, slurm
+
+
+def test_chained_jobs_resubmitted_after_retry(tmp_path):
+    _pipeline(tmp_path, ["relax", "static", "spectra"])
+    entries, slurm = _wrangle(tmp_path, {"relax": 2})
+
+    assert entries["relax"]["attempts"] == 3
+    for name in ["relax", "static", "spectra"]:
+        assert entries[name]["state"] == "COMPLETED"
+        assert entries[name]["outcome"] == SUCCESS
+
+    # Every stage ran after the one it depends on
+    ends = dict()
+    for job in slurm.jobs.values():
+        if job["state"] == "COMPLETED":
+            ends[Path(job["directory"]).name] = (job["start"], job["end"])
+    assert ends["relax"][1] <= ends["static"][0]
+    assert ends["static"][1] <= ends["spectra"][0]
+
+
+def test_chained_jobs_blocked_after_exhausted_retries(tmp_path):
+    _pipeline(tmp_path, ["relax", "static"])
+    entries, _ = _wrangle(tmp_path, {"relax": 2}, max_attempts=2)
+
+    assert entries["relax"]["outcome"] == EXHAUSTED
+    assert entries["static"]["state"] == "CANCELLED"
+    assert entries["static"]["outcome"] == FATAL
@@ -0,0 +1,177 @@
+import os
+from pathlib import Path
+import random
+import sys
+from time import time
+
+import pytest
+
+from cmdr.file_utils import (
+    exhaustive_directory_search,
+    iter_commands,
+    run_commands,
+    tail_bytes,
+    tail_lines,
+    walk_directories,
+)
+
+
+def _baseline(root, filename, return_filename=False):
+    """The search of the original implementation, with Path.rglob."""
+
+    if return_filename:
+        return [xx for xx in Path(root).rglob(filename)]
+    return [xx.parent for xx in Path(root).rglob(filename)]
+
+
+def _tree(root, seed, n_directories=60):
+    rng = random.Random(seed)
+    directories = [root]
+    for ii in range(n_directories):
+        parent = rng.choice(directories)
+        name = rng.choice(["job", "run", "scratch", "x"]) + str(ii)
+        directory = parent / name
+        directory.mkdir()
+        directories.append(directory)
+        for filename in ["submit.sbatch", "INCAR", "out.sbatch"]:
+            if rng.random() < 0.4:
+                (directory / filename).touch()
+    # A symlinked directory is not followed, like Path.rglob
+    os.symlink(directories[1], root / "link")
+    return directories
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("filename", ["submit.sbatch", "*.sbatch"])
+@pytest.mark.parametrize("return_filename", [False, True])
+def test_search_matches_baseline(tmp_path, seed, filename, return_filename):
+    _tree(tmp_path, seed)
+    expected = sorted(set(_baseline(tmp_path, filename, return_filename)))
+    found = exhaustive_directory_search(
+        tmp_path, filename, return_filename=return_filename, workers=4
+    )
+    assert len(found) == len(set(found))
+    assert sorted(found) == expected
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_search_max_depth_and_exclude(tmp_path, seed):
+    _tree(tmp_path, seed)
+    expected = []
+    for dd in _baseline(tmp_path, "INCAR"):
+        parts = dd.relative_to(tmp_path).parts
+        if len(parts) > 2 or any(xx.startswith("scratch") for xx in parts):
+            continue
+        expected.append(dd)
+    found = exhaustive_directory_search(
+        tmp_path, "INCAR", max_depth=2, exclude=["scratch*"]
+    )
+    assert sorted(found) == sorted(expected)
+
+
+def test_walk_directories_listing(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "INCAR").touch()
+    (tmp_path / "a" / "OUTCAR").touch()
+    (tmp_path / "b").mkdir()
+    listings = dict(walk_directories(tmp_path, "INCAR", return_listing=True))
+    assert list(listings) == [tmp_path / "a"]
+    assert sorted(listings[tmp_path / "a"]) == ["INCAR", "OUTCAR"]
+
+
+def test_search_missing_root(tmp_path):
+    assert exhaustive_directory_search(tmp_path / "missing", "INCAR") == []
+
+
+def _lines(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        "".join(rng.choice("abc é") for _ in range(rng.randint(0, 30)))
+        for _ in range(n)
+    ]
+
+
+@pytest.mark.parametrize("trailing_newline", [True, False])
+@pytest.mark.parametrize("n_lines", [0, 1, 5, 100, 500])
+@pytest.mark.parametrize("block_size", [1, 7, 4096])
+def test_tail_lines(tmp_path, trailing_newline, n_lines, block_size):
+    lines = _lines(200)
+    text = "\n".join(lines) + ("\n" if trailing_newline else "")
+    path = tmp_path / "OUTCAR"
+    path.write_text(text)
+    expected = text.splitlines()[-n_lines:] if n_lines > 0 else []
+    assert tail_lines(path, n_lines, block_size=block_size) == expected
+
+
+def test_tail_lines_max_bytes(tmp_path):
+    path = tmp_path / "OUTCAR"
+    path.write_text("first line\nsecond line\nthird\n")
+    assert tail_lines(path, 10, block_size=4, max_bytes=12) == [
+        " line",
+        "third",
+    ]
+    assert tail_lines(path, 10, max_bytes=0) == []
+
+
+def test_tail_lines_empty_and_crlf(tmp_path):
+    path = tmp_path / "OUTCAR"
+    path.write_bytes(b"")
+    assert tail_lines(path, 3) == []
+    path.write_bytes(b"a\r\nb\r\n\xff\r\n")
+    assert tail_lines(path, 2) == ["b", "�"]
+
+
+@pytest.mark.parametrize("n_bytes", [0, 1, 10, 10000])
+def test_tail_bytes(tmp_path, n_bytes):
+    data = bytes(range(256)) * 4
+    path = tmp_path / "OUTCAR"
+    path.write_bytes(data)
+    assert tail_bytes(path, n_bytes) == (data[-n_bytes:] if n_bytes else b"")
+
+
+def test_run_commands_timeout_kills_the_process_group():
+    t0 = time()
+    [result] = run_commands(["sleep 30 & sleep 30; echo done"], timeout=0.5)
+    assert time() - t0 < 10
+    assert result["timed_out"]
+    assert result["exitcode"] < 0
+    assert result["stdout"] == ""
+
+
+def test_run_commands_truncates_output():
+    code = "import sys; sys.stdout.write('x' * 100000); print('y' * 10)"
+    [result, small] = run_commands(
+        [[sys.executable, "-c", code], "echo small"], max_output=1000
+    )
+    assert result["exitcode"] == 0
+    assert result["truncated"]
+    assert result["stdout"] == "x" * 1000
+    assert not small["truncated"] and small["stdout"] == "small"
+    [result] = run_commands([[sys.executable, "-c", code]], max_output=None)
+    assert not result["truncated"]
+    assert result["stdout"] == "x" * 100000 + "y" * 10
+
+
+def test_run_commands_missing_executable():
+    missing, found = run_commands(
+        [["cmdr-no-such-executable", "x"], ["echo", "a b"]]
+    )
+    assert missing["exitcode"] == 127
+    assert not missing["timed_out"]
+    assert found["exitcode"] == 0 and found["stdout"] == "a b"
+
+
+def test_run_commands_keeps_input_order(tmp_path):
+    # Later commands finish first
+    commands = [f"sleep {0.05 * (5 - ii)}; echo {ii}" for ii in range(6)]
+    completed = [
+        index for index, _ in iter_commands(commands, concurrency=6)
+    ]
+    assert completed != sorted(completed)
+    results = run_commands(commands, concurrency=6)
+    assert [result["stdout"] for result in results] == [
+        str(ii) for ii in range(6)
+    ]
+    results = run_commands(["pwd"] * 2, cwd=[tmp_path, tmp_path / ".."])
+    assert results[0]["stdout"] == str(tmp_path)
+    assert results[1]["stdout"] == str(tmp_path.parent)
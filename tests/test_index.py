@@ -0,0 +1,82 @@
+import os
+import shutil
+
+from cmdr.file_utils import walk_directories
+from cmdr.index import DirectoryIndex, default_index_path
+
+
+def _age(root, seconds=3600):
+    """Moves the mtime of every directory below root into the past, so that
+    the index does not treat them as racily modified."""
+
+    for directory, _, _ in os.walk(root):
+        st = os.stat(directory)
+        os.utime(directory, (st.st_atime - seconds, st.st_mtime - seconds))
+
+
+def _make(root, *names):
+    for name in names:
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).touch()
+
+
+def _walk(root, filename):
+    return sorted(walk_directories(root, filename))
+
+
+def test_default_index_path(tmp_path):
+    assert default_index_path(tmp_path / "campaign") == (
+        tmp_path / ".campaign.cmdr-index.sqlite"
+    )
+
+
+def test_refresh(tmp_path):
+    root = tmp_path / "campaign"
+    _make(root, "a/INCAR", "a/b/INCAR", "c/OUTCAR", "d/e/f/INCAR")
+    _age(root)
+    with DirectoryIndex(root) as index:
+        counts = index.refresh("INCAR")
+        assert counts["listed"] == 7
+        assert sorted(index.search("INCAR")) == _walk(root, "INCAR")
+
+        # Nothing changed, so every directory is only stat'ed
+        counts = index.refresh("INCAR")
+        assert counts == {"stat": 7, "listed": 0, "added": 0, "removed": 0}
+
+        # A new file, a new subtree and a removed subtree
+        _make(root, "c/INCAR", "g/h/INCAR")
+        shutil.rmtree(root / "d")
+        counts = index.refresh("INCAR")
+        assert counts["added"] == 2
+        assert counts["removed"] == 3
+        assert sorted(index.search("INCAR")) == _walk(root, "INCAR")
+        assert sorted(index.search("INCAR", return_filename=True)) == sorted(
+            walk_directories(root, "INCAR", return_filename=True)
+        )
+
+
+def test_refresh_new_pattern(tmp_path):
+    root = tmp_path / "campaign"
+    _make(root, "a/INCAR", "b/OUTCAR")
+    _age(root)
+    with DirectoryIndex(root) as index:
+        index.refresh("INCAR")
+        counts = index.refresh("OUTCAR")
+        assert counts["listed"] == 3
+        assert sorted(index.patterns) == ["INCAR", "OUTCAR"]
+        assert index.search("OUTCAR") == [root / "b"]
+    with DirectoryIndex(root) as index:
+        assert index.refresh()["listed"] == 0
+        assert index.search("INCAR") == [root / "a"]
+
+
+def test_spec_change_rebuilds(tmp_path):
+    root = tmp_path / "campaign"
+    _make(root, "a/INCAR", "scratch/INCAR", "a/b/c/INCAR")
+    with DirectoryIndex(root) as index:
+        index.refresh("INCAR")
+        assert len(index.search("INCAR")) == 3
+    with DirectoryIndex(root, max_depth=1, exclude=["scratch"]) as index:
+        assert index.search("INCAR") == []
+        index.refresh("INCAR")
+        assert index.search("INCAR") == [root / "a"]
@@ -0,0 +1,94 @@
+import os
+import sqlite3
+
+from cmdr.ledger import SUBMITTED, UNKNOWN, Ledger, default_ledger_path
+from cmdr.retry import RETRY, SUCCESS
+
+
+def test_default_ledger_path(tmp_path):
+    assert default_ledger_path(tmp_path / "campaign") == (
+        tmp_path / ".campaign.cmdr-ledger.sqlite"
+    )
+
+
+def test_record_submissions_upsert(tmp_path, monkeypatch):
+    a, b = str(tmp_path / "a"), str(tmp_path / "b")
+    with Ledger(tmp_path / "ledger.sqlite") as ledger:
+        ledger.record_submissions([(a, "1"), (b, "2")], submit_time=10.0)
+        assert len(ledger) == 2 and a in ledger
+        entry = ledger.get(a)
+        assert entry["job_id"] == "1"
+        assert entry["state"] == SUBMITTED
+        assert entry["attempts"] == 1
+        assert entry["submit_time"] == 10.0
+
+        ledger.set_states({a: "TIMEOUT", b: "COMPLETED"})
+        ledger.set_outcomes({a: (RETRY, 50.0), b: (SUCCESS, None)})
+        assert ledger.due(49.0) == []
+        assert ledger.due(50.0) == [a]
+
+        # A resubmission replaces the job ID and clears the outcome
+        ledger.record_submissions([(a, "3")], submit_time=60.0)
+        entry = ledger.get(a)
+        assert entry["job_id"] == "3"
+        assert entry["state"] == SUBMITTED
+        assert entry["attempts"] == 2
+        assert entry["outcome"] is None and entry["retry_after"] is None
+        assert ledger.due(100.0) == []
+        assert ledger.get(b)["outcome"] == SUCCESS
+
+    # Relative and absolute paths refer to the same directory
+    monkeypatch.chdir(tmp_path)
+    with Ledger(tmp_path / "ledger.sqlite") as ledger:
+        assert "a" in ledger
+        assert ledger.states() == {a: SUBMITTED, b: "COMPLETED"}
+        assert ledger.directories(states=["COMPLETED"]) == {b}
+        assert [e["directory"] for e in ledger.entries(unresolved=True)] == [a]
+        ledger.remove(["a"])
+        assert ledger.get(a) is None
+
+
+def test_migrate_markers(tmp_path):
+    directories = [tmp_path / name for name in ["a", "b", "c", "d"]]
+    for directory in directories:
+        directory.mkdir()
+    (directories[0] / "QUEUED").write_text("123\n")
+    (directories[1] / "QUEUED").touch()
+    (directories[2] / "QUEUED").write_text("456\n")
+    os.utime(directories[0] / "QUEUED", (1000.0, 1000.0))
+
+    with Ledger(tmp_path / "ledger.sqlite") as ledger:
+        ledger.record_submissions([(directories[2], "789")])
+        assert not ledger.migrated
+        assert ledger.migrate_markers(directories) == 2
+        assert ledger.migrated
+
+        a = ledger.get(directories[0])
+        assert a["job_id"] == "123"
+        assert a["state"] == SUBMITTED
+        assert a["submit_time"] == 1000.0
+        b = ledger.get(directories[1])
+        assert b["job_id"] is None and b["state"] == UNKNOWN
+        # Directories already in the ledger keep their entry
+        assert ledger.get(directories[2])["job_id"] == "789"
+        assert directories[3] not in ledger
+        assert ledger.migrate_markers(directories) == 0
+
+
+def test_upgrade_of_first_schema(tmp_path):
+    path = tmp_path / "ledger.sqlite"
+    connection = sqlite3.connect(str(path))
+    connection.executescript(
+        "CREATE TABLE jobs (directory TEXT PRIMARY KEY, job_id TEXT, "
+        "submit_time REAL, state TEXT NOT NULL, "
+        "attempts INTEGER NOT NULL DEFAULT 0, updated REAL);"
+        "INSERT INTO jobs VALUES ('/x', '1', 1.0, 'RUNNING', 1, 1.0);"
+    )
+    connection.commit()
+    connection.close()
+    with Ledger(path) as ledger:
+        entry = ledger.get("/x")
+        assert entry["state"] == "RUNNING"
+        assert entry["outcome"] is None
+        ledger.set_outcomes({"/x": (RETRY, 5.0)})
+        assert ledger.due(5.0) == ["/x"]
@@ -0,0 +1,210 @@
+import gzip
+import json
+import random
+import re
+
+import pytest
+
+from cmdr.matcher import (
+    ERROR,
+    FAIL,
+    SUCCESS,
+    FileMatcher,
+    Matcher,
+    load_config,
+    normalize_check,
+)
+
+
+def _patterns(*checks):
+    return [normalize_check(check) for check in checks]
+
+
+def _reference(patterns, text):
+    """The outcome of a file, searching for every pattern on its own."""
+
+    found = []
+    for pattern in patterns:
+        expression = pattern["text"]
+        if not pattern["regex"]:
+            expression = re.escape(expression)
+        found.append(re.search(expression, text, re.MULTILINE) is not None)
+    if any(hit for p, hit in zip(patterns, found) if p["negate"]):
+        return ERROR
+    if all(hit for p, hit in zip(patterns, found) if not p["negate"]):
+        return SUCCESS
+    return FAIL
+
+
+def _outcome(patterns, found):
+    if any(hit for p, hit in zip(patterns, found) if p["negate"]):
+        return ERROR
+    if all(hit for p, hit in zip(patterns, found) if not p["negate"]):
+        return SUCCESS
+    return FAIL
+
+
+def test_scan_literal_and_overlapping():
+    patterns = _patterns(["OUTCAR", "abab"], ["OUTCAR", "bab"])
+    assert FileMatcher(patterns).scan("xababx") == [True, True]
+    assert FileMatcher(patterns).scan("xabax") == [False, False]
+
+
+def test_scan_literal_is_escaped():
+    patterns = _patterns(["OUTCAR", "a.b"])
+    assert FileMatcher(patterns).scan("axb") == [False]
+    assert FileMatcher(patterns).scan("a.b") == [True]
+
+
+def test_scan_negated_stops_early():
+    patterns = _patterns(
+        {"file": "OUTCAR", "text": "BAD NEWS", "negate": True},
+        ["OUTCAR", "timing"],
+    )
+    found = FileMatcher(patterns).scan("BAD NEWS\ntiming\n")
+    assert found == [True, False]
+
+
+def test_scan_negated_after_required():
+    patterns = _patterns(
+        ["OUTCAR", "start"],
+        {"file": "OUTCAR", "text": "BAD NEWS", "negate": True},
+        {"file": "OUTCAR", "text": "^ZBRENT", "regex": True, "negate": True},
+    )
+    matcher = FileMatcher(patterns)
+    assert matcher.scan("start\nok\n") == [True, False, False]
+    assert matcher.scan("start\nZBRENT\n") == [True, False, True]
+    assert matcher.scan("start BAD NEWS") == [True, True, False]
+    assert matcher.scan("xZBRENT start") == [True, False, False]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("abcabc done", [True, True]),
+        ("abcabd done", [False, True]),
+        ("done", [False, True]),
+    ],
+)
+def test_scan_backreference(text, expected):
+    patterns = _patterns(
+        {"file": "OUTCAR", "text": r"(abc)\1", "regex": True},
+        {"file": "OUTCAR", "text": r"(?P<word>done)", "regex": True},
+    )
+    matcher = FileMatcher(patterns)
+    assert matcher.isolated == [0, 1]
+    assert matcher.scan(text) == expected
+
+
+def test_scan_duplicate_group_names():
+    patterns = _patterns(
+        {"file": "OUTCAR", "text": r"(?P<x>a)(?P=x)", "regex": True},
+        {"file": "OUTCAR", "text": r"(?P<x>b)", "regex": True},
+        ["OUTCAR", "c"],
+    )
+    assert FileMatcher(patterns).scan("aa b c") == [True, True, True]
+    assert FileMatcher(patterns).scan("ab b c") == [False, True, True]
+
+
+def test_scan_inline_flags():
+    patterns = _patterns(
+        {"file": "OUTCAR", "text": "(?i)error", "regex": True, "negate": True},
+        ["OUTCAR", "Done"],
+    )
+    matcher = FileMatcher(patterns)
+    assert matcher.scan("ERROR Done")[0]
+    assert matcher.scan("done") == [False, False]
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_scan_matches_reference(seed):
+    rng = random.Random(seed)
+    alphabet = "ab\n"
+    text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+    checks = []
+    for _ in range(rng.randint(1, 5)):
+        length = rng.randint(1, 3)
+        check = {
+            "file": "OUTCAR",
+            "text": "".join(rng.choice("ab") for _ in range(length)),
+            "negate": rng.random() < 0.4,
+        }
+        if rng.random() < 0.3:
+            check["text"] = "^" + check["text"]
+            check["regex"] = True
+        checks.append(check)
+    patterns = _patterns(*checks)
+    found = FileMatcher(patterns).scan(text)
+    assert _outcome(patterns, found) == _reference(patterns, text)
+
+
+def test_matcher_classify(tmp_path):
+    checks = [
+        ["OUTCAR", "General timing"],
+        {"file": "OUTCAR", "text": "VERY BAD NEWS", "negate": True},
+        ["xmu.dat", None],
+    ]
+    matcher = Matcher(checks)
+    assert matcher.filenames == ["OUTCAR", "xmu.dat"]
+
+    (tmp_path / "xmu.dat").write_text("1 2\n")
+    assert matcher.classify(tmp_path) == FAIL
+    (tmp_path / "OUTCAR").write_text("General timing\n")
+    assert matcher.match(tmp_path) == (
+        SUCCESS,
+        [["xmu.dat", None], ["OUTCAR", "General timing"]],
+    )
+    (tmp_path / "OUTCAR").write_text("VERY BAD NEWS\nGeneral timing\n")
+    assert matcher.classify(tmp_path) == ERROR
+
+
+def test_matcher_compressed_and_n_bytes(tmp_path):
+    with gzip.open(tmp_path / "OUTCAR.gz", "wt") as f:
+        f.write("General timing\n" + "x" * 1000 + "\n")
+    assert Matcher([["OUTCAR", "General timing"]]).classify(tmp_path) == (
+        SUCCESS
+    )
+    tail = Matcher([["OUTCAR", "General timing", 100]])
+    assert tail.classify(tmp_path) == FAIL
+
+
+def test_missing_file_only_fails_required(tmp_path):
+    negated = {"file": "OUTCAR", "text": "BAD", "negate": True}
+    assert Matcher([negated]).classify(tmp_path) == SUCCESS
+    assert Matcher([negated, ["OUTCAR", "x"]]).classify(tmp_path) == FAIL
+
+
+def test_normalize_check_errors():
+    with pytest.raises(ValueError):
+        normalize_check({"file": "OUTCAR"})
+    with pytest.raises(ValueError):
+        normalize_check({"file": "OUTCAR", "text": "x", "invert": True})
+    with pytest.raises(ValueError):
+        normalize_check(["OUTCAR"])
+
+
+def test_load_config(tmp_path):
+    config = {
+        "in": {"VASP": ["INCAR"]},
+        "out": {"VASP": [["OUTCAR", "General timing"]]},
+    }
+    path = tmp_path / "config.json"
+    path.write_text(
+        json.dumps(
+            {
+                "extend": {
+                    "VASP": [{"file": "OUTCAR", "text": "BAD", "negate": True}]
+                },
+                "in": {"FEFF": ["feff.inp"]},
+                "out": {"FEFF": [["xmu.dat", None]]},
+            }
+        )
+    )
+    loaded = load_config(path, config)
+    assert len(loaded["out"]["VASP"]) == 2
+    assert loaded["in"]["FEFF"] == ["feff.inp"]
+    assert len(config["out"]["VASP"]) == 1
+
+    path.write_text(json.dumps({"out": {"CP2K": [["out", "done"]]}}))
+    with pytest.raises(ValueError):
+        load_config(path, config)
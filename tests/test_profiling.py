@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from cmdr.entrypoint import entrypoint
+from cmdr.profiling import PROFILER, Profiler, timed
+
+
+@pytest.fixture
+def profiler():
+    yield PROFILER
+    PROFILER.disable()
+    PROFILER.reset()
+    PROFILER._cprofile = None
+
+
+def test_profiler_accumulates_stages_and_counters():
+    profiler = Profiler()
+    with profiler.stage("read"):
+        pass
+    profiler.count("files_opened")
+    assert profiler.stages == dict() and not profiler.counters
+
+    profiler.enable()
+    for _ in range(3):
+        with profiler.stage("read"):
+            sum(range(10000))
+        profiler.count("files_opened")
+        profiler.count("bytes_read", 100)
+    with profiler.stage("walk"):
+        with profiler.stage("read"):
+            pass
+    profiler.add_time("subprocess", 2.0, 0.5, calls=4)
+    profiler.disable()
+
+    metrics = profiler.metrics()
+    assert metrics["stages"]["read"]["calls"] == 4
+    assert metrics["stages"]["read"]["wall"] > 0.0
+    assert metrics["stages"]["walk"]["calls"] == 1
+    assert metrics["stages"]["subprocess"] == {
+        "calls": 4,
+        "wall": 2.0,
+        "cpu": 0.5,
+    }
+    assert metrics["counters"] == {"files_opened": 3, "bytes_read": 300}
+    total = metrics["total"]["wall"]
+    assert profiler.metrics()["total"]["wall"] == total
+
+    # Enabling again starts from scratch
+    profiler.enable()
+    assert profiler.stages == dict() and not profiler.counters
+
+
+def test_timed_records_its_stage(profiler):
+    @timed("square")
+    def square(x):
+        return x * x
+
+    assert square(3) == 9
+    assert "square" not in profiler.stages
+    profiler.enable()
+    assert [square(x) for x in range(5)] == [0, 1, 4, 9, 16]
+    profiler.disable()
+    assert profiler.stages["square"]["calls"] == 5
+    assert square.__name__ == "square"
+
+
+def test_profile_output(tmp_path, profiler):
+    root = tmp_path / "campaign"
+    for name, text in [("a", "timing\n"), ("b", "crash\n")]:
+        (root / name).mkdir(parents=True)
+        (root / name / "INCAR").touch()
+        (root / name / "OUTCAR").write_text(text)
+    profile_path = tmp_path / "profile.json"
+    cprofile_path = tmp_path / "run.prof"
+    entrypoint(
+        [
+            "--profile",
+            "--profile-output",
+            str(profile_path),
+            "--cprofile",
+            str(cprofile_path),
+            "check",
+            "--directory",
+            str(root),
+            "--filename",
+            "INCAR",
+            "--require-file",
+            "OUTCAR",
+            "--require-text",
+            "timing",
+            "--report-path",
+            str(tmp_path / "report.json"),
+        ]
+    )
+    assert not profiler.enabled
+    with open(profile_path) as f:
+        metrics = json.load(f)
+    assert set(metrics) == {"total", "stages", "counters"}
+    assert metrics["stages"]["walk"]["calls"] == 1
+    assert metrics["stages"]["read"]["calls"] == 2
+    assert metrics["counters"]["files_opened"] == 2
+    assert metrics["counters"]["bytes_read"] > 0
+    assert metrics["total"]["wall"] > 0.0
+    assert cprofile_path.stat().st_size > 0
@@ -0,0 +1,73 @@
+import pytest
+
+from cmdr import records
+from cmdr.records import RecordWriter, read_records, summarize
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize("suffix", [".jsonl", ".csv"])
+def test_records_flushed_on_interval(tmp_path, monkeypatch, suffix):
+    clock = Clock()
+    monkeypatch.setattr(records, "time", clock)
+    path = tmp_path / f"records{suffix}"
+    writer = RecordWriter(path)
+    writer.write("a", "success", matched=[["OUTCAR", "x"]], elapsed=0.5)
+    writer.write("b", "no_line")
+    assert list(read_records(path)) == []
+
+    # The next write after the interval flushes the buffer
+    clock.now += records.FLUSH_INTERVAL
+    writer.write("c", "no_file")
+    assert [r["directory"] for r in read_records(path)] == ["a", "b", "c"]
+
+    writer.write("d", "success")
+    writer.close()
+    loaded = list(read_records(path))
+    assert [r["directory"] for r in loaded] == ["a", "b", "c", "d"]
+    assert loaded[0]["matched"] == [["OUTCAR", "x"]]
+    assert loaded[0]["elapsed"] == 0.5
+    assert loaded[0]["time"] == 1000.0
+
+
+def test_records_flushed_on_count(tmp_path, monkeypatch):
+    monkeypatch.setattr(records, "time", Clock())
+    monkeypatch.setattr(records, "FLUSH_EVERY", 3)
+    path = tmp_path / "records.jsonl"
+    with RecordWriter(path) as writer:
+        for ii in range(4):
+            writer.write(str(ii), "success")
+        assert len(list(read_records(path))) == 3
+    assert len(list(read_records(path))) == 4
+
+
+def test_read_records_partial_line(tmp_path):
+    path = tmp_path / "records.jsonl"
+    with RecordWriter(path) as writer:
+        writer.write("a", "success", type="VASP", cached=True)
+    with open(path, "a") as f:
+        f.write('{"directory": "b", "sta')
+    assert [r["directory"] for r in read_records(path)] == ["a"]
+
+
+def test_summarize(tmp_path):
+    path = tmp_path / "records.csv"
+    with RecordWriter(path) as writer:
+        writer.write("a", "success", type="VASP", cached=True, elapsed=1.0)
+        writer.write("b", "error", type="VASP", elapsed=3.0)
+        writer.write("c", "no_line")
+    summary = summarize(path)
+    assert summary["VASP"] == {
+        "counts": {"success": 1, "error": 1},
+        "total": 2,
+        "cached": 1,
+        "elapsed": 4.0,
+        "max_elapsed": 3.0,
+    }
+    assert summary[None]["counts"] == {"no_line": 1}
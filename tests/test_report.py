@@ -0,0 +1,51 @@
+import pytest
+
+from cmdr.report import CONFIG, generate_report
+
+
+TIMING = " General timing and accounting informations for this job:\n"
+
+
+def _campaign(root, n=40):
+    for ii in range(n):
+        directory = root / f"group_{ii % 3}" / f"vasp_{ii:02d}"
+        directory.mkdir(parents=True)
+        for filename in CONFIG["in"]["VASP"]:
+            (directory / filename).touch()
+        if ii % 4 == 0:
+            (directory / "OUTCAR").write_text("VERY BAD NEWS\n" + TIMING)
+        elif ii % 4 == 1:
+            (directory / "OUTCAR").write_text("running\n")
+        elif ii % 4 == 2:
+            (directory / "OUTCAR").write_text(TIMING)
+
+
+@pytest.mark.parametrize(
+    "workers, processes, chunksize",
+    [(4, False, None), (4, False, 3), (2, True, None), (None, False, 1)],
+)
+def test_report_independent_of_workers(
+    tmp_path, workers, processes, chunksize
+):
+    _campaign(tmp_path)
+    output_files = dict(CONFIG["out"])
+    output_files["VASP"] = CONFIG["out"]["VASP"] + [
+        {"file": "OUTCAR", "text": "VERY BAD NEWS", "negate": True}
+    ]
+    expected = generate_report(
+        tmp_path, "INCAR", output_files=output_files, workers=1
+    )
+    assert len(expected["VASP"]["error"]) == 10
+    assert len(expected["VASP"]["success"]) == 10
+    assert len(expected["VASP"]["fail"]) == 20
+    assert expected["VASP"]["success"] == sorted(expected["VASP"]["success"])
+
+    report = generate_report(
+        tmp_path,
+        "INCAR",
+        output_files=output_files,
+        workers=workers,
+        processes=processes,
+        chunksize=chunksize,
+    )
+    assert report == expected
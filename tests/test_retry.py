@@ -0,0 +1,149 @@
+import json
+
+import pytest
+
+from cmdr.ledger import Ledger
+from cmdr.retry import (
+    DEFAULT_RULES,
+    EXHAUSTED,
+    FATAL,
+    RETRY,
+    SUCCESS,
+    Resubmitter,
+    backoff_delay,
+    bump_time_limit,
+    classify,
+    load_rules,
+)
+
+
+@pytest.mark.parametrize(
+    "state, status, attempts, expected",
+    [
+        ("COMPLETED", "success", 1, SUCCESS),
+        ("TIMEOUT", "success", 1, SUCCESS),
+        ("COMPLETED", None, 1, SUCCESS),
+        ("FAILED", None, 1, FATAL),
+        ("COMPLETED", "error", 1, FATAL),
+        ("TIMEOUT", "error", 1, FATAL),
+        ("TIMEOUT", "fail", 1, RETRY),
+        ("NODE_FAIL", None, 2, RETRY),
+        ("TIMEOUT", "fail", 3, EXHAUSTED),
+        ("CANCELLED", "fail", 1, FATAL),
+        ("COMPLETED", "fail", 1, FATAL),
+    ],
+)
+def test_classify(state, status, attempts, expected):
+    assert classify(state, status, attempts) == expected
+
+
+def test_classify_retry_incomplete():
+    rules = dict(DEFAULT_RULES, retry_incomplete=True)
+    assert classify("COMPLETED", "fail", 1, rules) == RETRY
+    assert classify("FAILED", None, 1, rules) == FATAL
+    assert classify("COMPLETED", "error", 1, rules) == FATAL
+
+
+def test_backoff_delay():
+    rules = dict(DEFAULT_RULES, backoff=10.0, backoff_factor=3.0)
+    rules["max_backoff"] = 100.0
+    assert [backoff_delay(n, rules) for n in range(5)] == [
+        10.0,
+        10.0,
+        30.0,
+        90.0,
+        100.0,
+    ]
+
+
+def test_load_rules(tmp_path):
+    assert load_rules() == DEFAULT_RULES
+    assert load_rules() is not DEFAULT_RULES
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"max_attempts": 5}))
+    rules = load_rules(path)
+    assert rules["max_attempts"] == 5
+    assert rules["backoff"] == DEFAULT_RULES["backoff"]
+    path.write_text(json.dumps({"max_attempt": 5}))
+    with pytest.raises(ValueError):
+        load_rules(path)
+
+
+@pytest.mark.parametrize(
+    "line, factor, max_time, expected",
+    [
+        ("#SBATCH --time=1:00:00", 2.0, None, "#SBATCH --time=02:00:00"),
+        ("#SBATCH -t 30", 1.5, None, "#SBATCH -t 00:45:00"),
+        (
+            "#SBATCH --time 20:00:00",
+            2.0,
+            "1-00:00:00",
+            "#SBATCH --time 1-00:00:00",
+        ),
+        ("#SBATCH --time=24:00:00", 2.0, "24:00:00", None),
+    ],
+)
+def test_bump_time_limit(tmp_path, line, factor, max_time, expected):
+    script = tmp_path / "submit.sbatch"
+    script.write_text(f"#!/bin/bash\n{line}\nsrun vasp\n")
+    bumped = bump_time_limit(script, factor, max_time)
+    if expected is None:
+        assert bumped is None
+        assert line in script.read_text()
+    else:
+        assert bumped[1] == expected.split()[-1].split("=")[-1]
+        assert script.read_text() == f"#!/bin/bash\n{expected}\nsrun vasp\n"
+
+
+def test_bump_time_limit_without_limit(tmp_path):
+    script = tmp_path / "submit.sbatch"
+    script.write_text("#!/bin/bash\nsrun vasp\n")
+    assert bump_time_limit(script, 2.0) is None
+
+
+def test_resubmitter(tmp_path):
+    now = [1000.0]
+    statuses = {"a": "fail", "b": "success", "c": "error", "d": "fail"}
+    directories = {name: str(tmp_path / name) for name in statuses}
+    for name in statuses:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "submit.sbatch").write_text(
+            "#SBATCH --time=1:00:00\n"
+        )
+    rules = dict(DEFAULT_RULES, backoff=60.0, time_factor=2.0)
+    with Ledger(tmp_path / "ledger.sqlite") as ledger:
+        ledger.record_submissions(
+            [
+                (directory, str(ii))
+                for ii, directory in enumerate(directories.values())
+            ]
+        )
+        ledger.set_states(
+            {
+                directories["a"]: "TIMEOUT",
+                directories["b"]: "COMPLETED",
+                directories["c"]: "FAILED",
+                directories["d"]: "RUNNING",
+            }
+        )
+        resubmitter = Resubmitter(
+            ledger,
+            rules=rules,
+            checker=lambda directory: statuses[directory[-1]],
+            clock=lambda: now[0],
+        )
+        assert resubmitter.resolve() == {
+            directories["a"]: RETRY,
+            directories["b"]: SUCCESS,
+            directories["c"]: FATAL,
+        }
+        assert "--time=02:00:00" in (
+            tmp_path / "a" / "submit.sbatch"
+        ).read_text()
+        assert resubmitter.waiting()
+        assert resubmitter.due() == []
+        now[0] += 60.0
+        assert resubmitter.due() == [directories["a"]]
+
+        # Already resolved jobs are not checked again
+        assert resubmitter.resolve() == dict()
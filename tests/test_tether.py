@@ -0,0 +1,228 @@
+from math import ceil
+import os
+import random
+import subprocess
+
+import pytest
+
+from cmdr.file_utils import directory_key, read_json
+from cmdr.tether import (
+    _lpt,
+    chunks,
+    estimate_makespan,
+    get_file_lines,
+    pack,
+    tether_constructor,
+)
+
+
+def _costs(directories, values):
+    return {directory_key(dd): value for dd, value in zip(directories, values)}
+
+
+def _makespan(packed, costs, parallel):
+    return max(estimate_makespan(chunk, costs, parallel) for chunk in packed)
+
+
+def test_chunks():
+    assert list(chunks(list(range(7)), 3)) == [[0, 1, 2], [3, 4], [5, 6]]
+    assert list(chunks([], 3)) == []
+
+
+def test_pack_max_tasks():
+    directories = [f"d{ii}" for ii in range(10)]
+    costs = _costs(directories, range(1, 11))
+    packed = pack(directories, costs, max_tasks=4)
+    assert len(packed) == 3
+    assert all(len(chunk) <= 4 for chunk in packed)
+    assert sorted(dd for chunk in packed for dd in chunk) == sorted(
+        directories
+    )
+    for chunk in packed:
+        chunk_costs = [costs[directory_key(dd)] for dd in chunk]
+        assert chunk_costs == sorted(chunk_costs, reverse=True)
+
+
+def test_pack_target_walltime():
+    directories = [f"d{ii}" for ii in range(6)]
+    costs = _costs(directories, [10, 10, 10, 10, 10, 10])
+    packed = pack(
+        directories, costs, max_tasks=6, target_walltime=20, parallel=1
+    )
+    assert len(packed) == 3
+    assert _makespan(packed, costs, 1) <= 20
+
+
+def test_pack_target_below_longest_task():
+    directories = ["a", "b", "c"]
+    costs = _costs(directories, [100, 1, 1])
+    packed = pack(
+        directories, costs, max_tasks=3, target_walltime=5, parallel=1
+    )
+    assert len(packed) == 2
+    assert packed[0] == ["a"] or packed[1] == ["a"]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_pack_binary_search_matches_linear_search(seed):
+    rng = random.Random(seed)
+    directories = [f"d{ii}" for ii in range(rng.randint(1, 60))]
+    costs = _costs(directories, [rng.expovariate(1.0) for _ in directories])
+    max_tasks = rng.randint(1, 16)
+    parallel = rng.randint(1, max_tasks)
+    target = rng.uniform(0.5, 10.0)
+    packed = pack(directories, costs, max_tasks, target, parallel)
+
+    # The smallest number of chunks meeting the target, by linear search
+    target = max(target, max(costs.values()))
+    total = sum(costs.values())
+    start = max(
+        ceil(len(directories) / max_tasks), ceil(total / (parallel * target))
+    )
+    expected = len(directories)
+    for n in range(min(start, len(directories)), len(directories)):
+        packed_n = _lpt(directories, costs, n, max_tasks)
+        if _makespan(packed_n, costs, parallel) <= target:
+            expected = n
+            break
+    assert _makespan(packed, costs, parallel) <= target
+    assert all(len(chunk) <= max_tasks for chunk in packed)
+    assert len(packed) == expected
+
+
+def _campaign(root, n):
+    for ii in range(n):
+        (root / f"job{ii}").mkdir(parents=True)
+        (root / f"job{ii}" / "INCAR").touch()
+
+
+@pytest.mark.parametrize("work_queue", [False, True])
+def test_tether_constructor_rerun(tmp_path, work_queue):
+    _campaign(tmp_path / "campaign", 5)
+    tether = tmp_path / "tether"
+    tether_constructor(
+        tmp_path / "campaign",
+        "INCAR",
+        tether,
+        calculations_per_staged_job=2,
+        work_queue=work_queue,
+    )
+    config = read_json(tether / "tether.json")
+    assert len(config["directories"]) == 5
+    assert sorted(os.listdir(tether / "done")) == []
+    assert sum((tether / str(ii)).is_dir() for ii in range(3)) == 3
+
+    # A second run into the same directory must not touch the first one
+    (tmp_path / "campaign" / "extra").mkdir()
+    (tmp_path / "campaign" / "extra" / "INCAR").touch()
+    before = (tether / "tether.json").read_text()
+    with pytest.raises(FileExistsError):
+        tether_constructor(
+            tmp_path / "campaign",
+            "INCAR",
+            tether,
+            calculations_per_staged_job=6,
+            work_queue=work_queue,
+        )
+    assert (tether / "tether.json").read_text() == before
+    assert "extra" not in (tether / "0" / "submit.sbatch").read_text()
+
+
+def _max_overlap(intervals):
+    events = sorted(
+        [(start, 1) for start, _ in intervals]
+        + [(end, -1) for _, end in intervals]
+    )
+    running = 0
+    overlap = 0
+    for _, change in events:
+        running += change
+        overlap = max(overlap, running)
+    return overlap
+
+
+def _summary(path):
+    with open(path) as f:
+        header, *rows = [line.split("\t") for line in f.read().splitlines()]
+    assert header == [
+        "index",
+        "directory",
+        "exitcode",
+        "start",
+        "end",
+        "elapsed",
+    ]
+    return rows
+
+
+def test_staged_script_runs_tasks_concurrently(tmp_path):
+    root = tmp_path / 'odd "$name` dir'
+    chunk = [root / f"task {ii}" for ii in range(8)]
+    for directory in chunk:
+        directory.mkdir(parents=True)
+    summary_path = root / "summary $x.tsv"
+    done_path = root / "done `x`"
+    done_path.mkdir()
+    lines = get_file_lines(
+        {"time": "1:00:00"},
+        chunk,
+        ["sleep 0.3", "pwd > ran", '[ "${PWD##* }" != 5 ]'],
+        [],
+        parallel=3,
+        summary_path=summary_path,
+        done_path=done_path,
+    )
+    script = tmp_path / "staged.sbatch"
+    script.write_text("\n".join(lines) + "\n")
+    subprocess.run(["bash", str(script)], check=True, timeout=60)
+
+    rows = _summary(summary_path)
+    assert sorted(int(row[0]) for row in rows) == list(range(8))
+    for index, directory, exitcode, start, end, elapsed in rows:
+        assert directory == str(chunk[int(index)])
+        assert exitcode == ("1" if index == "5" else "0")
+        assert float(end) - float(start) >= 0.3
+        assert (chunk[int(index)] / "ran").read_text() == f"{directory}\n"
+    overlap = _max_overlap([(float(row[3]), float(row[4])) for row in rows])
+    assert 1 < overlap <= 3
+    assert sorted(os.listdir(done_path)) == [
+        str(ii) for ii in range(8) if ii != 5
+    ]
+
+    # A rerun only runs the task which failed
+    subprocess.run(["bash", str(script)], check=True, timeout=60)
+    assert [row[0] for row in _summary(summary_path)[8:]] == ["5"]
+
+
+def test_work_queue_runs_every_task_once(tmp_path):
+    queue = tmp_path / 'queue "$x` 1'
+    (queue / "claims").mkdir(parents=True)
+    directories = [tmp_path / "tasks" / f"t{ii:02d}" for ii in range(24)]
+    for directory in directories:
+        directory.mkdir(parents=True)
+    (queue / "manifest.txt").write_text(
+        "".join(f"{directory}\n" for directory in directories)
+    )
+    lines = get_file_lines(
+        {"time": "1:00:00"},
+        [],
+        ["sleep 0.05", "echo $$ >> runs"],
+        [],
+        parallel=2,
+        summary_path=queue / "summary.tsv",
+        work_queue=queue,
+    )
+    script = tmp_path / "worker.sbatch"
+    script.write_text("\n".join(lines) + "\n")
+
+    # Two staged jobs pulling from the same queue
+    processes = [subprocess.Popen(["bash", str(script)]) for _ in range(2)]
+    assert [process.wait(timeout=60) for process in processes] == [0, 0]
+
+    for directory in directories:
+        assert len((directory / "runs").read_text().splitlines()) == 1
+    rows = _summary(queue / "summary.tsv")
+    assert sorted(int(row[0]) for row in rows) == list(range(24))
+    assert sorted(os.listdir(queue / "claims")) == sorted(
+        [str(ii) for ii in range(24)] + ["cursor"]
+    )
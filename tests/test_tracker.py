@@ -0,0 +1,141 @@
+import json
+import sys
+
+from cmdr.check import check
+from cmdr.fake_slurm import FakeSlurm, SimulatedClock
+from cmdr.ledger import SUBMITTED, UNKNOWN, Ledger
+from cmdr.report import generate_report
+from cmdr.tracker import (
+    RUNNING,
+    JobTracker,
+    is_active,
+    parse_sacct,
+    refresh_states,
+)
+
+
+def test_parse_sacct():
+    stdout = "\n".join(
+        [
+            "1|COMPLETED|0:0",
+            "2|CANCELLED by 1234|0:15",
+            "3_[0-2,5%2]|PENDING|0:0",
+            "4_1|RUNNING|0:0",
+            "5||0:0",
+            "|COMPLETED|0:0",
+            "garbage",
+            "",
+        ]
+    )
+    assert parse_sacct(stdout) == {
+        "1": "COMPLETED",
+        "2": "CANCELLED",
+        "3_0": "PENDING",
+        "3_1": "PENDING",
+        "3_2": "PENDING",
+        "3_5": "PENDING",
+        "4_1": "RUNNING",
+    }
+
+
+def test_is_active():
+    assert is_active("PENDING")
+    assert is_active(SUBMITTED)
+    assert not is_active("COMPLETED")
+    assert not is_active(UNKNOWN)
+    assert not is_active(None)
+
+
+def test_job_tracker(tmp_path):
+    clock = SimulatedClock()
+    slurm = FakeSlurm(slots=1, runtime=10.0, runtime_spread=0.0, clock=clock)
+    with Ledger(tmp_path / "ledger.sqlite") as ledger:
+        submissions = [
+            (tmp_path / name, slurm.submit(tmp_path / name, "submit.sbatch"))
+            for name in ["a", "b"]
+        ]
+        ledger.record_submissions(submissions)
+        tracker = JobTracker(ledger, slurm)
+        job_ids = {job_id for _, job_id in submissions}
+        assert set(tracker.outstanding()) == job_ids
+
+        clock.sleep(15.0)
+        changed = tracker.update()
+        assert changed == {
+            str(tmp_path / "a"): "COMPLETED",
+            str(tmp_path / "b"): "RUNNING",
+        }
+        assert list(tracker.outstanding()) == [submissions[1][1]]
+        assert tracker.update() == dict()
+
+
+def _sacct(tmp_path, lines, exitcode=0):
+    """A stand-in for sacct printing fixed lines."""
+
+    script = tmp_path / "sacct.py"
+    script.write_text(
+        f"import sys\nprint({json.dumps(chr(10).join(lines))})\n"
+        f"sys.exit({exitcode})\n"
+    )
+    return f"{sys.executable} {script}"
+
+
+def test_refresh_states(tmp_path):
+    messages = []
+    with Ledger(tmp_path / "ledger.sqlite") as ledger:
+        ledger.record_submissions(
+            [(tmp_path / "a", "1"), (tmp_path / "b", "2")]
+        )
+        failing = _sacct(tmp_path, [], exitcode=1)
+        states = refresh_states(ledger, failing, log=messages.append)
+        assert set(states.values()) == {SUBMITTED}
+        assert len(messages) == 1
+
+        sacct = _sacct(tmp_path, ["1|COMPLETED|0:0", "2|RUNNING|0:0"])
+        assert refresh_states(ledger, sacct) == {
+            str(tmp_path / "a"): "COMPLETED",
+            str(tmp_path / "b"): "RUNNING",
+        }
+        assert refresh_states(ledger, None)[str(tmp_path / "b")] == "RUNNING"
+
+
+def _campaign(tmp_path):
+    root = tmp_path / "campaign"
+    for name in ["done", "running"]:
+        (root / name).mkdir(parents=True)
+        for filename in ["INCAR", "POSCAR", "KPOINTS", "POTCAR"]:
+            (root / name / filename).touch()
+        (root / name / "OUTCAR").write_text("nothing\n")
+    ledger_path = tmp_path / "ledger.sqlite"
+    with Ledger(ledger_path) as ledger:
+        ledger.record_submissions(
+            [(root / "done", "1"), (root / "running", "2")]
+        )
+    sacct = _sacct(tmp_path, ["1|COMPLETED|0:0", "2|RUNNING|0:0"])
+    return root, ledger_path, sacct
+
+
+def test_check_refreshes_ledger(tmp_path):
+    root, ledger_path, sacct = _campaign(tmp_path)
+    report_path = tmp_path / "report.json"
+
+    # Without a refresh, both jobs are still recorded as submitted
+    arguments = [root, "INCAR", "OUTCAR", "timing", report_path]
+    check(*arguments, ledger_path=ledger_path, sacct=None)
+    assert not report_path.exists()
+
+    check(*arguments, ledger_path=ledger_path, sacct=sacct)
+    with open(report_path) as f:
+        assert json.load(f) == {
+            "failed_no_file": [],
+            "failed_no_line": [str(root / "done")],
+        }
+
+
+def test_report_refreshes_ledger(tmp_path):
+    root, ledger_path, sacct = _campaign(tmp_path)
+    report = generate_report(
+        root, "INCAR", ledger_path=ledger_path, sacct=sacct
+    )
+    assert report["VASP"]["fail"] == [str(root / "done")]
+    assert report["VASP"][RUNNING] == [str(root / "running")]
@@ -0,0 +1,195 @@
+import os
+import signal
+import subprocess
+
+from cmdr.fake_slurm import FakeSlurm, SimulatedClock
+from cmdr.ledger import Ledger
+from cmdr.wrangler import Wrangler, get_array_header, get_array_lines
+
+
+SCRIPT = """#!/bin/bash -l
+#SBATCH --nodes=1
+#SBATCH --output=job.out
+#SBATCH -e job.err
+#SBATCH --time=1:00:00
+#SBATCH --array=0-3
+echo "$SLURM_SUBMIT_DIR" > ran
+"""
+
+
+def _jobs(root, names, script=SCRIPT, target_file="submit.sbatch"):
+    directories = []
+    for name in names:
+        (root / name).mkdir(parents=True)
+        (root / name / target_file).write_text(script)
+        directories.append(str(root / name))
+    return directories
+
+
+def test_get_array_header(tmp_path):
+    [directory] = _jobs(tmp_path, ["a"])
+    assert get_array_header(os.path.join(directory, "submit.sbatch")) == [
+        "#!/bin/bash -l",
+        "#SBATCH --nodes=1",
+        "#SBATCH --time=1:00:00",
+    ]
+    (tmp_path / "b.sbatch").write_text("#SBATCH -N 1\nsrun x\n")
+    assert get_array_header(tmp_path / "b.sbatch") == [
+        "#!/bin/bash",
+        "#SBATCH -N 1",
+    ]
+
+
+def test_array_script_runs_the_manifest_entry(tmp_path):
+    target_file = "submit job.sbatch"
+    directories = _jobs(
+        tmp_path / "campaign $x",
+        ["a b", "c'd", "e"],
+        target_file=target_file,
+    )
+    manifest = tmp_path / "campaign $x" / "manifest's.txt"
+    manifest.write_text("".join(f"{dd}\n" for dd in directories))
+    lines = get_array_lines(["#!/bin/bash"], manifest, target_file)
+    driver = tmp_path / "array.sbatch"
+    driver.write_text("".join(f"{line}\n" for line in lines))
+
+    env = dict(os.environ, SLURM_ARRAY_JOB_ID="7", SLURM_ARRAY_TASK_ID="1")
+    subprocess.run(["bash", str(driver)], env=env, cwd=tmp_path, check=True)
+    assert os.listdir(directories[0]) == [target_file]
+    assert sorted(os.listdir(directories[1])) == [
+        "ran",
+        "slurm-7_1.out",
+        target_file,
+    ]
+    ran = os.path.join(directories[1], "ran")
+    assert open(ran).read() == f"{directories[1]}\n"
+    assert os.listdir(directories[2]) == [target_file]
+
+
+def test_submit_array_records_every_directory(tmp_path):
+    directories = _jobs(tmp_path / "campaign", ["a", "b", "c"])
+    clock = SimulatedClock()
+    slurm = FakeSlurm(slots=10, runtime=100.0, seed=0, clock=clock)
+    with Ledger(tmp_path / "ledger.sqlite") as ledger:
+        wrangler = Wrangler(
+            tmp_path / "campaign",
+            10,
+            slurm,
+            clock=clock,
+            sleep=clock.sleep,
+            verbose=False,
+            array=True,
+            array_throttle=2,
+            ledger=ledger,
+        )
+        job_id = wrangler.submit_array(directories)
+        assert {
+            entry["directory"]: entry["job_id"] for entry in ledger.entries()
+        } == {dd: f"{job_id}_{ii}" for ii, dd in enumerate(directories)}
+        assert wrangler.submitted == {
+            dd: f"{job_id}_{ii}" for ii, dd in enumerate(directories)
+        }
+
+    # Submitted as --array=0-2%2, so only two tasks run at once
+    tasks = [slurm.jobs[f"{job_id}_{ii}"] for ii in range(3)]
+    assert [task["throttle"] for task in tasks] == [2, 2, 2]
+    assert [task["state"] for task in tasks] == [
+        "RUNNING",
+        "RUNNING",
+        "PENDING",
+    ]
+    array_directory, script = tasks[0]["directory"][:-3], tasks[0]["script"]
+    with open(os.path.join(array_directory, script)) as f:
+        lines = f.read().splitlines()
+    assert lines[:3] == [
+        "#!/bin/bash -l",
+        "#SBATCH --nodes=1",
+        "#SBATCH --time=1:00:00",
+    ]
+    assert lines[3] == f"#SBATCH --output={array_directory}/%A_%a.out"
+    with open(os.path.join(array_directory, "manifest.txt")) as f:
+        assert f.read().splitlines() == directories
+
+
+def _wrangler(root, n_jobs, maxjobs, slurm, clock, **kwargs):
+    _jobs(root, [f"job_{ii:02d}" for ii in range(n_jobs)])
+    return Wrangler(
+        root,
+        maxjobs,
+        slurm,
+        min_interval=10.0,
+        max_interval=300.0,
+        clock=clock,
+        sleep=clock.sleep,
+        verbose=False,
+        **kwargs,
+    )
+
+
+def test_interval_grows_while_full_and_shrinks_after_submissions(tmp_path):
+    clock = SimulatedClock()
+    slurm = FakeSlurm(
+        slots=100, runtime=1000.0, runtime_spread=0.0, clock=clock
+    )
+    wrangler = _wrangler(tmp_path, 8, 4, slurm, clock)
+    wrangler.discover()
+
+    intervals = []
+    submitted = []
+    while clock() < 1200.0:
+        submitted.append(wrangler.cycle())
+        intervals.append(wrangler.interval)
+        clock.sleep(wrangler.interval)
+
+    # The first cycle fills the queue, which then stays full until the jobs
+    # end at t = 1000, so the interval backs off up to max_interval
+    assert submitted[0] == 4
+    full = intervals[: submitted.index(4, 1)]
+    assert full == sorted(full) and full[-1] == 300.0
+    assert full[:3] == [10.0, 15.0, 22.5]
+
+    # Jobs left the queue and were replaced, so the interval was halved
+    ii = submitted.index(4, 1)
+    assert intervals[ii] == 150.0
+    assert sum(submitted) == 8
+
+
+def test_stop_ends_run(tmp_path):
+    clock = SimulatedClock()
+    slurm = FakeSlurm(slots=100, runtime=1000.0, clock=clock)
+    wrangler = _wrangler(tmp_path, 8, 2, slurm, clock)
+    cycles = []
+
+    def sleep(seconds):
+        cycles.append(seconds)
+        clock.sleep(seconds)
+        if len(cycles) == 3:
+            wrangler.stop()
+
+    wrangler._sleep = sleep
+    assert wrangler.run() == 2
+    assert len(cycles) == 3
+    assert len(wrangler.pending) == 6
+
+
+def test_sigterm_ends_run(tmp_path):
+    clock = SimulatedClock()
+    slurm = FakeSlurm(slots=100, runtime=1000.0, clock=clock)
+    wrangler = _wrangler(tmp_path, 8, 2, slurm, clock)
+
+    def sleep(seconds):
+        clock.sleep(seconds)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    wrangler._sleep = sleep
+    handlers = {
+        signum: signal.getsignal(signum)
+        for signum in (signal.SIGTERM, signal.SIGINT)
+    }
+    try:
+        assert wrangler.run() == 2
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    assert wrangler._stop.is_set()
+    assert len(wrangler.pending) == 6